@@ -1,715 +1,1230 @@
-import streamlit as st
-from database import create_tables
-import sqlite3
-import pandas as pd
-from datetime import datetime
-
-# ------------------ LOGIN SECTION ------------------ #
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.role = None
-    st.session_state.user = None
-
-# ------------------ LOGOUT FUNCTION ------------------ #
-def logout():
-    st.session_state.logged_in = False
-    st.session_state.role = None
-    st.session_state.user = None
-    st.success("Logged out successfully.")
-
-# ------------------ SHOW LOGGED IN DASHBOARD ------------------ #
-if st.session_state.logged_in:
-    # Top right logout button using form and query param
-    st.markdown(
-        f"<div style='text-align:right'>"
-        f"<form><button type='submit' name='logout' style='background-color:#f44336;color:white;border:none;padding:5px 10px;border-radius:5px;'>Logout ({st.session_state.role})</button></form>"
-        f"</div><br>",
-        unsafe_allow_html=True
-    )
-
-    # If logout button clicked
-    if st.query_params.get("logout") is not None:
-        logout()
-        st.experimental_rerun()
-
-else:
-    st.title("Login to Hospital Management System")
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.subheader("Admin Login")
-        admin_user = st.text_input("Admin Username", key="admin_user")
-        admin_pass = st.text_input("Admin Password", type="password", key="admin_pass")
-        if st.button("Login as Admin"):
-            if admin_user == "admin" and admin_pass == "admin123":
-                st.session_state.logged_in = True
-                st.session_state.role = "admin"
-                st.session_state.user = admin_user
-                st.rerun()
-            else:
-                st.error("Invalid admin credentials")
-
-    with col2:
-        st.subheader("Staff Login")
-        staff_user = st.text_input("Staff Username", key="staff_user")
-        staff_pass = st.text_input("Staff Password", type="password", key="staff_pass")
-        if st.button("Login as Staff"):
-            if staff_user == "staff" and staff_pass == "staff123":
-                st.session_state.logged_in = True
-                st.session_state.role = "staff"
-                st.session_state.user = staff_user
-                st.rerun()
-            else:
-                st.error("Invalid staff credentials")
-
-    st.stop()
-
- # Stop page here if not logged in
-# Set page config
-st.set_page_config(page_title="Hospital Management", layout="wide")
-
-# Custom CSS for modern look with black fonts
-st.markdown("""
-    <style>
-        body, h1, h2, h3, h4, h5, h6, p, label, div, span, input, select, textarea {
-            color: black !important;
-        }
-        .block-container {
-            padding: 1.5rem 2rem;
-        }
-        .stSidebar {
-            background-color: #f0f2f6;
-        }
-        .stButton>button {
-            background-color: #e3e3e3;
-            border-radius: 8px;
-        }
-        .stDataFrameContainer {
-            border: 1px solid #ccc;
-            border-radius: 10px;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# Sidebar navigation with modern layout
-menu = {
-    "Dashboard": "",
-    "Patient Checkups": "",
-    "Patient Tests": "",
-    "Patient Management": "",
-    "Bed Management": "",
-    "Inventory": "",
-    "AI Assistant": ""
-}
-
-st.sidebar.title(" HMS Navigation")
-for page in menu:
-    if st.sidebar.button(page):
-        st.session_state.page = page
-
-if "page" not in st.session_state:
-    st.session_state.page = "Dashboard"
-
-choice = st.session_state.page
-if choice == "Dashboard":
-    st.subheader(" Dashboard Analytics")
-
-    selected_date = st.date_input("Select Date", value=datetime.today())
-
-    conn = sqlite3.connect("data/hospital.db")
-    cursor = conn.cursor()
-
-    # Ensure required tables exist
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Admissions (
-            admission_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_name TEXT,
-            admit_date TEXT,
-            discharge_date TEXT,
-            bed_number INTEGER,
-            notes TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS PatientInflow (
-            inflow_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            age INTEGER,
-            gender TEXT,
-            visit_date TEXT,
-            department TEXT,
-            notes TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS PatientTests (
-            test_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            test_type TEXT NOT NULL,
-            test_date TEXT,
-            result TEXT,
-            FOREIGN KEY (patient_id) REFERENCES Patients(id)
-        )
-    """)
-    conn.commit()
-
-    formatted_date = selected_date.strftime("%Y-%m-%d")
-
-    # Count total admissions
-    cursor.execute("SELECT COUNT(*) FROM Admissions WHERE admit_date = ?", (formatted_date,))
-    admission_count = cursor.fetchone()[0]
-
-    # Count total patient visits
-    cursor.execute("SELECT COUNT(*) FROM PatientInflow WHERE visit_date = ?", (formatted_date,))
-    patient_count = cursor.fetchone()[0]
-
-    # Count total tests
-    cursor.execute("SELECT COUNT(*) FROM PatientTests WHERE test_date = ?", (formatted_date,))
-    test_count = cursor.fetchone()[0]
-
-    st.markdown("###  Statistics for " + selected_date.strftime("%B %d, %Y"))
-    st.write(f" **Total Admissions:** {admission_count}")
-    st.write(f" **Total Patient Visits:** {patient_count}")
-    st.write(f" **Total Tests Conducted:** {test_count}")
-
-    # --- Hardcoded test types (complete list) ---
-    test_types = [
-        "Blood Test", "X-Ray", "Thyroid Test", "Urine Test",
-        "Diabetes Test", "CT Scan", "MRI", "B12 Test"
-    ]
-
-    selected_test = st.selectbox("🔬 Select a Test Type to View Count", sorted(test_types))
-
-    # Fetch test count even if that test was not used yet
-    cursor.execute("""
-        SELECT COUNT(*) FROM PatientTests 
-        WHERE test_type = ? AND test_date = ?
-    """, (selected_test, formatted_date))
-    test_type_count = cursor.fetchone()[0]
-
-    st.success(f" **{test_type_count} '{selected_test}' tests done** on {selected_date.strftime('%B %d, %Y')}")
-
-    conn.close()
-
-
-elif choice == "Patient Checkups":
-    st.subheader(" Patient Visit Records")
-
-    conn = sqlite3.connect("data/hospital.db")
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS PatientInflow (
-            inflow_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            age INTEGER,
-            gender TEXT,
-            visit_date TEXT,
-            department TEXT,
-            notes TEXT
-        )
-    """)
-    conn.commit()
-
-    with st.form("outpatient_form"):
-        name = st.text_input("Patient Name")
-        age = st.number_input("Age", min_value=0, key="inflow_age")
-        gender = st.selectbox("Gender", ["Male", "Female", "Other"], key="inflow_gender")
-        visit_date = st.date_input("Visit Date", value=datetime.today(), key="inflow_date")
-        department = st.text_input("Department Visited", key="inflow_department")
-        notes = st.text_area("Doctor's Notes / Complaints", key="inflow_notes")
-        submit_visit = st.form_submit_button("Add Visit Record")
-
-        if submit_visit:
-            cursor.execute("""
-                INSERT INTO PatientInflow (name, age, gender, visit_date, department, notes)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (name, age, gender, visit_date.strftime("%Y-%m-%d"), department, notes))
-            conn.commit()
-            st.success(" Visit record added successfully!")
-            st.rerun()
-
-    st.markdown("---")
-
-    #  Side-by-side layout
-    left_col, right_col = st.columns(2)
-
-    with left_col:
-        st.subheader(" All Patient Records")
-        cursor.execute("SELECT * FROM PatientInflow ORDER BY visit_date DESC")
-        visits = cursor.fetchall()
-        if visits:
-            df_visits = pd.DataFrame(visits, columns=["ID", "Name", "Age", "Gender", "Visit Date", "Department", "Notes"])
-            st.dataframe(df_visits, use_container_width=True)
-        else:
-            st.info("No visit records yet.")
-
-    with right_col:
-        st.subheader(" Edit /  Delete Visit Record")
-        if visits:
-            visit_options = {f"{row[1]} - {row[4]}": row[0] for row in visits}
-            selected_visit = st.selectbox("Select visit to update/delete", list(visit_options.keys()), key="edit_visit")
-            visit_id = visit_options[selected_visit]
-
-            selected_data = next(row for row in visits if row[0] == visit_id)
-
-            new_name = st.text_input("Patient Name", value=selected_data[1], key="edit_visit_name")
-            new_age = st.number_input("Age", value=selected_data[2], min_value=0, key="edit_visit_age")
-            new_gender = st.selectbox("Gender", ["Male", "Female", "Other"], index=["Male", "Female", "Other"].index(selected_data[3]), key="edit_visit_gender")
-            new_date = st.date_input("Visit Date", value=pd.to_datetime(selected_data[4]), key="edit_visit_date")
-            new_dept = st.text_input("Department", value=selected_data[5], key="edit_visit_dept")
-            new_notes = st.text_area("Notes", value=selected_data[6], key="edit_visit_notes")
-
-            update_col, delete_col = st.columns(2)
-            with update_col:
-                if st.button("Update Visit", key="update_visit_btn"):
-                    cursor.execute("""
-                        UPDATE PatientInflow
-                        SET name = ?, age = ?, gender = ?, visit_date = ?, department = ?, notes = ?
-                        WHERE inflow_id = ?
-                    """, (new_name, new_age, new_gender, new_date.strftime("%Y-%m-%d"), new_dept, new_notes, visit_id))
-                    conn.commit()
-                    st.success(" Visit updated successfully!")
-                    st.rerun()
-
-            with delete_col:
-                if st.button("Delete Visit", key="delete_visit_btn"):
-                    cursor.execute("DELETE FROM PatientInflow WHERE inflow_id = ?", (visit_id,))
-                    conn.commit()
-                    st.warning(" Visit record deleted.")
-                    st.rerun()
-        else:
-            st.info("No records to edit/delete.")
-elif choice == "Patient Tests":
-    st.subheader(" Patient Diagnostic Tests")
-
-    conn = sqlite3.connect("data/hospital.db")
-    cursor = conn.cursor()
-
-    # Create PatientTests table with foreign key to Patients
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS PatientTests (
-            test_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            test_type TEXT NOT NULL,
-            test_date TEXT,
-            result TEXT,
-            FOREIGN KEY (patient_id) REFERENCES Patients(id)
-        )
-    """)
-    conn.commit()
-
-    #  Fix: Add patient_id column if missing (older databases)
-    cursor.execute("PRAGMA table_info(PatientTests)")
-    columns = [col[1] for col in cursor.fetchall()]
-    if 'patient_id' not in columns:
-        cursor.execute("ALTER TABLE PatientTests ADD COLUMN patient_id INTEGER")
-        conn.commit()
-
-    # Get list of patients for dropdown
-    cursor.execute("SELECT id, name FROM Patients")
-    patients = cursor.fetchall()
-    patient_options = {f"{name} (ID: {pid})": pid for pid, name in patients}
-
-    st.markdown("###  Add New Test Record")
-    with st.form("add_test_form"):
-        selected_patient = st.selectbox("Select Patient", list(patient_options.keys()), key="test_patient_add")
-        patient_id = patient_options[selected_patient]
-
-        test_types = ["Blood Test", "X-Ray", "Thyroid Test", "Urine Test",
-                      "Diabetes Test", "CT Scan", "MRI", "B12 Test"]
-        test_type = st.selectbox("Test Type", test_types, key="test_type_add")
-        test_date = st.date_input("Test Date", key="test_date_add")
-        result = st.text_area("Test Result / Notes", key="test_result_add")
-
-        submit = st.form_submit_button("Add Test")
-        if submit:
-            cursor.execute("""
-                INSERT INTO PatientTests (patient_id, test_type, test_date, result)
-                VALUES (?, ?, ?, ?)
-            """, (patient_id, test_type, test_date.strftime("%Y-%m-%d"), result))
-            conn.commit()
-            st.success(" Test record added successfully!")
-            st.rerun()
-
-    st.markdown("###  Edit /  Delete Test Record")
-
-    # Join query to display patient name in test records
-    cursor.execute("""
-        SELECT t.test_id, p.name, t.test_type, t.test_date, t.result, t.patient_id
-        FROM PatientTests t
-        JOIN Patients p ON t.patient_id = p.id
-        ORDER BY t.test_id ASC
-    """)
-    tests = cursor.fetchall()
-
-    if tests:
-        test_options = {f"{row[1]} - {row[2]} on {row[3]}": row[0] for row in tests}
-        selected_label = st.selectbox("Select record to edit/delete", list(test_options.keys()), key="select_test_edit")
-        selected_id = test_options[selected_label]
-
-        selected_data = next(row for row in tests if row[0] == selected_id)
-
-        # Reuse patient dropdown
-        edit_patient_name = st.selectbox(
-            "Patient", list(patient_options.keys()),
-            index=list(patient_options.values()).index(selected_data[5]),
-            key="test_patient_edit"
-        )
-        new_patient_id = patient_options[edit_patient_name]
-
-        selected_index = test_types.index(selected_data[2]) if selected_data[2] in test_types else 0
-        new_type = st.selectbox("Test Type", test_types, index=selected_index, key="test_type_edit")
-        new_date = st.date_input("Test Date", value=pd.to_datetime(selected_data[3]), key="test_date_edit")
-        new_result = st.text_area("Result", value=selected_data[4], key="test_result_edit")
-
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Update Record", key="update_test_btn"):
-                cursor.execute("""
-                    UPDATE PatientTests
-                    SET patient_id = ?, test_type = ?, test_date = ?, result = ?
-                    WHERE test_id = ?
-                """, (new_patient_id, new_type, new_date.strftime("%Y-%m-%d"), new_result, selected_id))
-                conn.commit()
-                st.success(" Test record updated!")
-                st.rerun()
-
-        with col2:
-            if st.button("Delete Record", key="delete_test_btn"):
-                cursor.execute("DELETE FROM PatientTests WHERE test_id = ?", (selected_id,))
-                conn.commit()
-                st.warning(" Test record deleted.")
-                st.rerun()
-
-    st.markdown("---")
-    st.subheader(" All Test Records")
-
-    if tests:
-        df_tests = pd.DataFrame(tests, columns=["Test ID", "Patient Name", "Test Type", "Date", "Result", "Patient ID"])
-        df_tests.drop(columns=["Patient ID"], inplace=True)
-        st.dataframe(df_tests, use_container_width=True)
-    else:
-        st.info("No test records available.")
-
-    conn.close()
-
-
-
-
-# Patient Management Page
-elif choice == "Patient Management":
-    st.subheader(" Patient Management")
-
-    col1, col2 = st.columns(2)
-
-    #  Left Column: Add New Patient
-    with col1:
-        st.markdown("###  Add New Patient")
-        with st.form("patient_form"):
-            name = st.text_input("Patient Name")
-            age = st.number_input("Age", min_value=0)
-            gender = st.selectbox("Gender", ["Male", "Female", "Other"])
-            admission_date = st.date_input("Admission Date")
-            department = st.text_input("Department")
-
-            submitted = st.form_submit_button("Admit Patient")
-            if submitted:
-                conn = sqlite3.connect("data/hospital.db")
-                cursor = conn.cursor()
-
-                #  Find the first vacant bed
-                cursor.execute("SELECT bed_id FROM Beds WHERE status = 'Vacant' LIMIT 1")
-                bed_result = cursor.fetchone()
-
-                if bed_result:
-                    bed_id = bed_result[0]
-                    status = "Admitted"
-
-                    #  Insert patient record with assigned bed
-                    cursor.execute(
-                        "INSERT INTO Patients (name, age, gender, admission_date, status, department, bed_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (name, age, gender, admission_date.strftime("%Y-%m-%d"), status, department, bed_id)
-                    )
-
-                    #  Mark that bed as occupied
-                    cursor.execute("UPDATE Beds SET status = 'Occupied' WHERE bed_id = ?", (bed_id,))
-                    conn.commit()
-                    conn.close()
-
-                    st.success(f" {name} admitted and assigned to Bed {bed_id}!")
-                    st.rerun()
-                else:
-                    conn.close()
-                    st.error(" No vacant beds available!")
-
-    #  Right Column: Show Admitted Patients Table
-    with col2:
-        st.markdown("###  Current Admitted Patients")
-        conn = sqlite3.connect("data/hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, age, gender, admission_date, department FROM Patients WHERE status = 'Admitted'")
-        data = cursor.fetchall()
-        conn.close()
-
-        if data:
-            df = pd.DataFrame(data, columns=["ID", "Name", "Age", "Gender", "Admission Date", "Department"])
-            df.index = df.index + 1
-            df.insert(0, "S.No", df.index)
-            st.dataframe(df, use_container_width=True, hide_index=True)
-        else:
-            st.info("No patients admitted yet.")
-
-    with st.expander(" Discharge Patient"):
-        selected_id = st.number_input("Enter Patient ID to discharge", min_value=1, step=1, value=1)
-        if st.button("Discharge"):
-            conn = sqlite3.connect("data/hospital.db")
-            cursor = conn.cursor()
-            cursor.execute("UPDATE Patients SET status = 'Discharged', discharge_date = date('now') WHERE id = ?", (selected_id,))
-            conn.commit()
-            conn.close()
-            st.success(f"  Patient ID {selected_id} discharged successfully!")
-            st.rerun()
-
-# Bed Management Page
-elif choice == "Bed Management":
-    st.subheader(" Bed Management")
-
-    conn = sqlite3.connect("data/hospital.db")
-    df = pd.read_sql_query("SELECT * FROM Beds", conn)
-    conn.close()
-
-    # Create two columns
-    left_col, right_col = st.columns(2)
-
-    #  Left Column: View & Filter
-    with left_col:
-        st.markdown("###  View & Filter Beds")
-        vacant_count = df[df["status"] == "Vacant"].shape[0]
-        st.info(f"Vacant Beds: {vacant_count}")
-
-        filter_status = st.selectbox("Filter by Status", ["All", "Vacant", "Occupied"])
-        filter_ward = st.text_input("Filter by Ward")
-
-        filtered_df = df.copy()
-        if filter_status != "All":
-            filtered_df = filtered_df[filtered_df["status"] == filter_status]
-        if filter_ward:
-            filtered_df = filtered_df[filtered_df["ward"].str.lower() == filter_ward.lower()]
-
-        st.dataframe(filtered_df, use_container_width=True)
-
-    #  Right Column: Edit/Add
-    with right_col:
-        st.markdown("###  Edit /  Add Bed Info")
-
-        conn = sqlite3.connect("data/hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Beds")
-        beds = cursor.fetchall()
-        conn.close()
-
-        if beds:
-            bed_dict = {f"Bed {bed[0]} (Ward: {bed[1]}, Room: {bed[2]})": bed[0] for bed in beds}
-            selected_label = st.selectbox("Select Bed to Edit", list(bed_dict.keys()))
-            selected_bed_id = bed_dict[selected_label]
-
-            selected_bed = next(bed for bed in beds if bed[0] == selected_bed_id)
-            new_ward = st.text_input("Ward", selected_bed[1], key="edit_ward")
-            new_room = st.text_input("Room", selected_bed[2], key="edit_room")
-            new_status = st.selectbox("Status", ["Vacant", "Occupied"], index=0 if selected_bed[3] == "Vacant" else 1, key="edit_status")
-
-            if st.button("Update Bed Info"):
-                conn = sqlite3.connect("data/hospital.db")
-                cursor = conn.cursor()
-                cursor.execute("UPDATE Beds SET ward = ?, room = ?, status = ? WHERE bed_id = ?",
-                               (new_ward, new_room, new_status, selected_bed_id))
-                conn.commit()
-                conn.close()
-                st.success(f" Bed {selected_bed_id} updated successfully!")
-                st.rerun()
-        else:
-            st.info("No beds found.")
-
-        st.markdown("---")
-        st.subheader(" Add New Bed")
-        with st.form("add_bed_form"):
-            new_bed_id = st.number_input("Bed ID", min_value=1, step=1, key="add_id")
-            new_ward = st.text_input("Ward", key="add_ward")
-            new_room = st.text_input("Room", key="add_room")
-            new_status = st.selectbox("Status", ["Vacant", "Occupied"], key="add_status")
-            add_bed = st.form_submit_button("Add Bed")
-
-            if add_bed:
-                conn = sqlite3.connect("data/hospital.db")
-                cursor = conn.cursor()
-                try:
-                    cursor.execute("INSERT INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)",
-                                   (new_bed_id, new_ward, new_room, new_status))
-                    conn.commit()
-                    st.success(f" Bed {new_bed_id} added successfully!")
-                    st.rerun()
-                except sqlite3.IntegrityError:
-                    st.error(" Bed ID already exists!")
-                conn.close()
-elif choice == "Inventory":
-    st.subheader(" Inventory Management")
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.markdown("####  Search & Items")
-
-        conn = sqlite3.connect("data/hospital.db")
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Inventory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                item_name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                unit TEXT NOT NULL
-            )
-        """)
-        conn.commit()
-
-        search = st.text_input("Search Item by Name")
-        if search:
-            cursor.execute("SELECT * FROM Inventory WHERE item_name LIKE ?", ('%' + search + '%',))
-        else:
-            cursor.execute("SELECT * FROM Inventory")
-        inventory_data = cursor.fetchall()
-
-        if inventory_data:
-            df_inv = pd.DataFrame(inventory_data, columns=["ID", "Item", "Qty", "Unit"])
-            st.dataframe(df_inv, use_container_width=True)
-        else:
-            st.info("No inventory items found.")
-
-    with col2:
-        st.markdown("####  Add or Edit Item")
-
-        st.subheader("Add New Item")
-        with st.form("add_item_form"):
-            name = st.text_input("Item Name", key="add_name")
-            qty = st.number_input("Quantity", min_value=0, step=1, key="add_qty")
-            unit = st.text_input("Unit (e.g. mg, tablets, boxes)", key="add_unit")
-            add_btn = st.form_submit_button("Add Item")
-
-            if add_btn:
-                if name and unit:
-                    cursor.execute("INSERT INTO Inventory (item_name, quantity, unit) VALUES (?, ?, ?)", (name, qty, unit))
-                    conn.commit()
-                    st.success(f" {name} added successfully!")
-                    st.rerun()
-                else:
-                    st.error(" Please fill all fields.")
-
-        st.divider()
-        st.subheader(" Edit or  Delete Item")
-
-        if inventory_data:
-            item_dict = {f"{item[1]} ({item[2]} {item[3]})": item[0] for item in inventory_data}
-            selected = st.selectbox("Select item", list(item_dict.keys()), key="edit_select")
-            selected_id = item_dict[selected]
-
-            selected_data = next(item for item in inventory_data if item[0] == selected_id)
-            new_name = st.text_input("Item Name", selected_data[1], key="edit_name")
-            new_qty = st.number_input("Quantity", value=selected_data[2], key="edit_qty")
-            new_unit = st.text_input("Unit", selected_data[3], key="edit_unit")
-
-            colu1, colu2 = st.columns(2)
-            with colu1:
-                if st.button("Update Item", key="update_btn"):
-                    cursor.execute("UPDATE Inventory SET item_name = ?, quantity = ?, unit = ? WHERE item_id = ?",
-                                   (new_name, new_qty, new_unit, selected_id))
-                    conn.commit()
-                    st.success(" Item updated!")
-                    st.rerun()
-            with colu2:
-                if st.button("Delete Item", key="delete_btn"):
-                    cursor.execute("DELETE FROM Inventory WHERE item_id = ?", (selected_id,))
-                    conn.commit()
-                    st.warning(" Item deleted.")
-                    st.rerun()
-
-        conn.close()
-elif choice == "AI Assistant":
-    st.subheader("AI Assistant")
-
-    tab1, tab2, tab3 = st.tabs(["Dosage Advisor", "Recommend Medicines", "Summarize Notes"])
-
-    # ---- TAB 1: Dosage Advisor ----
-    with tab1:
-        st.markdown("###  Medicine Dosage Advisor")
-        st.markdown("Enter the medicine and patient's age to get a recommended dosage.")
-
-        medicine_name = st.text_input("Enter medicine name", placeholder="e.g., Paracetamol")
-        age = st.number_input("Enter patient's age (in years)", min_value=0, max_value=120, step=1)
-
-        if st.button("Suggest Dosage"):
-            if medicine_name:
-                if age < 1:
-                    st.info(f"**{medicine_name} for Infant**: Consult pediatrician. Liquid form only. Usually measured in drops or ml.")
-                elif 1 <= age <= 5:
-                    st.info(f"**{medicine_name} for Toddler**: 1/4 of adult dose or syrup-based.")
-                elif 6 <= age <= 12:
-                    st.info(f"**{medicine_name} for Child**: 1/2 of adult dose. Avoid strong antibiotics unless prescribed.")
-                elif 13 <= age <= 18:
-                    st.info(f"**{medicine_name} for Teenager**: 3/4 or full adult dose depending on weight.")
-                elif 19 <= age <= 60:
-                    st.info(f"**{medicine_name} for Adult**: Full dose (usually 1 tablet every 6–8 hours).")
-                else:
-                    st.info(f"**{medicine_name} for Elderly**: Start with 1/2 dose. Monitor kidney/liver health.")
-            else:
-                st.warning("Please enter a medicine name.")
-
-
-    # ---- TAB 2: Recommend Medicines ----
-    with tab2:
-        st.markdown("### Symptom-based Medicine Recommender")
-        symptoms = st.text_area("Enter patient symptoms (comma-separated)", placeholder="fever, headache, sore throat")
-
-        if st.button("Recommend Medicines"):
-            if symptoms:
-                symptom_list = [s.strip().lower() for s in symptoms.split(",")]
-                recommendations = []
-
-                if "fever" in symptom_list:
-                    recommendations.append("Paracetamol")
-                if "headache" in symptom_list:
-                    recommendations.append("Ibuprofen")
-                if "cold" in symptom_list or "sore throat" in symptom_list:
-                    recommendations.append("Cough Syrup")
-                if "stomach pain" in symptom_list:
-                    recommendations.append("Antacid")
-                if "vomiting" in symptom_list:
-                    recommendations.append("Ondansetron")
-
-                if recommendations:
-                    st.success("**Recommended Medicines:**")
-                    st.write(", ".join(set(recommendations)))
-                else:
-                    st.info("No specific recommendations found. Refer to a doctor.")
-            else:
-                st.warning("Please enter some symptoms.")
-
-    # ---- TAB 3: Summarize Notes ----
-    with tab3:
-        st.markdown("### Doctor Notes Summarizer")
-        st.markdown("This tool summarizes long notes into short, meaningful summaries using basic AI logic.")
-
-        note_input = st.text_area("Paste Doctor's Notes")
-
-        if st.button("Summarize"):
-            if note_input:
-                keywords = ["twice", "daily", "week", "quantity", "overdose", "tablet", "syrup"]
-                summary = ". ".join([sent for sent in note_input.split(".") if any(word in sent.lower() for word in keywords)])
-                if summary:
-                    st.success("**Summary:**")
-                    st.write(summary.strip())
-                else:
-                    st.info("No key instructions found. Please check the note.")
-            else:
-                st.warning("Please enter some notes.")
+import streamlit as st
+from cache import query, query_cache, query_one, query_value
+from database import FACILITIES, execute, init_facilities, write
+from pagination import PAGE_SIZE, PAGE_SIZES, fetch_page
+import archive
+import beds
+import codes
+import database
+import dosage
+import export
+import fulltext
+import identity
+import importer
+import live
+import metrics
+import network
+import occupancy
+import recommender
+import stats
+import stock
+import summarizer
+import writer
+import functools
+import sqlite3
+import pandas as pd
+from datetime import datetime
+
+# True while the whole script runs; a panel rerun on its own finds it False
+full_run = True
+
+# Apply schema migrations to every facility shard once per process
+init_facilities()
+# This run works on the session's facility; the selector is in the sidebar
+database.use_facility(st.session_state.get("facility"))
+# All sessions' writes go through one group-commit writer thread
+writer.start()
+# One change watcher per process feeds every session's live panels
+live.start()
+
+# ------------------ LOGIN SECTION ------------------ #
+if "logged_in" not in st.session_state:
+    st.session_state.logged_in = False
+    st.session_state.role = None
+    st.session_state.user = None
+
+# ------------------ LOGOUT FUNCTION ------------------ #
+def logout():
+    st.session_state.logged_in = False
+    st.session_state.role = None
+    st.session_state.user = None
+    st.success("Logged out successfully.")
+
+# ------------------ SHOW LOGGED IN DASHBOARD ------------------ #
+if st.session_state.logged_in:
+    # Top right logout button using form and query param
+    st.markdown(
+        f"<div style='text-align:right'>"
+        f"<form><button type='submit' name='logout' style='background-color:#f44336;color:white;border:none;padding:5px 10px;border-radius:5px;'>Logout ({st.session_state.role})</button></form>"
+        f"</div><br>",
+        unsafe_allow_html=True
+    )
+
+    # If logout button clicked
+    if st.query_params.get("logout") is not None:
+        logout()
+        st.experimental_rerun()
+
+else:
+    st.title("Login to Hospital Management System")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("Admin Login")
+        admin_user = st.text_input("Admin Username", key="admin_user")
+        admin_pass = st.text_input("Admin Password", type="password", key="admin_pass")
+        if st.button("Login as Admin"):
+            if admin_user == "admin" and admin_pass == "admin123":
+                st.session_state.logged_in = True
+                st.session_state.role = "admin"
+                st.session_state.user = admin_user
+                st.rerun()
+            else:
+                st.error("Invalid admin credentials")
+
+    with col2:
+        st.subheader("Staff Login")
+        staff_user = st.text_input("Staff Username", key="staff_user")
+        staff_pass = st.text_input("Staff Password", type="password", key="staff_pass")
+        if st.button("Login as Staff"):
+            if staff_user == "staff" and staff_pass == "staff123":
+                st.session_state.logged_in = True
+                st.session_state.role = "staff"
+                st.session_state.user = staff_user
+                st.rerun()
+            else:
+                st.error("Invalid staff credentials")
+
+    st.stop()
+
+ # Stop page here if not logged in
+# Set page config
+st.set_page_config(page_title="Hospital Management", layout="wide")
+
+# Custom CSS for modern look with black fonts
+st.markdown("""
+    <style>
+        body, h1, h2, h3, h4, h5, h6, p, label, div, span, input, select, textarea {
+            color: black !important;
+        }
+        .block-container {
+            padding: 1.5rem 2rem;
+        }
+        .stSidebar {
+            background-color: #f0f2f6;
+        }
+        .stButton>button {
+            background-color: #e3e3e3;
+            border-radius: 8px;
+        }
+        .stDataFrameContainer {
+            border: 1px solid #ccc;
+            border-radius: 10px;
+        }
+    </style>
+""", unsafe_allow_html=True)
+
+# ------------------ PANELS ------------------ #
+def panel(fn=None, *, run_every=None):
+    # A Streamlit fragment: using a widget inside reruns only this panel, not the
+    # login check, CSS and every other panel's queries. A panel rerun on its own is
+    # not a page load: its queries are attributed to "<page> / <panel>" but no render
+    # time is recorded. run_every: seconds between timed reruns.
+    if fn is None:
+        return functools.partial(panel, run_every=run_every)
+
+    @st.fragment(run_every=run_every)
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        if full_run or metrics.current_page() is not None:
+            return fn(*args, **kwargs)
+        # The top of the script did not run, so bind the session's shard here
+        database.use_facility(st.session_state.get("facility"))
+        metrics.tag_page(f"{choice} / {fn.__name__}")
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            metrics.tag_page(None)
+            metrics.export_if_due(query_cache.stats())
+    return run
+
+
+# ------------------ PAGINATION HELPERS ------------------ #
+def load_page(name, key, filters=None):
+    # The keyset cursor lives in session state; changing a filter restarts at page one
+    state = st.session_state.get(f"{key}_cursor")
+    if state is None or state["filters"] != filters:
+        state = {"filters": filters, "cursor": None, "backward": False}
+        st.session_state[f"{key}_cursor"] = state
+    page_size = st.session_state.get(f"{key}_size", PAGE_SIZE)
+    page = fetch_page(name, state["cursor"], state["backward"], filters, page_size)
+    if not page.rows and state["cursor"] is not None:
+        state.update(cursor=None, backward=False)
+        page = fetch_page(name, None, False, filters, page_size)
+    return page
+
+
+def page_controls(page, key):
+    # Buttons move the cursor in a callback, before their panel reruns, so the
+    # rerun stays scoped to the panel
+    state = st.session_state[f"{key}_cursor"]
+    prev_col, size_col, next_col = st.columns(3)
+    with prev_col:
+        st.button("◀ Previous", key=f"{key}_prev", disabled=not page.has_prev,
+                  on_click=state.update, kwargs={"cursor": page.first_key, "backward": True})
+    with size_col:
+        st.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(PAGE_SIZE), key=f"{key}_size", label_visibility="collapsed")
+    with next_col:
+        st.button("Next ▶", key=f"{key}_next", disabled=not page.has_next,
+                  on_click=state.update, kwargs={"cursor": page.last_key, "backward": False})
+
+
+def live_view(key, load, affected, tables):
+    # A live.LiveView held in session state; see live.py
+    view = st.session_state.get(f"{key}_live")
+    if view is None:
+        view = st.session_state[f"{key}_live"] = live.LiveView(load, affected, tables)
+    return view
+
+
+def export_panel(kind):
+    # Streams the filtered table to a file only when Download is clicked
+    spec = export.EXPORTS[kind]
+    with st.expander(" Export"):
+        start = end = None
+        if "date" in spec:
+            start_col, end_col = st.columns(2)
+            start = start_col.date_input("From", value=None, key=f"{kind}_export_start")
+            end = end_col.date_input("To", value=None, key=f"{kind}_export_end")
+        filters = {
+            name: st.text_input(f"Filter by {name.replace('_', ' ')}", key=f"{kind}_export_{name}") or None
+            for name in spec.get("filters", {})
+        }
+        fmt = st.radio("Format", export.formats(), horizontal=True, key=f"{kind}_export_format")
+        # The file is built when the button is clicked, possibly on another thread
+        shard = database.database_path()
+
+        def build():
+            with database.at(shard):
+                return export.export_to_tempfile(kind, fmt, start, end, filters)
+
+        st.download_button(
+            "Download", data=build,
+            file_name=export.file_name(kind, fmt, start, end), mime=export.MIME_TYPES[fmt],
+            key=f"{kind}_export_download"
+        )
+
+
+def low_stock_banner():
+    # Cached read over the low-stock partial index; cleared by any Inventory write
+    low = stock.low_stock()
+    if low:
+        shown = ", ".join(f"{row[1]} ({row[2]} {row[4]})" for row in low[:5])
+        if len(low) > 5:
+            shown += f" and {len(low) - 5}{'+' if len(low) == stock.LOW_STOCK_LIMIT else ''} more"
+        st.warning(f" At or below reorder level: {shown}")
+
+
+# Sidebar navigation with modern layout
+menu = {
+    "Dashboard": "",
+    "Patient Checkups": "",
+    "Patient Tests": "",
+    "Patient Management": "",
+    "Bed Management": "",
+    "Inventory": "",
+    "Search": "",
+    "AI Assistant": ""
+}
+if st.session_state.role == "admin":
+    menu["Performance"] = ""
+    menu["Admin"] = ""
+
+st.sidebar.title(" HMS Navigation")
+if len(FACILITIES) > 1:
+    st.sidebar.selectbox("Facility", list(FACILITIES), key="facility")
+for page in menu:
+    if st.sidebar.button(page):
+        st.session_state.page = page
+
+if "page" not in st.session_state:
+    st.session_state.page = "Dashboard"
+
+choice = st.session_state.page
+# Times this render and tags its SQL with the page name
+metrics.begin_page(choice)
+if choice == "Dashboard":
+    st.subheader(" Dashboard Analytics")
+    low_stock_banner()
+
+    @panel
+    def test_type_card(rollup, period, period_label):
+        # --- Hardcoded test types (complete list) ---
+        test_types = [
+            "Blood Test", "X-Ray", "Thyroid Test", "Urine Test",
+            "Diabetes Test", "CT Scan", "MRI", "B12 Test"
+        ]
+
+        selected_test = st.selectbox("🔬 Select a Test Type to View Count", sorted(test_types))
+
+        # Test types not used yet in the period simply count as zero
+        test_type_count = int(stats.tests_by_type(rollup).get(selected_test, 0))
+
+        st.success(f" **{test_type_count} '{selected_test}' tests done** {'on' if period == 'Day' else 'during'} {period_label}")
+
+    @panel
+    def dashboard_stats():
+        date_col, period_col = st.columns(2)
+        with date_col:
+            selected_date = st.date_input("Select Date", value=datetime.today())
+        with period_col:
+            period = st.selectbox("Period", list(stats.PERIODS), key="dashboard_period")
+
+        whole_network = len(FACILITIES) > 1 and st.checkbox("All facilities", key="dashboard_network")
+
+        start_date, end_date = stats.period_bounds(selected_date, period)
+        if period == "Day":
+            period_label = selected_date.strftime("%B %d, %Y")
+        else:
+            period_label = f"{start_date.strftime('%B %d, %Y')} – {end_date.strftime('%B %d, %Y')}"
+
+        # All dashboard figures come from one DailyStats range scan (per shard for the network)
+        if whole_network:
+            rollup = network.load_rollup(start_date, end_date)
+        else:
+            rollup = stats.load_rollup(start_date, end_date)
+        counts = stats.totals(rollup)
+
+        st.markdown("###  Statistics for " + period_label)
+        st.write(f" **Total Admissions:** {counts['admissions']}")
+        st.write(f" **Total Patient Visits:** {counts['visits']}")
+        st.write(f" **Total Tests Conducted:** {counts['tests']}")
+
+        if whole_network:
+            st.markdown("####  By Facility")
+            st.dataframe(network.by_facility(rollup), use_container_width=True)
+
+        if period != "Day":
+            st.markdown("####  Daily Trend")
+            st.line_chart(stats.daily_trend(rollup, start_date, end_date))
+
+            by_department = stats.visits_by_department(rollup)
+            if not by_department.empty:
+                st.markdown("####  Visits by Department")
+                st.bar_chart(by_department)
+
+        # Switching the test type reruns only the card, over the rollup already loaded
+        test_type_card(rollup, period, period_label)
+
+    dashboard_stats()
+
+
+elif choice == "Patient Checkups":
+    st.subheader(" Patient Visit Records")
+
+    @panel
+    def add_visit_form():
+        with st.form("outpatient_form"):
+            name = st.text_input("Patient Name")
+            age = st.number_input("Age", min_value=0, key="inflow_age")
+            gender = st.selectbox("Gender", ["Male", "Female", "Other"], key="inflow_gender")
+            visit_date = st.date_input("Visit Date", value=datetime.today(), key="inflow_date")
+            department = st.text_input("Department Visited", key="inflow_department")
+            notes = st.text_area("Doctor's Notes / Complaints", key="inflow_notes")
+            submit_visit = st.form_submit_button("Add Visit Record")
+
+            if submit_visit:
+                def add_visit(conn):
+                    gender_code, visit_day = codes.code(conn, "Genders", gender), codes.day(visit_date)
+                    conn.execute("""
+                        INSERT INTO PatientInflow (name, age, gender, visit_date, department, notes, identity_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (name, age, gender_code, visit_day, codes.code(conn, "Departments", department), notes,
+                          identity.resolve(conn, name, age, gender_code, visit_day)))
+
+                write(add_visit)
+                st.success(" Visit record added successfully!")
+                st.rerun()
+
+    @panel
+    def visit_editor(visits):
+        st.subheader(" Edit /  Delete Visit Record")
+        if visits:
+            # Picker covers the current page; the chosen record is loaded by primary key
+            visit_options = {f"{row[1]} - {codes.date_of(row[4])} (ID: {row[0]})": row[0] for row in visits}
+            selected_visit = st.selectbox("Select visit to update/delete", list(visit_options.keys()), key="edit_visit")
+            visit_id = visit_options[selected_visit]
+
+            selected_data = query_one("""
+                SELECT v.inflow_id, v.name, v.age, g.name, v.visit_date, d.name, v.notes
+                FROM PatientInflow v
+                LEFT JOIN Genders g ON g.id = v.gender
+                LEFT JOIN Departments d ON d.id = v.department
+                WHERE v.inflow_id = ?
+            """, (visit_id,))
+
+            new_name = st.text_input("Patient Name", value=selected_data[1], key="edit_visit_name")
+            new_age = st.number_input("Age", value=selected_data[2], min_value=0, key="edit_visit_age")
+            genders = ["Male", "Female", "Other"]
+            # Imported visits may have no gender recorded
+            gender_index = genders.index(selected_data[3]) if selected_data[3] in genders else 0
+            new_gender = st.selectbox("Gender", genders, index=gender_index, key="edit_visit_gender")
+            new_date = st.date_input("Visit Date", value=codes.date_of(selected_data[4]), key="edit_visit_date")
+            new_dept = st.text_input("Department", value=selected_data[5], key="edit_visit_dept")
+            new_notes = st.text_area("Notes", value=selected_data[6], key="edit_visit_notes")
+
+            update_col, delete_col = st.columns(2)
+            with update_col:
+                if st.button("Update Visit", key="update_visit_btn"):
+                    def update_visit(conn):
+                        # A corrected name, age, gender or date may belong to another identity
+                        gender_code, visit_day = codes.code(conn, "Genders", new_gender), codes.day(new_date)
+                        conn.execute("""
+                            UPDATE PatientInflow
+                            SET name = ?, age = ?, gender = ?, visit_date = ?, department = ?, notes = ?, identity_id = ?
+                            WHERE inflow_id = ?
+                        """, (new_name, new_age, gender_code, visit_day, codes.code(conn, "Departments", new_dept),
+                              new_notes, identity.resolve(conn, new_name, new_age, gender_code, visit_day), visit_id))
+
+                    write(update_visit)
+                    st.success(" Visit updated successfully!")
+                    st.rerun()
+
+            with delete_col:
+                if st.button("Delete Visit", key="delete_visit_btn"):
+                    execute("DELETE FROM PatientInflow WHERE inflow_id = ?", (visit_id,))
+                    st.warning(" Visit record deleted.")
+                    st.rerun()
+        else:
+            st.info("No records to edit/delete.")
+
+    @panel
+    def visit_records():
+        #  Side-by-side layout
+        left_col, right_col = st.columns(2)
+
+        with left_col:
+            st.subheader(" All Patient Records")
+            visits_page = load_page("visits", "visits")
+            visits = visits_page.rows
+            if visits:
+                df_visits = codes.frame(visits, ["ID", "Name", "Age", "Gender", "Visit Date", "Department", "Notes"],
+                                        {"Gender": "Genders", "Visit Date": "day", "Department": "Departments"})
+                st.dataframe(df_visits, use_container_width=True)
+                page_controls(visits_page, "visits")
+                export_panel("visits")
+            else:
+                st.info("No visit records yet.")
+
+        with right_col:
+            visit_editor(visits)
+
+    add_visit_form()
+    st.markdown("---")
+    visit_records()
+elif choice == "Patient Tests":
+    st.subheader(" Patient Diagnostic Tests")
+
+    test_types = codes.TEST_TYPES
+
+    def patient_matches():
+        # Patient dropdowns list name-prefix matches instead of the whole registry
+        patient_search = st.session_state.get("test_patient_search", "")
+        pattern = patient_search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        patients = query("""
+            SELECT id, name FROM Patients
+            WHERE name LIKE ? ESCAPE '\\'
+            ORDER BY name COLLATE NOCASE
+            LIMIT 50
+        """, (pattern,))
+        return {f"{name} (ID: {pid})": pid for pid, name in patients}
+
+    @panel
+    def add_test_form():
+        st.text_input("Find patient by name", key="test_patient_search")
+        patient_options = patient_matches()
+
+        st.markdown("###  Add New Test Record")
+        with st.form("add_test_form"):
+            selected_patient = st.selectbox("Select Patient", list(patient_options.keys()), key="test_patient_add")
+            patient_id = patient_options.get(selected_patient)
+
+            test_type = st.selectbox("Test Type", test_types, key="test_type_add")
+            test_date = st.date_input("Test Date", key="test_date_add")
+            result = st.text_area("Test Result / Notes", key="test_result_add")
+
+            submit = st.form_submit_button("Add Test")
+            if submit and patient_id is None:
+                st.error(" No patient matches the search.")
+            elif submit:
+                write(lambda conn: conn.execute("""
+                    INSERT INTO PatientTests (patient_id, test_type, test_date, result)
+                    VALUES (?, ?, ?, ?)
+                """, (patient_id, codes.code(conn, "TestTypes", test_type), codes.day(test_date), result)))
+                st.success(" Test record added successfully!")
+                st.rerun()
+
+    @panel
+    def test_editor(tests):
+        if not tests:
+            return
+        type_ids, type_dtype = codes.names("TestTypes")
+        type_names = dict(zip(type_ids.tolist(), type_dtype.categories))
+        test_options = {
+            f"{row[1]} - {type_names.get(row[2])} on {codes.date_of(row[3])} (ID: {row[0]})": row[0] for row in tests
+        }
+        selected_label = st.selectbox("Select record to edit/delete", list(test_options.keys()), key="select_test_edit")
+        selected_id = test_options[selected_label]
+
+        selected_data = query_one("""
+            SELECT t.test_id, p.name, tt.name, t.test_date, t.result, t.patient_id
+            FROM PatientTests t
+            JOIN Patients p ON t.patient_id = p.id
+            LEFT JOIN TestTypes tt ON tt.id = t.test_type
+            WHERE t.test_id = ?
+        """, (selected_id,))
+
+        # Reuse patient dropdown, keeping the record's current patient selectable
+        edit_patient_options = {f"{selected_data[1]} (ID: {selected_data[5]})": selected_data[5], **patient_matches()}
+        edit_patient_name = st.selectbox(
+            "Patient", list(edit_patient_options.keys()),
+            index=list(edit_patient_options.values()).index(selected_data[5]),
+            key="test_patient_edit"
+        )
+        new_patient_id = edit_patient_options[edit_patient_name]
+
+        selected_index = test_types.index(selected_data[2]) if selected_data[2] in test_types else 0
+        new_type = st.selectbox("Test Type", test_types, index=selected_index, key="test_type_edit")
+        new_date = st.date_input("Test Date", value=codes.date_of(selected_data[3]), key="test_date_edit")
+        new_result = st.text_area("Result", value=selected_data[4], key="test_result_edit")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Update Record", key="update_test_btn"):
+                write(lambda conn: conn.execute("""
+                    UPDATE PatientTests
+                    SET patient_id = ?, test_type = ?, test_date = ?, result = ?
+                    WHERE test_id = ?
+                """, (new_patient_id, codes.code(conn, "TestTypes", new_type), codes.day(new_date), new_result, selected_id)))
+                st.success(" Test record updated!")
+                st.rerun()
+
+        with col2:
+            if st.button("Delete Record", key="delete_test_btn"):
+                execute("DELETE FROM PatientTests WHERE test_id = ?", (selected_id,))
+                st.warning(" Test record deleted.")
+                st.rerun()
+
+    @panel
+    def test_records():
+        st.markdown("###  Edit /  Delete Test Record")
+
+        # Join query to display patient name in test records
+        tests_page = load_page("tests", "tests")
+        tests = tests_page.rows
+        test_editor(tests)
+
+        st.markdown("---")
+        st.subheader(" All Test Records")
+
+        if tests:
+            df_tests = codes.frame(tests, ["Test ID", "Patient Name", "Test Type", "Date", "Result", "Patient ID"],
+                                   {"Test Type": "TestTypes", "Date": "day"})
+            df_tests.drop(columns=["Patient ID"], inplace=True)
+            st.dataframe(df_tests, use_container_width=True)
+            page_controls(tests_page, "tests")
+            export_panel("tests")
+        else:
+            st.info("No test records available.")
+
+    add_test_form()
+    test_records()
+
+
+
+
+# Patient Management Page
+elif choice == "Patient Management":
+    st.subheader(" Patient Management")
+
+    @panel
+    def admit_form():
+        st.markdown("###  Add New Patient")
+        with st.form("patient_form"):
+            name = st.text_input("Patient Name")
+            age = st.number_input("Age", min_value=0)
+            gender = st.selectbox("Gender", ["Male", "Female", "Other"])
+            admission_date = st.date_input("Admission Date")
+            department = st.text_input("Department")
+            weight = st.number_input("Weight (kg, 0 if unknown)", min_value=0.0, step=0.5)
+            needs_icu = st.checkbox("Needs ICU bed")
+
+            submitted = st.form_submit_button("Admit Patient")
+            if submitted:
+                #  Atomically claim a vacant bed in a matching ward and admit
+                try:
+                    patient_id, bed_id, ward = beds.admit(
+                        name, age, gender, admission_date, department, icu=needs_icu, weight_kg=weight or None
+                    )
+                except beds.BedAllocationError as e:
+                    st.error(f" {e}")
+                else:
+                    st.success(f" {name} admitted and assigned to Bed {bed_id} ({ward})!")
+                    st.rerun()
+
+    def admitted_rows(ids):
+        if ids is not None:
+            return beds.admitted_patients(ids)
+        st.session_state.admitted_page = load_page("admitted", "admitted")
+        return beds.patient_frame(st.session_state.admitted_page.rows)
+
+    def admitted_affected(frame, changes):
+        # Changed patients on this page are reloaded alone; one that could join
+        # the page (inside its id range, or past the end of the last page) reloads it
+        page = st.session_state.admitted_page
+        changed = changes["patients"]
+        shown = changed & set(frame.index)
+        if not page.rows:
+            return None if changed else shown
+        first, last = page.first_key[0], page.last_key[0]
+        if any(first <= patient_id <= last or (patient_id > last and not page.has_next) for patient_id in changed - shown):
+            return None
+        return shown
+
+    @panel(run_every=live.REFRESH_SECONDS)
+    def admitted_list():
+        st.markdown("###  Current Admitted Patients")
+        state = st.session_state.get("admitted_cursor") or {}
+        page_key = (state.get("cursor"), state.get("backward", False), st.session_state.get("admitted_size", PAGE_SIZE))
+        df = live_view("admitted", admitted_rows, admitted_affected, ["patients"]).refresh(page_key, poll=full_run)
+
+        if not df.empty:
+            df = df.reset_index()
+            df.index = df.index + 1
+            df.insert(0, "S.No", df.index)
+            st.dataframe(df, use_container_width=True, hide_index=True)
+            page_controls(st.session_state.admitted_page, "admitted")
+            export_panel("patients")
+        else:
+            st.info("No patients admitted yet.")
+
+    @panel
+    def discharge_panel():
+        with st.expander(" Discharge Patient"):
+            selected_id = st.number_input("Enter Patient ID to discharge", min_value=1, step=1, value=1)
+            if st.button("Discharge"):
+                try:
+                    beds.discharge(selected_id)
+                except beds.BedAllocationError as e:
+                    st.error(f" {e}")
+                else:
+                    st.success(f"  Patient ID {selected_id} discharged successfully!")
+                    st.rerun()
+
+    @panel
+    def transfer_panel():
+        with st.expander(" Transfer Patient"):
+            transfer_id = st.number_input("Enter Patient ID to transfer", min_value=1, step=1, value=1, key="transfer_id")
+            transfer_department = st.text_input("New Department (leave blank to keep current)", key="transfer_department")
+            transfer_icu = st.checkbox("Move to ICU", key="transfer_icu")
+            if st.button("Transfer"):
+                try:
+                    bed_id, ward = beds.transfer(transfer_id, transfer_department or None, icu=transfer_icu)
+                except beds.BedAllocationError as e:
+                    st.error(f" {e}")
+                else:
+                    st.success(f" Patient ID {transfer_id} moved to Bed {bed_id} ({ward})!")
+                    st.rerun()
+
+    @panel
+    def ward_dosage_panel():
+        with st.expander(" Dosage Guidance for Admitted Patients"):
+            ward_medicine = st.text_input("Medicine", placeholder="e.g., Paracetamol", key="ward_medicine")
+            guidance = dosage.advise_admitted(ward_medicine)
+            wards = sorted(guidance["Ward"].dropna().unique())
+            ward_filter = st.multiselect("Wards", wards, key="ward_guidance_wards")
+            if ward_filter:
+                guidance = guidance[guidance["Ward"].isin(ward_filter)]
+            st.dataframe(guidance, use_container_width=True, hide_index=True)
+
+    @panel
+    def patient_history_panel():
+        with st.expander(" Patient History (including archived records)"):
+            history_name = st.text_input("Patient name", key="history_name")
+            if history_name:
+                matches = archive.find_patients(history_name)
+                if matches.empty:
+                    st.info("No matching patients.")
+                else:
+                    st.dataframe(matches, use_container_width=True, hide_index=True)
+                    history_id = st.selectbox("Show tests for patient", matches["ID"], key="history_id")
+                    st.dataframe(archive.patient_tests(history_id), use_container_width=True, hide_index=True)
+
+    @panel
+    def patient_timeline_panel():
+        with st.expander(" Patient Timeline (visits, admissions and tests of one person)"):
+            timeline_name = st.text_input("Patient name", key="timeline_name")
+            if timeline_name:
+                people = identity.find_identities(timeline_name)
+                if people.empty:
+                    st.info("No patient with that name in the patient index.")
+                else:
+                    st.dataframe(people, use_container_width=True, hide_index=True)
+                    names = dict(zip(people["ID"], people["Name"]))
+                    person = st.selectbox("Show timeline for", people["ID"], key="timeline_identity",
+                                          format_func=lambda mpi_id: f"{names[mpi_id]} (ID {mpi_id})")
+                    st.dataframe(identity.timeline(person), use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+
+    #  Left Column: Add New Patient
+    with col1:
+        admit_form()
+
+    #  Right Column: Show Admitted Patients Table
+    with col2:
+        admitted_list()
+
+    discharge_panel()
+    transfer_panel()
+    ward_dosage_panel()
+    patient_history_panel()
+    patient_timeline_panel()
+
+# Bed Management Page
+elif choice == "Bed Management":
+    st.subheader(" Bed Management")
+
+    @panel
+    def bed_editor(bed_rows):
+        if bed_rows:
+            bed_dict = {f"Bed {bed[0]} (Ward: {bed[1]}, Room: {bed[2]})": bed[0] for bed in bed_rows}
+            selected_label = st.selectbox("Select Bed to Edit", list(bed_dict.keys()))
+            selected_bed_id = bed_dict[selected_label]
+
+            selected_bed = query_one("SELECT bed_id, ward, room, status FROM Beds WHERE bed_id = ?", (selected_bed_id,))
+            new_ward = st.text_input("Ward", selected_bed[1], key="edit_ward")
+            new_room = st.text_input("Room", selected_bed[2], key="edit_room")
+            new_status = st.selectbox("Status", ["Vacant", "Occupied"], index=0 if selected_bed[3] == "Vacant" else 1, key="edit_status")
+
+            if st.button("Update Bed Info"):
+                try:
+                    beds.update_bed(selected_bed_id, new_ward, new_room, new_status)
+                except beds.BedAllocationError as e:
+                    st.error(f" {e}")
+                else:
+                    st.success(f" Bed {selected_bed_id} updated successfully!")
+                    st.rerun()
+
+            with st.expander(f"Event log for Bed {selected_bed_id}"):
+                st.dataframe(occupancy.bed_events(selected_bed_id), use_container_width=True, hide_index=True)
+        else:
+            st.info("No beds found.")
+
+    @panel
+    def add_bed_form():
+        st.subheader(" Add New Bed")
+        with st.form("add_bed_form"):
+            new_bed_id = st.number_input("Bed ID", min_value=1, step=1, key="add_id")
+            new_ward = st.text_input("Ward", key="add_ward")
+            new_room = st.text_input("Room", key="add_room")
+            new_status = st.selectbox("Status", ["Vacant", "Occupied"], key="add_status")
+            add_bed = st.form_submit_button("Add Bed")
+
+            if add_bed:
+                try:
+                    beds.add_bed(new_bed_id, new_ward, new_room, new_status)
+                    st.success(f" Bed {new_bed_id} added successfully!")
+                    st.rerun()
+                except sqlite3.IntegrityError:
+                    st.error(" Bed ID already exists!")
+
+    @panel
+    def bed_browser():
+        # Create two columns
+        left_col, right_col = st.columns(2)
+
+        #  Left Column: View & Filter
+        with left_col:
+            st.markdown("###  View & Filter Beds")
+            vacant_count = query_value("SELECT COUNT(*) FROM Beds WHERE status = 'Vacant'")
+            st.info(f"Vacant Beds: {vacant_count}")
+
+            filter_status = st.selectbox("Filter by Status", ["All", "Vacant", "Occupied"])
+            filter_ward = st.text_input("Filter by Ward")
+
+            beds_page = load_page("beds", "beds", {
+                "status": None if filter_status == "All" else filter_status,
+                "ward": filter_ward or None,
+            })
+            bed_rows = beds_page.rows
+            filtered_df = pd.DataFrame(bed_rows, columns=["bed_id", "ward", "room", "status"])
+
+            st.dataframe(filtered_df, use_container_width=True)
+            page_controls(beds_page, "beds")
+            export_panel("beds")
+
+        #  Right Column: Edit/Add
+        with right_col:
+            st.markdown("###  Edit /  Add Bed Info")
+            bed_editor(bed_rows)
+
+            st.markdown("---")
+            add_bed_form()
+
+    @panel(run_every=live.REFRESH_SECONDS)
+    def live_bed_board():
+        st.markdown("###  Live Bed Board")
+        board = live_view("bed_board", beds.board, beds.board_affected, ["beds", "patients"]).refresh(poll=full_run)
+        board = board.assign(Ward=board["Ward"].fillna(""))
+        wards = board.groupby("Ward")["Status"].agg(Beds="size", Occupied=lambda status: (status == "Occupied").sum())
+        wards["Vacant"] = wards["Beds"] - wards["Occupied"]
+        summary_col, board_col = st.columns([1, 2])
+        with summary_col:
+            st.dataframe(wards, use_container_width=True)
+        with board_col:
+            board_wards = st.multiselect("Wards", list(wards.index), key="board_wards")
+            if board_wards:
+                board = board[board["Ward"].isin(board_wards)]
+            st.dataframe(board.sort_values(["Ward", "Room"]), use_container_width=True)
+        st.caption(f"Updated {datetime.now():%H:%M:%S}; refreshes every {live.REFRESH_SECONDS}s as beds and admissions change.")
+
+    @panel
+    def occupancy_history():
+        st.markdown("###  Occupancy History")
+        at_col, range_col = st.columns(2)
+        with at_col:
+            at_date = st.date_input("Occupancy on", value=datetime.today(), key="occupancy_date")
+            at_time = st.time_input("At", value=datetime.now().time().replace(second=0, microsecond=0), key="occupancy_time")
+            st.dataframe(occupancy.occupancy_at(datetime.combine(at_date, at_time)), use_container_width=True, hide_index=True)
+        with range_col:
+            history_start = st.date_input("From", value=datetime.today() - pd.Timedelta(days=90), key="occupancy_start")
+            history_end = st.date_input("To", value=datetime.today(), key="occupancy_end")
+            st.markdown("####  Length of Stay")
+            st.dataframe(occupancy.length_of_stay(history_start, history_end + pd.Timedelta(days=1)),
+                         use_container_width=True, hide_index=True)
+
+        history_end = history_end + pd.Timedelta(days=1)
+        hourly = occupancy.timeline(history_start, history_end)
+        if not hourly.empty:
+            st.markdown("####  Daily Utilization by Ward")
+            st.line_chart(occupancy.utilization(hourly).resample("D").mean())
+            heatmap_wards = st.multiselect("Heatmap wards", list(hourly.columns), key="heatmap_wards")
+            st.markdown("####  Utilization by Weekday and Hour")
+            st.dataframe(occupancy.heatmap(history_start, history_end, heatmap_wards).style.format("{:.0%}"),
+                         use_container_width=True)
+
+    live_bed_board()
+    st.markdown("---")
+    bed_browser()
+    st.markdown("---")
+    occupancy_history()
+
+elif choice == "Inventory":
+    st.subheader(" Inventory Management")
+    low_stock_banner()
+
+    @panel
+    def consumption_panel():
+        st.markdown("####  Consumption")
+        window = st.selectbox("Issued over the last", stock.RATE_WINDOWS, index=1,
+                              format_func=lambda days: f"{days} days", key="consumption_window")
+        usage = stock.consumption(window)
+        if usage.empty:
+            st.info("No stock issued in this period.")
+        else:
+            st.dataframe(usage, use_container_width=True, hide_index=True)
+
+    @panel
+    def add_item_form():
+        st.subheader("Add New Item")
+        with st.form("add_item_form"):
+            name = st.text_input("Item Name", key="add_name")
+            qty = st.number_input("Opening Quantity", min_value=0, step=1, key="add_qty")
+            unit = st.text_input("Unit (e.g. mg, tablets, boxes)", key="add_unit")
+            reorder = st.number_input("Reorder Level", min_value=0, step=1, key="add_reorder")
+            add_btn = st.form_submit_button("Add Item")
+
+            if add_btn:
+                if name and unit:
+                    stock.add_item(name, qty, unit, reorder)
+                    st.success(f" {name} added successfully!")
+                    st.rerun()
+                else:
+                    st.error(" Please fill all fields.")
+
+    @panel
+    def item_editor(inventory_data):
+        if inventory_data:
+            items = {item[0]: item for item in inventory_data}
+            selected_id = st.selectbox("Select item", list(items), key="edit_select",
+                                       format_func=lambda item_id: f"{items[item_id][1]} ({items[item_id][3]})")
+            selected_data = query_one(
+                "SELECT item_id, item_name, quantity, unit, reorder_level FROM Inventory WHERE item_id = ?", (selected_id,)
+            )
+
+            st.divider()
+            st.subheader(" Stock Movement")
+            st.write(f"In stock: **{selected_data[2]} {selected_data[3]}**")
+            # Movements are applied as deltas, so concurrent dispensing is never overwritten
+            with st.form("movement_form"):
+                kind = st.radio("Movement", list(stock.KINDS), horizontal=True, key="movement_kind")
+                moved = st.number_input("Quantity (adjustments may be negative)", step=1, key="movement_qty")
+                note = st.text_input("Note", key="movement_note")
+                if st.form_submit_button("Record Movement"):
+                    try:
+                        stock.record([stock.Movement(selected_id, kind, int(moved), note or None)])
+                        st.success(" Movement recorded!")
+                        st.rerun()
+                    except stock.StockError as e:
+                        st.error(f" {e}")
+
+            ledger = stock.movements_for(selected_id)
+            if ledger:
+                st.dataframe(pd.DataFrame(ledger, columns=["When", "Kind", "Qty", "Note"]),
+                             use_container_width=True, hide_index=True)
+
+            st.divider()
+            st.subheader(" Edit or  Delete Item")
+            new_name = st.text_input("Item Name", selected_data[1], key="edit_name")
+            new_unit = st.text_input("Unit", selected_data[3], key="edit_unit")
+            new_reorder = st.number_input("Reorder Level", min_value=0, value=selected_data[4], key="edit_reorder")
+
+            colu1, colu2 = st.columns(2)
+            with colu1:
+                if st.button("Update Item", key="update_btn"):
+                    stock.update_item(selected_id, new_name, new_unit, new_reorder)
+                    st.success(" Item updated!")
+                    st.rerun()
+            with colu2:
+                if st.button("Delete Item", key="delete_btn"):
+                    stock.delete_item(selected_id)
+                    st.warning(" Item deleted.")
+                    st.rerun()
+
+    @panel
+    def inventory_browser():
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("####  Search & Items")
+
+            search = st.text_input("Search Item by Name")
+            inventory_page = load_page("inventory", "inventory", {"name": fulltext.build_match(search) or None})
+            inventory_data = inventory_page.rows
+
+            if inventory_data:
+                df_inv = pd.DataFrame(inventory_data, columns=["ID", "Item", "Qty", "Unit", "Reorder At"])
+                st.dataframe(df_inv, use_container_width=True)
+                page_controls(inventory_page, "inventory")
+                export_panel("inventory")
+            else:
+                st.info("No inventory items found.")
+
+            consumption_panel()
+
+        with col2:
+            st.markdown("####  Add or Edit Item")
+            add_item_form()
+            item_editor(inventory_data)
+
+    inventory_browser()
+
+elif choice == "Search":
+    st.subheader(" Search Records")
+
+    @panel
+    def search_panel():
+        search_text = st.text_input("Search visit notes, test results, patients and inventory",
+                                    placeholder='e.g. fever, parac or "sore throat"', key="search_text")
+        scopes = st.multiselect("Search in", list(fulltext.SCOPES), default=list(fulltext.SCOPES), key="search_scopes")
+        whole_network = len(FACILITIES) > 1 and st.checkbox("All facilities", key="search_network")
+
+        # Restart at the first page whenever the query or scopes change
+        if st.session_state.get("search_key") != (search_text, scopes, whole_network):
+            st.session_state.search_key = (search_text, scopes, whole_network)
+            st.session_state.search_page = 0
+        result_page = st.session_state.search_page
+
+        if whole_network:
+            hits, has_more = network.search(search_text, scopes, result_page)
+        else:
+            hits, has_more = fulltext.search(search_text, scopes, result_page)
+            hits = [(None, hit) for hit in hits]
+        if hits:
+            for facility_name, hit in hits:
+                where = f"**{facility_name}** · " if facility_name else ""
+                st.markdown(f"{where}**{hit.scope}** · {hit.title}  \n{hit.snippet}")
+            prev_col, next_col = st.columns(2)
+            with prev_col:
+                st.button("◀ Previous", key="search_prev", disabled=result_page == 0,
+                          on_click=lambda: st.session_state.update(search_page=result_page - 1))
+            with next_col:
+                st.button("Next ▶", key="search_next", disabled=not has_more,
+                          on_click=lambda: st.session_state.update(search_page=result_page + 1))
+        elif search_text:
+            st.info("No matching records found.")
+
+    search_panel()
+
+elif choice == "AI Assistant":
+    st.subheader("AI Assistant")
+
+    @panel
+    def dosage_advisor():
+        st.markdown("###  Medicine Dosage Advisor")
+        st.markdown("Enter the medicine and patient's age (and weight, if known) to get a recommended dosage.")
+
+        medicine_name = st.text_input("Enter medicine name", placeholder="e.g., Paracetamol")
+        age = st.number_input("Enter patient's age (in years)", min_value=0, max_value=120, step=1)
+        weight = st.number_input("Enter patient's weight (kg, 0 if unknown)", min_value=0.0, max_value=500.0, step=0.5)
+
+        if st.button("Suggest Dosage"):
+            if medicine_name:
+                advice = dosage.advise(medicine_name, age, weight or None)
+                if advice:
+                    st.info(f"**{medicine_name} for {advice.band}**: {advice.guidance}")
+                else:
+                    st.info("No dosage rule covers this patient. Consult a doctor.")
+            else:
+                st.warning("Please enter a medicine name.")
+
+    @panel
+    def dosage_rules_panel():
+        with st.expander("Dosage Rules"):
+            st.caption("Each row applies from its minimum age and weight up to the next row's; "
+                       "medicine * covers medicines without rules of their own.")
+            dosage_rules = st.data_editor(
+                pd.DataFrame(query("""
+                    SELECT medicine, min_age, min_weight_kg, band, guidance
+                    FROM DosageRules
+                    ORDER BY medicine, min_age, min_weight_kg
+                """), columns=["medicine", "min_age", "min_weight_kg", "band", "guidance"]),
+                num_rows="dynamic", use_container_width=True, key="dosage_rules_editor"
+            )
+            if st.button("Save Dosage Rules"):
+                saved = dosage.save_rules(dosage_rules.itertuples(index=False))
+                st.success(f" {saved} dosage rules saved.")
+
+    @panel
+    def medicine_recommender():
+        st.markdown("### Symptom-based Medicine Recommender")
+        symptoms = st.text_area("Enter patient symptoms", placeholder="fever, headache, sore throat")
+
+        if st.button("Recommend Medicines"):
+            if symptoms:
+                recommendations = recommender.recommend(symptoms)
+
+                if recommendations:
+                    st.success("**Recommended Medicines:**")
+                    for medicine, reasons in recommendations.items():
+                        st.write(f"- **{medicine}** for {', '.join(reasons)}")
+                    st.dataframe(recommender.stock_check(recommendations), use_container_width=True, hide_index=True)
+                else:
+                    st.info("No specific recommendations found. Refer to a doctor.")
+            else:
+                st.warning("Please enter some symptoms.")
+
+    @panel
+    def notes_batch():
+        st.markdown("#### Visit Notes Batch")
+        batch_from, batch_to = st.columns(2)
+        with batch_from:
+            notes_start = st.date_input("From", value=datetime.today().replace(day=1), key="batch_start")
+        with batch_to:
+            notes_end = st.date_input("To", value=datetime.today(), key="batch_end")
+
+        if st.button("Run Batch"):
+            progress = st.empty()
+            result = recommender.recommend_batch(
+                notes_start, notes_end,
+                progress=lambda visits, matched: progress.text(f"{visits} visits read, {matched} with known symptoms")
+            )
+            progress.empty()
+            visits_col, matched_col, time_col = st.columns(3)
+            visits_col.metric("Visits", result.visits)
+            matched_col.metric("With Known Symptoms", result.matched)
+            time_col.metric("Seconds", f"{result.seconds:.2f}")
+            if result.medicines:
+                demand = recommender.stock_check(list(result.medicines))
+                demand.insert(1, "Visits", demand["Medicine"].map(result.medicines))
+                st.dataframe(demand.sort_values("Visits", ascending=False), use_container_width=True, hide_index=True)
+                st.bar_chart(pd.Series(result.symptoms, name="Visits").sort_values(ascending=False))
+
+    @panel
+    def recommender_rules_panel():
+        with st.expander("Recommendation Rules"):
+            rules = st.data_editor(
+                pd.DataFrame(query("SELECT symptom, medicine FROM SymptomRules ORDER BY symptom, medicine"),
+                             columns=["symptom", "medicine"]),
+                num_rows="dynamic", use_container_width=True, key="rules_editor"
+            )
+            synonyms = st.data_editor(
+                pd.DataFrame(query("SELECT phrase, symptom FROM SymptomSynonyms ORDER BY phrase"),
+                             columns=["phrase", "symptom"]),
+                num_rows="dynamic", use_container_width=True, key="synonyms_editor"
+            )
+            if st.button("Save Rules"):
+                saved_rules, saved_synonyms = recommender.save_rules(
+                    rules.itertuples(index=False), synonyms.itertuples(index=False)
+                )
+                st.success(f" {saved_rules} rules and {saved_synonyms} synonyms saved.")
+
+    @panel
+    def notes_summarizer():
+        st.markdown("### Doctor Notes Summarizer")
+        st.markdown("This tool summarizes long notes into short, meaningful summaries using basic AI logic.")
+
+        note_input = st.text_area("Paste Doctor's Notes")
+
+        if st.button("Summarize"):
+            if note_input:
+                summary = summarizer.summary_for(note_input)
+                if summary:
+                    st.success("**Summary:**")
+                    st.write(summary)
+                else:
+                    st.info("No key instructions found. Please check the note.")
+            else:
+                st.warning("Please enter some notes.")
+
+    @panel
+    def recent_summaries():
+        st.markdown("#### Recent Visit Notes")
+        # Summaries come precomputed from NoteSummaries; only unseen notes are summarised here
+        recent = load_page("visits", "summary_visits")
+        if recent.rows:
+            summary_by_note = summarizer.summaries(row[6] for row in recent.rows)
+            df_summaries = codes.frame(
+                [(row[4], row[1], row[6], summary_by_note.get(row[6], "")) for row in recent.rows],
+                ["Visit Date", "Name", "Notes", "Summary"], {"Visit Date": "day"}
+            )
+            st.dataframe(df_summaries, use_container_width=True, hide_index=True)
+            page_controls(recent, "summary_visits")
+
+    @panel
+    def summary_backfill():
+        st.caption(f"{query_value('SELECT COUNT(*) FROM NoteSummaries')} summaries stored")
+        if st.button("Summarize All Notes"):
+            progress = st.empty()
+            # In-process: forking the threaded server for a pool can deadlock the
+            # workers. Large backfills belong to the CLI (python summarizer.py).
+            read, added = summarizer.backfill(
+                workers=1, progress=lambda done, new: progress.text(f"{done} rows read, {new} new summaries")
+            )
+            progress.empty()
+            st.success(f" {read} notes checked, {added} new summaries stored.")
+
+    tab1, tab2, tab3 = st.tabs(["Dosage Advisor", "Recommend Medicines", "Summarize Notes"])
+
+    # ---- TAB 1: Dosage Advisor ----
+    with tab1:
+        dosage_advisor()
+        if st.session_state.role == "admin":
+            dosage_rules_panel()
+
+    # ---- TAB 2: Recommend Medicines ----
+    with tab2:
+        medicine_recommender()
+        st.divider()
+        notes_batch()
+        if st.session_state.role == "admin":
+            recommender_rules_panel()
+
+    # ---- TAB 3: Summarize Notes ----
+    with tab3:
+        notes_summarizer()
+        st.divider()
+        recent_summaries()
+        if st.session_state.role == "admin":
+            summary_backfill()
+
+elif choice == "Performance" and st.session_state.role == "admin":
+    st.subheader(" Performance")
+
+    query_samples, page_samples = metrics.snapshot()
+    cache_stats = query_cache.stats()
+    rate_col, queries_col, renders_col = st.columns(3)
+    rate_col.metric("Cache Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+    queries_col.metric("Statements Recorded", len(query_samples))
+    renders_col.metric("Renders Recorded", len(page_samples))
+
+    st.markdown("###  Page Render Times")
+    page_stats = metrics.page_summary(page_samples)
+    if page_stats:
+        df_pages = pd.DataFrame.from_dict(page_stats, orient="index")
+        df_pages.index.name = "Page"
+        st.dataframe(df_pages.round(1), use_container_width=True)
+    else:
+        st.info("No page renders recorded yet.")
+
+    st.markdown("###  Slowest Queries")
+    slowest = metrics.slowest_statements(query_samples)
+    if slowest:
+        df_slow = pd.DataFrame(slowest)[["max_ms", "p95_ms", "calls", "total_ms", "rows", "pages", "statement"]]
+        st.dataframe(df_slow.round(2), use_container_width=True, hide_index=True)
+    else:
+        st.info("No queries recorded yet.")
+
+    st.download_button("Download Prometheus metrics", data=lambda: metrics.prometheus_text(query_cache.stats()),
+                       file_name="hms_metrics.prom", mime="text/plain")
+    save_col, clear_col = st.columns(2)
+    with save_col:
+        if st.button("Save to metrics tables"):
+            saved = metrics.persist()
+            st.success(f" {saved} samples saved.")
+    with clear_col:
+        if st.button("Reset metrics"):
+            metrics.clear()
+            st.rerun()
+
+elif choice == "Admin" and st.session_state.role == "admin":
+    st.subheader(" Admin")
+
+    @panel
+    def cache_panel():
+        st.markdown("###  Query Cache")
+        cache_stats = query_cache.stats()
+        hits_col, misses_col, rate_col = st.columns(3)
+        hits_col.metric("Hits", cache_stats["hits"])
+        misses_col.metric("Misses", cache_stats["misses"])
+        rate_col.metric("Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+        entries_col, rows_col, evicted_col = st.columns(3)
+        entries_col.metric("Entries", f"{cache_stats['entries']} / {query_cache.max_entries}")
+        rows_col.metric("Cached Rows", cache_stats["rows"])
+        evicted_col.metric("Evicted / Stale", f"{cache_stats['evictions']} / {cache_stats['stale']}")
+
+        if st.button("Clear Cache"):
+            query_cache.clear()
+            st.success(" Query cache cleared.")
+            st.rerun()
+
+    @panel
+    def bulk_import():
+        st.markdown("###  Bulk Import")
+        import_kind = st.selectbox("Record type", list(importer.SPECS), key="import_kind")
+        import_fields = importer.SPECS[import_kind][1]
+        st.caption("Columns: " + ", ".join(f"{field.name}{' *' if field.required else ''}" for field in import_fields))
+        # Large loads with indexes and triggers deferred run offline: python importer.py ... --bulk
+        upload = st.file_uploader("CSV or JSONL file", type=["csv", "jsonl", "ndjson", "json"], key="import_file")
+        if upload is not None and st.button("Import"):
+            progress = st.empty()
+            with st.spinner("Importing..."):
+                result = importer.import_file(
+                    import_kind, upload, importer.format_of(upload.name),
+                    progress=lambda done, bad: progress.text(f"{done} rows imported, {bad} rejected"),
+                )
+            rate = result.imported / result.seconds if result.seconds else 0
+            done_col, rejected_col, rate_col = st.columns(3)
+            done_col.metric("Imported", result.imported)
+            rejected_col.metric("Rejected", result.rejected)
+            rate_col.metric("Rows / s", f"{rate:,.0f}")
+            if result.rejects:
+                st.dataframe(pd.DataFrame(result.rejects, columns=["Row", "Reason"]), use_container_width=True, hide_index=True)
+
+    cache_panel()
+    bulk_import()
+
+metrics.end_page(query_cache.stats())
+full_run = False
@@ -0,0 +1,332 @@
+# Hot/cold archival. Patients discharged before the retention window move, with
+# their tests, to an archive database next to each shard; so do visits older
+# than the window. Each batch is first copied into the archive and only then
+# deleted from the shard in one write transaction, so an interruption leaves a
+# duplicate (hidden by the history views) rather than a lost row. DailyStats
+# keeps counting archived rows: the rollup delete triggers are suspended while
+# archiving and the removed counts are kept in ArchivedStats.
+#
+#   python archive.py [--retention-days 365] [--batch-size 2000] [--dry-run]
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import closing
+from datetime import date, timedelta
+
+import database
+import metrics
+from codes import day, frame
+from database import DEFAULT_FACILITY, FACILITIES, init_db, use_facility, write
+from migrations import DAY_COLUMNS, LOOKUP_OF, code_sql, day_sql, intern_names, rollup_insert
+
+RETENTION_DAYS = 365
+BATCH_SIZE = 2000
+# Set for the length of a delete transaction; see _add_archive_support()
+ARCHIVE_FLAG = "archiving"
+# Archived table -> key column
+ARCHIVED = {"Patients": "id", "PatientTests": "test_id", "PatientInflow": "inflow_id"}
+ARCHIVE_INDEXES = {
+    "idx_archive_patients_name": "Patients(name COLLATE NOCASE)",
+    "idx_archive_tests_patient": "PatientTests(patient_id)",
+    "idx_archive_inflow_visit_date": "PatientInflow(visit_date)",
+    "idx_archive_patients_identity": "Patients(identity_id) WHERE identity_id IS NOT NULL",
+    "idx_archive_inflow_identity": "PatientInflow(identity_id) WHERE identity_id IS NOT NULL",
+}
+# Hot rows first, then archived rows the shard no longer has
+HISTORY_VIEWS = {"AllPatients": "Patients", "AllTests": "PatientTests", "AllVisits": "PatientInflow"}
+
+ArchiveResult = namedtuple("ArchiveResult", ["patients", "tests", "visits", "seconds"])
+
+# Shards whose archive schema this process has synced
+_synced = set()
+_sync_lock = threading.Lock()
+# (shard path, archive exists) -> pool of read connections with the history views defined
+_readers = {}
+_readers_lock = threading.Lock()
+
+_CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?\S+", re.IGNORECASE)
+
+
+def archive_path(path=None):
+    base, _ = os.path.splitext(path or database.database_path())
+    return base + "-archive.db"
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _compacted(conn, table):
+    # False for archives written while the shard kept dates and names as text
+    types = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA archive.table_info({table})")}
+    compact = DAY_COLUMNS.get(table, []) + [col for source, col in LOOKUP_OF if source == table]
+    return all(types.get(col) != "TEXT" for col in compact)
+
+
+def _compact(conn, table, sql):
+    # Rebuilds a text archive table with day numbers and the shard's lookup codes,
+    # adding names the shard has not seen to its lookups
+    columns = _columns(conn, "archive", table)
+    values = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for col in columns:
+            lookup = LOOKUP_OF.get((table, col))
+            if lookup:
+                intern_names(conn, f"main.{lookup}", f"SELECT {col} FROM archive.{table}")
+                values.append(code_sql(f"main.{lookup}", col))
+            else:
+                values.append(day_sql(col) if col in DAY_COLUMNS.get(table, ()) else col)
+        conn.execute(_CREATE_TABLE.sub(f"CREATE TABLE archive.{table}_compact", sql, count=1))
+        conn.execute(f"""
+            INSERT INTO archive.{table}_compact ({", ".join(columns)})
+            SELECT {", ".join(values)} FROM archive.{table}
+        """)
+        conn.execute(f"DROP TABLE archive.{table}")
+        conn.execute(f"ALTER TABLE archive.{table}_compact RENAME TO {table}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _sync_schema(conn):
+    # Archive tables follow the shard's: created from its DDL, then widened by later migrations
+    for table in ARCHIVED:
+        archived = _columns(conn, "archive", table)
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        if not archived:
+            conn.execute(_CREATE_TABLE.sub(f"CREATE TABLE archive.{table}", sql, count=1))
+            continue
+        if not _compacted(conn, table):
+            _compact(conn, table, sql)
+        for _, name, kind, *_ in conn.execute(f"PRAGMA main.table_info({table})"):
+            if name not in archived:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {kind}")
+    for name, definition in ARCHIVE_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS archive.{name} ON {definition}")
+
+
+def _create_views(conn, archived=True):
+    # Without an archive the views are the hot tables alone
+    for view, table in HISTORY_VIEWS.items():
+        key = ARCHIVED[table]
+        columns = ", ".join(_columns(conn, "main", table))
+        sql = f"SELECT {columns}, 0 AS archived FROM main.{table}"
+        if archived:
+            sql += f"""
+                UNION ALL
+                SELECT {columns}, 1 AS archived FROM archive.{table}
+                WHERE {key} NOT IN (SELECT {key} FROM main.{table})
+            """
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {view} AS {sql}")
+
+
+def open_archive(path=None):
+    # Private connection to the shard with its archive attached as "archive" and
+    # the AllPatients / AllTests / AllVisits views defined; creates the archive
+    path = path or database.database_path()
+    existed = os.path.exists(archive_path(path))
+    conn = database.open_connection(path)
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(path),))
+    conn.execute("PRAGMA archive.journal_mode = WAL")
+    with _sync_lock:
+        if not existed or path not in _synced:
+            _sync_schema(conn)
+            _synced.add(path)
+    _create_views(conn)
+    return conn
+
+
+def _attach(conn, path, archived):
+    if archived:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(path),))
+    _create_views(conn, archived)
+
+
+def _reader_pool(path):
+    # Reads never create the archive; once one exists its schema is synced before the first read
+    archived = os.path.exists(archive_path(path))
+    pool = _readers.get((path, archived))
+    if pool is None:
+        with _readers_lock:
+            pool = _readers.get((path, archived))
+            if pool is None:
+                if archived:
+                    open_archive(path).close()
+                pool = database.ConnectionPool(path, setup=lambda conn: _attach(conn, path, archived))
+                _readers[(path, archived)] = pool
+    return pool
+
+
+def query(sql, params=()):
+    # Read over the history views on a pooled connection of this thread's shard
+    started = time.perf_counter()
+    pool = _reader_pool(database.database_path())
+    conn = pool.acquire()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        pool.release(conn)
+    metrics.record_query(sql, started, len(rows))
+    return rows
+
+
+def _copy(conn, batch):
+    # batch: table -> key values. Written to the archive only, so the shard stays writable
+    conn.execute("BEGIN")
+    try:
+        for table, ids in batch.items():
+            columns = ", ".join(_columns(conn, "main", table))
+            conn.execute(f"""
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table}
+                WHERE {ARCHIVED[table]} IN (SELECT value FROM json_each(?))
+            """, (json.dumps(ids),))
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _purge(batch):
+    # Deletes an archived batch from the shard in one transaction, moving its
+    # DailyStats counts to ArchivedStats instead of subtracting them
+    def run(conn):
+        conn.execute("INSERT INTO MaintenanceFlags (flag) VALUES (?)", (ARCHIVE_FLAG,))
+        for table, ids in batch.items():
+            where = f"{ARCHIVED[table]} IN (SELECT value FROM json_each(?))"
+            if table in ("PatientTests", "PatientInflow"):
+                conn.execute(rollup_insert(table, "ArchivedStats", where), (json.dumps(ids),))
+            conn.execute(f"DELETE FROM {table} WHERE {where}", (json.dumps(ids),))
+        conn.execute("DELETE FROM MaintenanceFlags WHERE flag = ?", (ARCHIVE_FLAG,))
+    write(run)
+
+
+def _cutoff(retention_days, today):
+    return day((today or date.today()) - timedelta(days=retention_days))
+
+
+def candidates(retention_days=RETENTION_DAYS, today=None):
+    # (patients, tests, visits) the next run would move
+    cutoff = _cutoff(retention_days, today)
+    discharged = "SELECT id FROM Patients WHERE status = 'Discharged' AND discharge_date < ?"
+    return (
+        database.query_value(f"SELECT COUNT(*) FROM ({discharged})", (cutoff,)),
+        database.query_value(f"SELECT COUNT(*) FROM PatientTests WHERE patient_id IN ({discharged})", (cutoff,)),
+        database.query_value("SELECT COUNT(*) FROM PatientInflow WHERE visit_date < ?", (cutoff,)),
+    )
+
+
+def archive(retention_days=RETENTION_DAYS, batch_size=BATCH_SIZE, today=None, progress=None):
+    cutoff = _cutoff(retention_days, today)
+    started = time.perf_counter()
+    patients = tests = visits = 0
+    with closing(open_archive()) as conn:
+        while True:
+            patient_ids = [row[0] for row in conn.execute("""
+                SELECT id FROM Patients
+                WHERE status = 'Discharged' AND discharge_date < ?
+                ORDER BY discharge_date LIMIT ?
+            """, (cutoff, batch_size))]
+            if not patient_ids:
+                break
+            test_ids = [row[0] for row in conn.execute(
+                "SELECT test_id FROM PatientTests WHERE patient_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(patient_ids),)
+            )]
+            batch = {"PatientTests": test_ids, "Patients": patient_ids}
+            _copy(conn, batch)
+            _purge(batch)
+            patients += len(patient_ids)
+            tests += len(test_ids)
+            if progress:
+                progress(patients, tests, visits)
+        while True:
+            visit_ids = [row[0] for row in conn.execute(
+                "SELECT inflow_id FROM PatientInflow WHERE visit_date < ? ORDER BY visit_date LIMIT ?",
+                (cutoff, batch_size)
+            )]
+            if not visit_ids:
+                break
+            batch = {"PatientInflow": visit_ids}
+            _copy(conn, batch)
+            _purge(batch)
+            visits += len(visit_ids)
+            if progress:
+                progress(patients, tests, visits)
+    return ArchiveResult(patients, tests, visits, time.perf_counter() - started)
+
+
+def _history(sql, params, columns, types):
+    return frame(query(sql, params), columns, types)
+
+
+def find_patients(name, limit=100):
+    # Current and archived patients whose name starts with name. Each arm is a range
+    # of its NOCASE name index, read in name order, current patients first
+    pattern = name.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return _history("""
+        SELECT id, name, age, gender, admission_date, discharge_date, status, department, archived
+        FROM AllPatients
+        WHERE name LIKE ? ESCAPE '\\'
+        LIMIT ?
+    """, (pattern, limit), ["ID", "Name", "Age", "Gender", "Admission Date", "Discharge Date", "Status",
+                            "Department", "Archived"],
+        {"Gender": "Genders", "Admission Date": "day", "Discharge Date": "day", "Status": "category",
+         "Department": "Departments"})
+
+
+def patient_tests(patient_id):
+    return _history("""
+        SELECT test_id, test_type, test_date, result, archived
+        FROM AllTests
+        WHERE patient_id = ?
+        ORDER BY test_id
+    """, (patient_id,), ["Test ID", "Test Type", "Test Date", "Result", "Archived"],
+        {"Test Type": "TestTypes", "Test Date": "day"})
+
+
+def visits_between(start, end, limit=1000):
+    return _history("""
+        SELECT inflow_id, name, age, gender, visit_date, department, notes, archived
+        FROM AllVisits
+        WHERE visit_date BETWEEN ? AND ?
+        ORDER BY visit_date LIMIT ?
+    """, (day(start), day(end), limit), ["ID", "Name", "Age", "Gender", "Visit Date", "Department", "Notes", "Archived"],
+        {"Gender": "Genders", "Visit Date": "day", "Department": "Departments"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old discharged patients and visits to the archive database.")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS,
+                        help="keep patients discharged and visits made within this many days")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--facility", choices=list(FACILITIES), default=DEFAULT_FACILITY)
+    parser.add_argument("--dry-run", action="store_true", help="only count what would move")
+    args = parser.parse_args(argv)
+
+    use_facility(args.facility)
+    init_db()
+    if args.dry_run:
+        patients, tests, visits = candidates(args.retention_days)
+        print(f"would archive {patients} patients, {tests} tests, {visits} visits to {archive_path()}")
+        return 0
+    result = archive(
+        args.retention_days, args.batch_size,
+        progress=lambda p, t, v: print(f"  {p} patients, {t} tests, {v} visits ...", file=sys.stderr),
+    )
+    rows = result.patients + result.tests + result.visits
+    print(f"archived {result.patients} patients, {result.tests} tests, {result.visits} visits "
+          f"to {archive_path()} in {result.seconds:.1f}s ({rows / max(result.seconds, 1e-9):.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
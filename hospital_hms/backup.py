@@ -0,0 +1,483 @@
+# Online backups and point-in-time restore for the facility shards.
+#
+# A backup is a chain directory: base.db, copied with SQLite's online backup
+# API from one read snapshot in steps of a few hundred pages with a pause
+# after each (in WAL mode the copy never blocks writers), then the WAL frames
+# committed after that snapshot, archived about every second into wal/. A
+# restore copies base.db and replays the archived frames up to a point in time.
+#
+# WAL archiving needs HMS_WAL_ARCHIVE=1 in the environment of the app and of
+# every tool writing the shard: their connections then leave checkpoints to
+# the archiver, which copies every committed frame before checkpointing, so
+# none is overwritten unarchived. Without it only base backups are taken.
+#
+#   python backup.py schedule [--every 3600] [--keep 7]   base backups plus WAL archiving, until stopped
+#   python backup.py run                                  one base backup
+#   python backup.py list
+#   python backup.py verify [CHAIN]                       integrity_check on the base and on a full replay
+#   python backup.py restore CHAIN [--until TIME] [--to PATH] [--replace]
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import closing, contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+import database
+from database import DEFAULT_FACILITY, FACILITIES, init_db, use_facility
+
+BACKUP_DIR = os.environ.get("HMS_BACKUP_DIR", "data/backups")
+# Online backup step and the pause after it
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+ARCHIVE_SECONDS = 1.0
+# Checkpoint once this many frames are archived since the WAL last restarted
+CHECKPOINT_FRAMES = 1000
+BACKUP_EVERY = 3600
+KEEP_CHAINS = 7
+
+WAL_HEADER = 32
+FRAME_HEADER = 24
+STAMP = "%Y%m%d-%H%M%S"
+
+BackupResult = namedtuple("BackupResult", ["chain", "pages", "bytes", "seconds"])
+Chain = namedtuple("Chain", ["path", "taken_at", "bytes", "segments", "until"])
+
+
+class ChainBroken(Exception):
+    # Frames may have been checkpointed away unarchived; a new chain must start
+    pass
+
+
+@lru_cache(maxsize=None)
+def _weights(pairs):
+    # One checksum step on (s0, s1) is a multiply by M = [[1, 1], [1, 2]] plus the
+    # step's words, so a run of steps is a weighted sum: M^j as its (p, q, r)
+    # entries for j = 0..pairs, kept modulo 2**64 like numpy's uint64 arithmetic
+    p, q, r = [1], [0], [1]
+    for _ in range(pairs):
+        p.append((p[-1] + q[-1]) & 0xFFFFFFFFFFFFFFFF)
+        q.append((q[-1] + r[-1]) & 0xFFFFFFFFFFFFFFFF)
+        r.append((q[-2] + 2 * r[-1]) & 0xFFFFFFFFFFFFFFFF)
+    return tuple(np.array(weights, dtype=np.uint64) for weights in (p, q, r))
+
+
+def _checksum(data, s0, s1, big_endian):
+    # SQLite's WAL checksum over 8-byte units, continuing from (s0, s1)
+    words = np.frombuffer(data, dtype=">u4" if big_endian else "<u4").astype(np.uint64)
+    first, second = words[0::2], words[1::2]
+    pairs = len(first)
+    p, q, r = _weights(pairs)
+    # Pair k is multiplied by M^(pairs - 1 - k)
+    pk, qk, rk = p[pairs - 1::-1], q[pairs - 1::-1], r[pairs - 1::-1]
+    both = first + second
+    s0, s1 = (
+        int(p[pairs]) * s0 + int(q[pairs]) * s1 + int((pk * first + qk * both).sum()),
+        int(q[pairs]) * s0 + int(r[pairs]) * s1 + int((qk * first + rk * both).sum()),
+    )
+    return s0 & 0xFFFFFFFF, s1 & 0xFFFFFFFF
+
+
+class WalTail:
+    # Reads whole committed transactions as they are appended to a shard's WAL.
+    # A frame counts only with the WAL's current salt and an unbroken checksum
+    # chain, as in SQLite's own recovery.
+
+    def __init__(self, path):
+        self.path = path + "-wal"
+        self.salt = None
+        self.offset = WAL_HEADER
+        self.checksum = (0, 0)
+        self.big_endian = False
+        self.page_size = None
+        # True after our checkpoint: the next writer may start the WAL over
+        self.expect_restart = True
+
+    @property
+    def frames(self):
+        # Committed frames read since the WAL last restarted
+        return (self.offset - WAL_HEADER) // (FRAME_HEADER + self.page_size) if self.page_size else 0
+
+    def read(self):
+        try:
+            wal = open(self.path, "rb")
+        except FileNotFoundError:
+            if not self.expect_restart:
+                raise ChainBroken("the WAL was removed by a checkpoint the archiver did not run")
+            return b""
+        with wal:
+            header = wal.read(WAL_HEADER)
+            if len(header) < WAL_HEADER:
+                return b""
+            magic, _, page_size, _, salt1, salt2, check1, check2 = struct.unpack(">8I", header)
+            if (salt1, salt2) != self.salt:
+                if not self.expect_restart:
+                    raise ChainBroken("the WAL restarted after a checkpoint the archiver did not run")
+                big_endian = bool(magic & 1)
+                if _checksum(header[:24], 0, 0, big_endian) != (check1, check2):
+                    # Header still being written
+                    return b""
+                self.salt, self.offset, self.checksum = (salt1, salt2), WAL_HEADER, (check1, check2)
+                self.big_endian, self.page_size = big_endian, page_size
+            size = FRAME_HEADER + self.page_size
+            # Up to the size seen now: writers appending meanwhile wait for the next read
+            end = os.fstat(wal.fileno()).st_size
+            wal.seek(self.offset)
+            committed, pending = [], []
+            offset, checksum = self.offset, self.checksum
+            while offset + size <= end:
+                frame = wal.read(size)
+                if len(frame) < size:
+                    break
+                _, commit, salt1, salt2, check1, check2 = struct.unpack(">6I", frame[:FRAME_HEADER])
+                if (salt1, salt2) != self.salt:
+                    break
+                checksum = _checksum(frame[:8] + frame[FRAME_HEADER:], *checksum, self.big_endian)
+                if checksum != (check1, check2):
+                    break
+                pending.append(frame)
+                offset += size
+                if commit:
+                    committed += pending
+                    pending = []
+                    self.offset, self.checksum = offset, checksum
+        if committed:
+            # Appended without a restart: our last checkpoint did not start the WAL over
+            self.expect_restart = False
+        return b"".join(committed)
+
+
+def chain_dir(facility=None):
+    return os.path.join(BACKUP_DIR, facility or database.facility() or DEFAULT_FACILITY)
+
+
+def _write_atomic(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def _write_lock(conn):
+    # Holds the shard's write lock without writing: no frame is appended meanwhile
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    finally:
+        conn.rollback()
+
+
+class Archiver:
+    # Keeps one chain for a shard: takes its base backup and then appends the
+    # shard's committed WAL frames to it
+
+    def __init__(self, path=None, facility=None, archive_wal=database.WAL_ARCHIVING):
+        self.path = path or database.database_path()
+        self.root = chain_dir(facility)
+        self.archive_wal = archive_wal
+        self.chain = None
+        self.segments = self.checkpoints = 0
+        self.tail = None
+        # Our connection keeps the shard open, so the WAL is never checkpointed on close
+        self._lock_conn = database.open_connection(self.path)
+
+    def close(self):
+        self._lock_conn.close()
+
+    def _archive(self):
+        frames = self.tail.read()
+        if frames:
+            self.segments += 1
+            name = f"{self.segments:06d}-{int(time.time() * 1000)}.frames"
+            _write_atomic(os.path.join(self.chain, "wal", name), frames)
+        return len(frames)
+
+    def archive(self):
+        # Frames committed since the last call; a broken chain starts a new one
+        if self.tail is None:
+            return 0
+        try:
+            archived = self._archive()
+            if self.tail.frames >= CHECKPOINT_FRAMES:
+                self.checkpoint()
+            return archived
+        except ChainBroken as e:
+            print(f"WAL archive chain broken ({e}); starting a new chain", file=sys.stderr)
+            self.new_chain()
+            return 0
+
+    def checkpoint(self):
+        # Everything is archived under the write lock before the checkpoint
+        # backfills it, so the WAL can only start over once it is safe. Most of
+        # it is archived first, so the lock is held only for the last frames.
+        self._archive()
+        with _write_lock(self._lock_conn):
+            self._archive()
+            with closing(database.open_connection(self.path)) as conn:
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            self.tail.expect_restart = True
+        self.checkpoints += 1
+
+    def _catch_up(self, tail):
+        # Archives what the current chain lacks and moves tail to the end of the WAL
+        if self.tail is not None:
+            try:
+                self._archive()
+            except ChainBroken:
+                self.tail = None
+        if tail is None:
+            return None
+        try:
+            tail.read()
+        except ChainBroken:
+            tail = WalTail(self.path)
+            tail.read()
+        return tail
+
+    def new_chain(self, pages=PAGES_PER_STEP, pause=STEP_PAUSE, progress=None):
+        started = time.perf_counter()
+        chain = os.path.join(self.root, datetime.now().strftime(STAMP))
+        suffix = 1
+        while os.path.exists(chain):
+            suffix += 1
+            chain = os.path.join(self.root, f"{datetime.now().strftime(STAMP)}-{suffix}")
+        os.makedirs(os.path.join(chain, "wal"))
+        source = database.open_connection(self.path)
+        tail = WalTail(self.path) if self.archive_wal else None
+        try:
+            # The WAL is read up to its end before taking the write lock, so that
+            # under it only the frames committed since are left to read
+            self._catch_up(tail)
+            # The snapshot and the WAL position are taken together under the write
+            # lock: frames after that position are exactly what the base lacks
+            with _write_lock(self._lock_conn):
+                tail = self._catch_up(tail)
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            taken_at = datetime.now()
+            target = os.path.join(chain, "base.db")
+            with closing(sqlite3.connect(target + ".tmp")) as copy:
+                def step(status, remaining, total):
+                    if progress:
+                        progress(total - remaining, total)
+                    time.sleep(pause)
+
+                source.backup(copy, pages=pages, progress=step)
+                page_size = copy.execute("PRAGMA page_size").fetchone()[0]
+                page_count = copy.execute("PRAGMA page_count").fetchone()[0]
+            os.replace(target + ".tmp", target)
+        finally:
+            source.close()
+        _write_atomic(os.path.join(chain, "base.json"), json.dumps({
+            "source": os.path.abspath(self.path),
+            "taken_at": taken_at.isoformat(sep=" ", timespec="seconds"),
+            "page_size": page_size,
+            "pages": page_count,
+            "wal_archived": self.archive_wal,
+        }, indent=1).encode())
+        self.chain, self.segments, self.tail = chain, 0, tail
+        seconds = time.perf_counter() - started
+        return BackupResult(chain, page_count, page_count * page_size, seconds)
+
+
+def backup(facility=None, pages=PAGES_PER_STEP, pause=STEP_PAUSE, progress=None):
+    # One base backup of the current shard, without WAL archiving
+    archiver = Archiver(facility=facility, archive_wal=False)
+    try:
+        return archiver.new_chain(pages, pause, progress)
+    finally:
+        archiver.close()
+
+
+def _segments(chain):
+    wal = os.path.join(chain, "wal")
+    names = sorted(name for name in os.listdir(wal) if name.endswith(".frames")) if os.path.isdir(wal) else []
+    # (archived at, path); frames in a segment were committed before it was archived
+    return [(datetime.fromtimestamp(int(name[7:-7]) / 1000), os.path.join(wal, name)) for name in names]
+
+
+def chains(facility=None):
+    root = chain_dir(facility)
+    found = []
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        path = os.path.join(root, name)
+        if not os.path.exists(os.path.join(path, "base.json")):
+            continue
+        with open(os.path.join(path, "base.json")) as f:
+            meta = json.load(f)
+        segments = _segments(path)
+        size = os.path.getsize(os.path.join(path, "base.db")) + sum(os.path.getsize(seg) for _, seg in segments)
+        taken_at = datetime.fromisoformat(meta["taken_at"])
+        found.append(Chain(path, taken_at, size, len(segments), segments[-1][0] if segments else taken_at))
+    return found
+
+
+def prune(keep=KEEP_CHAINS, facility=None):
+    found = chains(facility)
+    for chain in found[:-keep] if keep else []:
+        shutil.rmtree(chain.path)
+    return max(len(found) - keep, 0)
+
+
+def integrity(path):
+    # integrity_check on a closed database file, opened read-only
+    with closing(sqlite3.connect(f"file:{os.path.abspath(path)}?immutable=1", uri=True)) as conn:
+        return [row[0] for row in conn.execute("PRAGMA integrity_check")]
+
+
+def replay(chain, target, until=None):
+    # Writes base.db plus the frames archived up to until to target; returns the
+    # number of WAL segments applied
+    with open(os.path.join(chain, "base.json")) as f:
+        page_size = json.load(f)["page_size"]
+    shutil.copyfile(os.path.join(chain, "base.db"), target)
+    frame_size = FRAME_HEADER + page_size
+    applied, pages = 0, None
+    with open(target, "r+b") as db:
+        for archived_at, segment in _segments(chain):
+            if until is not None and archived_at > until:
+                break
+            with open(segment, "rb") as f:
+                data = f.read()
+            for start in range(0, len(data), frame_size):
+                page, commit = struct.unpack(">2I", data[start:start + 8])
+                db.seek((page - 1) * page_size)
+                db.write(data[start + FRAME_HEADER:start + frame_size])
+                if commit:
+                    pages = commit
+            applied += 1
+        if pages is not None:
+            db.truncate(pages * page_size)
+    return applied
+
+
+def verify(chain):
+    # Problems found in the base copy and in a replay of every archived frame
+    problems = [f"base: {line}" for line in integrity(os.path.join(chain, "base.db")) if line != "ok"]
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, "replay.db")
+        replay(chain, target)
+        problems += [f"replay: {line}" for line in integrity(target) if line != "ok"]
+    return problems
+
+
+def restore(chain, target=None, until=None, replace=False):
+    # Rebuilds the shard as of until (default: the last archived frame). The app
+    # and every tool using target must be stopped first.
+    target = target or database.database_path()
+    if os.path.exists(target) and not replace:
+        raise FileExistsError(f"{target} exists; pass replace=True to overwrite it")
+    staging = target + ".restoring"
+    applied = replay(chain, staging, until)
+    problems = [line for line in integrity(staging) if line != "ok"]
+    if problems:
+        os.remove(staging)
+        raise sqlite3.DatabaseError(f"restored copy failed integrity_check: {problems[0]}")
+    # A stale WAL would be replayed onto the restored file
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    os.replace(staging, target)
+    return applied
+
+
+def schedule(every=BACKUP_EVERY, keep=KEEP_CHAINS, facility=None, progress=None):
+    # Runs until interrupted: a new chain every `every` seconds, WAL frames archived in between
+    archiver = Archiver(facility=facility)
+    if not archiver.archive_wal:
+        print("HMS_WAL_ARCHIVE is not set: taking base backups only, no point-in-time restore", file=sys.stderr)
+    try:
+        while True:
+            result = archiver.new_chain()
+            pruned = prune(keep, facility)
+            if progress:
+                progress(result, pruned)
+            due = time.monotonic() + every
+            while time.monotonic() < due:
+                time.sleep(ARCHIVE_SECONDS if archiver.archive_wal else min(every, 60))
+                archiver.archive()
+    finally:
+        archiver.close()
+
+
+def _chain_arg(value, facility):
+    if value and os.path.isdir(value):
+        return value
+    found = chains(facility)
+    if value:
+        found = [chain for chain in found if os.path.basename(chain.path) == value]
+    if not found:
+        raise SystemExit(f"no backup {value or ''} for {facility}".replace("  ", " "))
+    return found[-1].path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backups, WAL archiving and point-in-time restore.")
+    parser.add_argument("--facility", choices=list(FACILITIES), default=DEFAULT_FACILITY)
+    commands = parser.add_subparsers(dest="command", required=True)
+    scheduled = commands.add_parser("schedule", help="take base backups and archive the WAL until stopped")
+    scheduled.add_argument("--every", type=int, default=BACKUP_EVERY, help="seconds between base backups")
+    scheduled.add_argument("--keep", type=int, default=KEEP_CHAINS, help="chains kept; older ones are deleted")
+    commands.add_parser("run", help="take one base backup")
+    commands.add_parser("list", help="list backup chains")
+    verified = commands.add_parser("verify", help="integrity_check a chain (default: the latest)")
+    verified.add_argument("chain", nargs="?")
+    restored = commands.add_parser("restore", help="rebuild the shard from a chain")
+    restored.add_argument("chain", help="chain directory or name, e.g. 20261018-120000")
+    restored.add_argument("--until", type=datetime.fromisoformat, help="local time to restore to, e.g. '2026-10-18 12:30'")
+    restored.add_argument("--to", help="database file to write (default: the facility's shard)")
+    restored.add_argument("--replace", action="store_true", help="overwrite an existing file; stop the app first")
+    args = parser.parse_args(argv)
+
+    use_facility(args.facility)
+    if args.command == "list":
+        for chain in chains(args.facility):
+            print(f"{os.path.basename(chain.path)}  base {chain.taken_at}  until {chain.until}  "
+                  f"{chain.segments} WAL segments  {chain.bytes / 2**20:.1f} MiB")
+        return 0
+    if args.command == "verify":
+        chain = _chain_arg(args.chain, args.facility)
+        problems = verify(chain)
+        for problem in problems:
+            print(problem)
+        print(f"{chain}: {'FAILED' if problems else 'ok'}")
+        return 1 if problems else 0
+    if args.command == "restore":
+        chain = _chain_arg(args.chain, args.facility)
+        target = args.to or database.database_path()
+        if os.path.exists(target) and not args.replace:
+            raise SystemExit(f"{target} exists; pass --replace to overwrite it (stop the app first)")
+        applied = restore(chain, target, args.until, args.replace)
+        print(f"restored {target} from {chain} with {applied} WAL segments")
+        return 0
+
+    init_db()
+
+    def report(result, pruned=0):
+        print(f"backed up {result.bytes / 2**20:.1f} MiB to {result.chain} in {result.seconds:.1f}s"
+              + (f", pruned {pruned} old chains" if pruned else ""), flush=True)
+
+    if args.command == "run":
+        report(backup(args.facility))
+        return 0
+    try:
+        schedule(args.every, args.keep, args.facility, progress=report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
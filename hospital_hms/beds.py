@@ -0,0 +1,299 @@
+import json
+import threading
+from collections import defaultdict
+from datetime import date, datetime
+
+import pandas as pd
+
+import cache
+from codes import code, day, frame
+from database import database_path, query, write
+from identity import resolve
+
+# Stale hints tried before the bed is picked from the database instead
+MAX_ATTEMPTS = 8
+
+
+class BedAllocationError(Exception):
+    pass
+
+
+def ward_key(ward):
+    return (ward or "").strip().lower()
+
+
+def is_icu(ward):
+    return "icu" in ward_key(ward)
+
+
+class FreeBedIndex:
+    # In-process map of ward -> vacant bed ids, one per shard. It is only a hint:
+    # every claim is re-checked with a conditional UPDATE inside the write transaction,
+    # and a miss falls back to the vacant beds in the database (see _claim()).
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shards = {}
+
+    def _wards(self):
+        path = database_path()
+        wards = self._shards.get(path)
+        if wards is None:
+            wards = self._shards[path] = defaultdict(set)
+            for bed_id, ward in query("SELECT bed_id, ward FROM Beds WHERE status = 'Vacant'"):
+                wards[ward_key(ward)].add(bed_id)
+        return wards
+
+    def reset(self):
+        with self._lock:
+            self._shards.pop(database_path(), None)
+
+    def take(self, department="", icu=False):
+        with self._lock:
+            wards = self._wards()
+            key = pick_ward(wards, department, icu)
+            return None if key is None else (wards[key].pop(), key)
+
+    def put(self, bed_id, ward):
+        with self._lock:
+            wards = self._shards.get(database_path())
+            if wards is not None:
+                wards[ward_key(ward)].add(bed_id)
+
+
+free_beds = FreeBedIndex()
+
+
+def pick_ward(wards, department, icu):
+    # Ward key to place in, or None: ICU patients only go to ICU wards; others to
+    # their department's ward, then one whose name overlaps it, then any general ward.
+    # The department's own ward is a single lookup; other wards are only scanned
+    # when it has no vacant bed.
+    wanted = ward_key(department)
+    if not icu and wanted and not is_icu(wanted) and wards.get(wanted):
+        return wanted
+    fallback = None
+    for key, beds in wards.items():
+        if not beds or is_icu(key) != icu:
+            continue
+        if icu or wanted and (wanted in key or key in wanted):
+            return key
+        if fallback is None:
+            fallback = key
+    return fallback
+
+
+def _vacant_bed(conn, department, icu):
+    # The best vacant bed as the write transaction sees it, from the Beds(status, ward) index
+    wards = defaultdict(set)
+    for bed_id, ward in conn.execute("SELECT bed_id, ward FROM Beds WHERE status = 'Vacant'"):
+        wards[ward_key(ward)].add(bed_id)
+    key = pick_ward(wards, department, icu)
+    return None if key is None else (min(wards[key]), key)
+
+
+def _claim(conn, department, icu):
+    # Take a hinted bed and mark it Occupied; hints another writer already took are dropped
+    for _ in range(MAX_ATTEMPTS):
+        hint = free_beds.take(department, icu)
+        if hint is None:
+            break
+        claimed = conn.execute(
+            "UPDATE Beds SET status = 'Occupied' WHERE bed_id = ? AND status = 'Vacant'", (hint[0],)
+        ).rowcount
+        if claimed:
+            return hint
+    # The index has no bed here or only stale ones: beds may have been added or freed
+    # elsewhere. The database decides, and the index is reloaded on next use.
+    free_beds.reset()
+    bed = _vacant_bed(conn, department, icu)
+    if bed is None:
+        raise BedAllocationError("No vacant ICU beds available!" if icu else "No vacant beds available!")
+    conn.execute("UPDATE Beds SET status = 'Occupied' WHERE bed_id = ?", (bed[0],))
+    return bed
+
+
+def _log(conn, bed_id, kind, status, patient_id=None):
+    # Appends to BedEvents with the bed's ward at this moment; the trigger keeps BedIntervals
+    conn.execute("""
+        INSERT INTO BedEvents (bed_id, patient_id, kind, status, ward, happened_at)
+        SELECT bed_id, ?, ?, ?, ward, ? FROM Beds WHERE bed_id = ?
+    """, (patient_id, kind, status, datetime.now().isoformat(sep=" ", timespec="seconds"), bed_id))
+
+
+def _admitted_bed(conn, patient_id):
+    row = conn.execute(
+        "SELECT bed_id FROM Patients WHERE id = ? AND status = 'Admitted'", (patient_id,)
+    ).fetchone()
+    if row is None:
+        raise BedAllocationError(f"Patient ID {patient_id} is not currently admitted.")
+    return row[0]
+
+
+def _vacate(conn, bed_id):
+    row = conn.execute("SELECT ward FROM Beds WHERE bed_id = ?", (bed_id,)).fetchone() if bed_id is not None else None
+    if row is None:
+        return None
+    conn.execute("UPDATE Beds SET status = 'Vacant' WHERE bed_id = ?", (bed_id,))
+    return bed_id, row[0]
+
+
+def admit(name, age, gender, admission_date, department, icu=False, weight_kg=None):
+    claimed = []
+
+    def run(conn):
+        claimed.append(_claim(conn, department, icu))
+        bed_id = claimed[0][0]
+        gender_code, admitted_on = code(conn, "Genders", gender), day(admission_date)
+        cursor = conn.execute(
+            "INSERT INTO Patients (name, age, gender, admission_date, status, department, bed_id, weight_kg, identity_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, age, gender_code, admitted_on, "Admitted", code(conn, "Departments", department), bed_id, weight_kg,
+             resolve(conn, name, age, gender_code, admitted_on))
+        )
+        ward = conn.execute("SELECT ward FROM Beds WHERE bed_id = ?", (bed_id,)).fetchone()[0]
+        _log(conn, bed_id, "admit", "Occupied", cursor.lastrowid)
+        return cursor.lastrowid, bed_id, ward
+
+    try:
+        return write(run)
+    except BaseException:
+        # The rollback left the bed Vacant, so it goes back into the index
+        if claimed:
+            free_beds.put(*claimed[0])
+        raise
+
+
+def discharge(patient_id, discharge_date=None):
+    discharge_date = discharge_date or date.today()
+
+    def run(conn):
+        bed_id = _admitted_bed(conn, patient_id)
+        conn.execute(
+            "UPDATE Patients SET status = 'Discharged', discharge_date = ? WHERE id = ?",
+            (day(discharge_date), patient_id)
+        )
+        released = _vacate(conn, bed_id)
+        if released:
+            _log(conn, bed_id, "discharge", "Vacant", patient_id)
+        return bed_id, released
+
+    bed_id, released = write(run)
+    # Freed beds only become allocatable once the transaction has committed
+    if released:
+        free_beds.put(*released)
+    return bed_id
+
+
+def transfer(patient_id, department=None, icu=False):
+    claimed = []
+
+    def run(conn):
+        old_bed = _admitted_bed(conn, patient_id)
+        target = department
+        if target is None:
+            target = conn.execute("""
+                SELECT d.name FROM Patients p LEFT JOIN Departments d ON d.id = p.department WHERE p.id = ?
+            """, (patient_id,)).fetchone()[0]
+        claimed.append(_claim(conn, target, icu))
+        new_bed = claimed[0][0]
+        conn.execute(
+            "UPDATE Patients SET bed_id = ?, department = ? WHERE id = ?",
+            (new_bed, code(conn, "Departments", target), patient_id)
+        )
+        released = _vacate(conn, old_bed)
+        if released:
+            _log(conn, old_bed, "transfer", "Vacant", patient_id)
+        _log(conn, new_bed, "transfer", "Occupied", patient_id)
+        ward = conn.execute("SELECT ward FROM Beds WHERE bed_id = ?", (new_bed,)).fetchone()[0]
+        return new_bed, ward, released
+
+    try:
+        new_bed, ward, released = write(run)
+    except BaseException:
+        if claimed:
+            free_beds.put(*claimed[0])
+        raise
+    if released:
+        free_beds.put(*released)
+    return new_bed, ward
+
+
+def add_bed(bed_id, ward, room, status):
+    def run(conn):
+        conn.execute("INSERT INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)", (bed_id, ward, room, status))
+        _log(conn, bed_id, "status", status)
+
+    write(run)
+    if status == "Vacant":
+        free_beds.put(bed_id, ward)
+
+
+def update_bed(bed_id, ward, room, status):
+    def run(conn):
+        if status == "Vacant" and conn.execute(
+            "SELECT 1 FROM Patients WHERE bed_id = ? AND status = 'Admitted'", (bed_id,)
+        ).fetchone():
+            raise BedAllocationError(f"Bed {bed_id} has an admitted patient; discharge or transfer them first.")
+        before = conn.execute("SELECT ward, status FROM Beds WHERE bed_id = ?", (bed_id,)).fetchone()
+        conn.execute("UPDATE Beds SET ward = ?, room = ?, status = ? WHERE bed_id = ?", (ward, room, status, bed_id))
+        # A ward change while occupied starts a new stay in the new ward
+        if before and tuple(before) != (ward, status):
+            _log(conn, bed_id, "status", status)
+
+    write(run)
+    # Ward or status may have moved the bed between buckets; rebuild lazily
+    free_beds.reset()
+
+
+BOARD_COLUMNS = ["Bed", "Ward", "Room", "Status", "Patient ID", "Patient", "Admitted"]
+# Fixed so a patch of a few rows (maybe none with a patient) concatenates cleanly with the board
+BOARD_DTYPES = {"Ward": "string", "Room": "string", "Status": pd.CategoricalDtype(["Vacant", "Occupied"]),
+                "Patient ID": "Int64", "Patient": "string", "Admitted": "datetime64[ns]"}
+PATIENT_COLUMNS = ["ID", "Name", "Age", "Gender", "Admission Date", "Department"]
+PATIENT_TYPES = {"Gender": "Genders", "Admission Date": "day", "Department": "Departments"}
+
+
+def board(bed_ids=None):
+    # The live bed board: every bed (or those in bed_ids) with its admitted patient.
+    # Read through the cache: sessions patching the same change share one query.
+    if bed_ids is None:
+        rows = cache.query("""
+            SELECT b.bed_id, b.ward, b.room, b.status, p.id, p.name, p.admission_date
+            FROM Beds b
+            LEFT JOIN Patients p ON p.bed_id = b.bed_id AND p.status = 'Admitted'
+        """)
+    else:
+        rows = cache.query("""
+            SELECT b.bed_id, b.ward, b.room, b.status, p.id, p.name, p.admission_date
+            FROM Beds b
+            LEFT JOIN Patients p ON p.bed_id = b.bed_id AND p.status = 'Admitted'
+            WHERE b.bed_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(bed_ids),))
+    return frame(rows, BOARD_COLUMNS, {"Admitted": "day"}).set_index("Bed").astype(BOARD_DTYPES)
+
+
+def board_affected(frame, changes):
+    # Beds to reload for a change feed delta: the changed beds, the beds showing
+    # a changed patient, and the beds changed patients are admitted to now
+    patients = changes.get("patients", set())
+    bed_ids = set(changes.get("beds", ())) | set(frame.index[frame["Patient ID"].isin(patients)])
+    if patients:
+        bed_ids.update(bed_id for (bed_id,) in cache.query("""
+            SELECT bed_id FROM Patients
+            WHERE id IN (SELECT value FROM json_each(?)) AND status = 'Admitted' AND bed_id IS NOT NULL
+        """, (json.dumps(sorted(patients)),)))
+    return bed_ids
+
+
+def admitted_patients(ids):
+    # Those of ids still admitted, as shown by the admitted patients list
+    rows = cache.query("""
+        SELECT id, name, age, gender, admission_date, department
+        FROM Patients
+        WHERE id IN (SELECT value FROM json_each(?)) AND status = 'Admitted'
+    """, (json.dumps(ids),))
+    return patient_frame(rows)
+
+
+def patient_frame(rows):
+    return frame(rows, PATIENT_COLUMNS, PATIENT_TYPES).set_index("ID")
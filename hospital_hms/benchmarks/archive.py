@@ -0,0 +1,84 @@
+# Archival throughput: generates a shard, archives everything past the
+# retention window and reports rows moved per second and the hot table sizes
+# before and after. Checks that DailyStats (the Dashboard) is unchanged, also
+# after a full rebuild, and that the history views still see every row.
+#
+#   cd hospital_hms && python -m benchmarks.archive [--visits 200000 --retention-days 365]
+
+import argparse
+import os
+import sys
+import tempfile
+from contextlib import closing
+
+import archive
+import database
+import datagen
+from migrations import migrate, rebuild_daily_stats
+
+TABLES = ["Patients", "PatientTests", "PatientInflow"]
+
+
+def counts(conn, tables):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+
+
+def daily_stats(conn):
+    return conn.execute("SELECT * FROM DailyStats ORDER BY stat_date, department, test_type").fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure hot/cold archival throughput.")
+    parser.add_argument("--visits", type=int, default=200000)
+    parser.add_argument("--beds", type=int, default=500)
+    parser.add_argument("--retention-days", type=int, default=archive.RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.db")
+        conn = database.open_connection(path)
+        migrate(conn)
+        datagen.populate(conn, args.visits, args.beds)
+        before, stats_before = counts(conn, TABLES), daily_stats(conn)
+        conn.close()
+        database.use_database(path)
+        database.init_db()
+
+        result = archive.archive(args.retention_days, args.batch_size, today=datagen.END_DATE)
+        moved = result.patients + result.tests + result.visits
+
+        with closing(database.open_connection(path)) as conn:
+            after, stats_after = counts(conn, TABLES), daily_stats(conn)
+            conn.execute("BEGIN")
+            rebuild_daily_stats(conn)
+            rebuilt = daily_stats(conn)
+            conn.rollback()
+        with closing(archive.open_archive(path)) as conn:
+            history = counts(conn, archive.HISTORY_VIEWS)
+        hot_size = os.path.getsize(path)
+        archive_size = os.path.getsize(archive.archive_path(path))
+        database.use_database(database.DB_PATH)
+
+    print(f"archived {result.patients} patients, {result.tests} tests, {result.visits} visits "
+          f"in {result.seconds:.2f}s ({moved / max(result.seconds, 1e-9):.0f} rows/s, batch {args.batch_size})")
+    for table in TABLES:
+        print(f"  {table:<14} hot rows {before[table]:>8} -> {after[table]:>8}")
+    print(f"  files: hot {hot_size / 2**20:.1f} MiB, archive {archive_size / 2**20:.1f} MiB")
+    failures = []
+    if stats_after != stats_before:
+        failures.append("DailyStats changed by archiving")
+    if rebuilt != stats_before:
+        failures.append("DailyStats rebuild differs after archiving")
+    for view, table in archive.HISTORY_VIEWS.items():
+        if history[view] != before[table]:
+            failures.append(f"{view} sees {history[view]} rows, expected {before[table]}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: dashboard totals unchanged, history views complete")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
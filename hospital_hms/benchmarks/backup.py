@@ -0,0 +1,176 @@
+# Online backup while beds are admitted and discharged: commit latency with no
+# backup running versus during a stepped base backup, backup throughput, then
+# WAL archiving under the same load with the archiver's checkpoints. Restores
+# the chain to a point in the middle of the load and to its end and compares
+# each with the shard as it was then. Fails on a mismatch, on an
+# integrity_check problem, or if the backup multiplies commit p99 by more than
+# MAX_P99_FACTOR.
+#
+#   cd hospital_hms && python -m benchmarks.backup [--visits 200000 --writes-per-second 200 --seconds 3]
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+# Connections must leave checkpoints to the archiver, as in the app under backup.py schedule
+os.environ["HMS_WAL_ARCHIVE"] = "1"
+
+import backup
+import beds
+import database
+import datagen
+from metrics import percentile
+from migrations import migrate
+
+MAX_P99_FACTOR = 3
+# Allowance on top of the factor, for scheduling noise on short baselines
+P99_SLACK_MS = 20
+TABLES = ["Patients", "Beds", "BedEvents"]
+
+
+def fingerprint(path):
+    digest = hashlib.sha256()
+    conn = database.open_connection(path)
+    try:
+        for table in TABLES:
+            for row in conn.execute(f"SELECT * FROM {table} ORDER BY rowid"):
+                digest.update(repr(row).encode())
+    finally:
+        conn.close()
+    return digest.hexdigest()
+
+
+def write_load(seed, rate, running, stopping, latencies, lock):
+    # latencies: (started, ms) for each admit or discharge
+    rng = random.Random(seed)
+    admitted = []
+    while not stopping.is_set():
+        if not running.wait(0.05):
+            continue
+        started = time.perf_counter()
+        try:
+            if rng.random() < 0.5 or not admitted:
+                patient_id, _, _ = beds.admit(f"backup load {seed}", 40, "Other", date.today(), "")
+                admitted.append(patient_id)
+            else:
+                beds.discharge(admitted.pop(rng.randrange(len(admitted))))
+        except beds.BedAllocationError:
+            pass
+        with lock:
+            latencies.append((started, (time.perf_counter() - started) * 1000))
+        time.sleep(rng.expovariate(rate))
+
+
+def between(latencies, start, end):
+    return [ms for started, ms in latencies if start <= started < end]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backup throughput and its effect on writers.")
+    parser.add_argument("--visits", type=int, default=200000)
+    parser.add_argument("--beds", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4, help="admit/discharge threads")
+    parser.add_argument("--writes-per-second", type=float, default=200, help="across all threads")
+    parser.add_argument("--seconds", type=float, default=3, help="length of each load phase")
+    parser.add_argument("--pages", type=int, default=backup.PAGES_PER_STEP, help="pages per backup step")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "backup.db")
+        conn = database.open_connection(path)
+        migrate(conn)
+        datagen.populate(conn, args.visits, args.beds)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        database.use_database(path)
+        database.init_db()
+        backup.BACKUP_DIR = os.path.join(tmp, "backups")
+
+        latencies, lock = [], threading.Lock()
+        running, stopping = threading.Event(), threading.Event()
+        threads = [
+            threading.Thread(target=write_load, args=(seed, args.writes_per_second / args.threads, running, stopping, latencies, lock))
+            for seed in range(args.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        running.set()
+
+        baseline_start = time.perf_counter()
+        time.sleep(args.seconds)
+        backup_start = time.perf_counter()
+        archiver = backup.Archiver(path, archive_wal=True)
+        result = archiver.new_chain(pages=args.pages)
+        backup_end = time.perf_counter()
+
+        # Archive on the schedule's interval while the load goes on; pause it
+        # halfway to note the shard as it was for a point-in-time restore
+        archived = {"bytes": 0}
+
+        def archive_for(seconds):
+            due = time.perf_counter() + seconds
+            while time.perf_counter() < due:
+                time.sleep(min(backup.ARCHIVE_SECONDS, max(due - time.perf_counter(), 0)))
+                archived["bytes"] += archiver.archive()
+
+        archive_start = time.perf_counter()
+        archive_for(args.seconds / 2)
+        running.clear()
+        time.sleep(0.1)
+        archiver.archive()
+        midpoint, middle = datetime.now(), fingerprint(path)
+        time.sleep(0.01)
+        running.set()
+        archive_for(args.seconds / 2)
+        archive_end = time.perf_counter()
+        stopping.set()
+        for thread in threads:
+            thread.join()
+        archiver.archive()
+        final = fingerprint(path)
+        archiver.close()
+
+        restore_start = time.perf_counter()
+        problems = backup.verify(result.chain)
+        verify_seconds = time.perf_counter() - restore_start
+        for label, until, expected in [("midpoint", midpoint, middle), ("end", None, final)]:
+            target = os.path.join(tmp, f"restored-{label}.db")
+            backup.restore(result.chain, target, until)
+            if fingerprint(target) != expected:
+                failures.append(f"restore to the {label} differs from the shard at that time")
+        segments = len(backup._segments(result.chain))
+        database.use_database(database.DB_PATH)
+
+    baseline = between(latencies, baseline_start, backup_start)
+    during = between(latencies, backup_start, backup_end)
+    archiving = between(latencies, archive_start, archive_end)
+    megabytes = result.bytes / 2**20
+    print(f"{args.threads} writer threads; base backup of {megabytes:.1f} MiB ({result.pages} pages) "
+          f"in {result.seconds:.2f}s = {megabytes / result.seconds:.1f} MiB/s, {args.pages} pages per step")
+    for label, samples in [("no backup", baseline), ("during backup", during), ("WAL archiving", archiving)]:
+        if samples:
+            print(f"  {label:<14} {len(samples):>6} commits  p50 {percentile(samples, 50):7.2f} ms  "
+                  f"p99 {percentile(samples, 99):7.2f} ms")
+    print(f"  archived {archived['bytes'] / 2**20:.1f} MiB of WAL frames in {segments} segments, "
+          f"{archiver.checkpoints} archiver checkpoints; verify took {verify_seconds:.2f}s")
+    failures += problems
+    if baseline and during:
+        allowed = percentile(baseline, 99) * MAX_P99_FACTOR + P99_SLACK_MS
+        if percentile(during, 99) > allowed:
+            failures.append(f"commit p99 during the backup {percentile(during, 99):.1f} ms > {allowed:.1f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# Concurrent admit/discharge/transfer stress run against the bed allocator.
+# Fails if a bed is ever double-booked or a discharge leaks capacity.
+#
+#   cd hospital_hms && python -m benchmarks.bed_stress [--threads 16 --operations 300] [--writer]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+import beds
+import database
+import writer
+
+WARDS = {"Ward A": 20, "Ward B": 20, "Cardiology": 10, "ICU": 6}
+DEPARTMENTS = ["Cardiology", "Ward A", "Ward B", "Orthopedics", ""]
+
+
+def provision(wards):
+    rows, bed_id = [], 1
+    for ward, count in wards.items():
+        for number in range(1, count + 1):
+            rows.append((bed_id, ward, f"{ward} {number}", "Vacant"))
+            bed_id += 1
+    database.executemany("INSERT INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)", rows)
+
+
+def worker(seed, operations, admitted, lock, counters):
+    rng = random.Random(seed)
+
+    def count(name):
+        with lock:
+            counters[name] += 1
+
+    for _ in range(operations):
+        with lock:
+            mine = list(admitted)
+        roll = rng.random()
+        try:
+            if roll < 0.5 or not mine:
+                icu = rng.random() < 0.1
+                patient_id, _, _ = beds.admit(f"patient {seed}", 40, "Other", date.today(), rng.choice(DEPARTMENTS), icu=icu)
+                with lock:
+                    admitted.add(patient_id)
+                count("admit")
+            else:
+                patient_id = rng.choice(mine)
+                with lock:
+                    # Only one thread may act on a given patient at a time
+                    if patient_id not in admitted:
+                        continue
+                    admitted.discard(patient_id)
+                if roll < 0.85:
+                    beds.discharge(patient_id)
+                    count("discharge")
+                else:
+                    try:
+                        beds.transfer(patient_id, rng.choice(DEPARTMENTS))
+                        count("transfer")
+                    finally:
+                        with lock:
+                            admitted.add(patient_id)
+        except beds.BedAllocationError:
+            count("full")
+
+
+def check_invariants():
+    problems = []
+    double = database.query("""
+        SELECT bed_id, COUNT(*) FROM Patients WHERE status = 'Admitted' GROUP BY bed_id HAVING COUNT(*) > 1
+    """)
+    if double:
+        problems.append(f"double-booked beds: {double}")
+    occupied = database.query_value("SELECT COUNT(*) FROM Beds WHERE status = 'Occupied'")
+    admitted = database.query_value("SELECT COUNT(*) FROM Patients WHERE status = 'Admitted'")
+    if occupied != admitted:
+        problems.append(f"{occupied} occupied beds but {admitted} admitted patients")
+    misplaced = database.query_value("""
+        SELECT COUNT(*) FROM Patients p JOIN Beds b ON b.bed_id = p.bed_id
+        WHERE p.status = 'Admitted' AND b.status != 'Occupied'
+    """)
+    if misplaced:
+        problems.append(f"{misplaced} admitted patients on beds not marked Occupied")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress the bed allocator with concurrent threads.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=300, help="operations per thread")
+    parser.add_argument("--writer", action="store_true", help="route writes through the group-commit writer")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.use_database(os.path.join(tmp, "stress.db"))
+        database.init_db()
+        provision(WARDS)
+        beds.free_beds.reset()
+        if args.writer:
+            writer.start()
+
+        admitted, lock = set(), threading.Lock()
+        counters = {"admit": 0, "discharge": 0, "transfer": 0, "full": 0}
+        threads = [
+            threading.Thread(target=worker, args=(seed, args.operations, admitted, lock, counters))
+            for seed in range(args.threads)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if args.writer:
+            writer.stop()
+        problems = check_invariants()
+        database.use_database(database.DB_PATH)
+
+    total = sum(counters.values())
+    print(f"{args.threads} threads, {total} operations in {elapsed:.2f}s ({total / elapsed:.0f} ops/s)")
+    print("  " + ", ".join(f"{name}: {count}" for name, count in counters.items()))
+    for problem in problems:
+        print(f"  FAIL {problem}")
+    print("OK" if not problems else f"{len(problems)} invariant violation(s)")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# Master patient index: generates a shard, archives past the retention window,
+# clears every link and times identity.link() over shard and archive. Checks
+# that a second run links nothing, that every link agrees with its record's
+# blocking keys, and compares patient timelines served from the identity
+# indexes with the same history found by matching names, both timed end to
+# end on the pooled archive connections the app uses.
+#
+#   cd hospital_hms && python -m benchmarks.identity [--visits 200000 --timelines 200]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import archive
+import database
+import datagen
+import identity
+import metrics
+from codes import frame
+from migrations import migrate
+from query_plans import explain, violations
+
+# The same history as identity.TIMELINE_SQL, found by name the way it had to be before
+BY_NAME_SQL = """
+    SELECT admission_date, 'Admitted', department, status, id, archived
+    FROM AllPatients WHERE name = ? COLLATE NOCASE
+    UNION ALL
+    SELECT discharge_date, 'Discharged', department, NULL, id, archived
+    FROM AllPatients WHERE name = ? COLLATE NOCASE AND discharge_date IS NOT NULL
+    UNION ALL
+    SELECT visit_date, 'Visit', department, notes, inflow_id, archived
+    FROM AllVisits WHERE name = ? COLLATE NOCASE
+    UNION ALL
+    SELECT t.test_date, 'Test', NULL, tt.name || ': ' || COALESCE(t.result, ''), t.test_id, t.archived
+    FROM AllTests t LEFT JOIN TestTypes tt ON tt.id = t.test_type
+    WHERE t.patient_id IN (SELECT id FROM AllPatients WHERE name = ? COLLATE NOCASE)
+    UNION ALL
+    SELECT admit_date, 'Bed admission', NULL, 'Bed ' || bed_number, admission_id, 0
+    FROM Admissions WHERE patient_name = ? COLLATE NOCASE
+"""
+
+
+def unlink(conn):
+    for schema in ("main", "archive"):
+        for table in identity.LINKED:
+            if schema == "main" or table in archive.ARCHIVED:
+                conn.execute(f"UPDATE {schema}.{table} SET identity_id = NULL")
+    conn.execute("DELETE FROM main.PatientIdentities")
+
+
+def mismatched_links(conn):
+    # Linked records whose name, gender or implied birth year disagree with their identity
+    bad = 0
+    for view in ("AllPatients", "AllVisits"):
+        date_col = "admission_date" if view == "AllPatients" else "visit_date"
+        for name, age, gender, day_number, key, identity_gender, born in conn.execute(f"""
+            SELECT r.name, r.age, r.gender, r.{date_col}, i.name_key, i.gender, i.birth_year
+            FROM {view} r JOIN PatientIdentities i ON i.mpi_id = r.identity_id
+        """):
+            implied = identity.birth_year(age, day_number)
+            if identity.name_key(name) != key:
+                bad += 1
+            elif implied is not None and gender is not None and (
+                    gender != identity_gender or abs(implied - born) > identity.BIRTH_YEAR_SLACK):
+                bad += 1
+    return bad
+
+
+def history_by_name(name):
+    # identity.timeline() with the history found by name instead
+    rows = archive.query(BY_NAME_SQL, (name,) * BY_NAME_SQL.count("?"))
+    history = frame(rows, identity.TIMELINE_COLUMNS, {"Date": "day", "Event": "category", "Department": "Departments"})
+    return history.sort_values("Date", ascending=False, kind="stable", ignore_index=True)
+
+
+def timed_ms(fn, value):
+    # Wall time of the whole call: pooled read, frame and sort
+    started = time.perf_counter()
+    rows = len(fn(value))
+    return (time.perf_counter() - started) * 1000, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the patient identity link job and timelines.")
+    parser.add_argument("--visits", type=int, default=200000)
+    parser.add_argument("--beds", type=int, default=500)
+    parser.add_argument("--retention-days", type=int, default=archive.RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=identity.BATCH_SIZE)
+    parser.add_argument("--timelines", type=int, default=200, help="identities whose timeline is timed")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "identity.db")
+        with closing(database.open_connection(path)) as conn:
+            migrate(conn)
+            datagen.populate(conn, args.visits, args.beds)
+        database.use_database(path)
+        database.init_db()
+        moved = archive.archive(args.retention_days, today=datagen.END_DATE)
+
+        with closing(archive.open_archive(path)) as conn:
+            conn.execute("BEGIN")
+            unlink(conn)
+            conn.commit()
+        result = identity.link(args.batch_size)
+        again = identity.link(args.batch_size)
+
+        with closing(archive.open_archive(path)) as conn:
+            bad = mismatched_links(conn)
+            rng = random.Random(0)
+            people = conn.execute("SELECT mpi_id, name FROM PatientIdentities").fetchall()
+            sample = rng.sample(people, min(args.timelines, len(people)))
+            problems = violations(" ".join(identity.TIMELINE_SQL.split()), explain(conn, identity.TIMELINE_SQL))
+        identity.timeline(sample[0][0])
+        indexed = [timed_ms(identity.timeline, mpi_id) for mpi_id, _ in sample]
+        by_name = [timed_ms(history_by_name, name) for _, name in sample]
+        database.use_database(database.DB_PATH)
+
+    print(f"{moved.patients} patients, {moved.tests} tests, {moved.visits} visits archived first")
+    print(f"link: {result.records} records -> {result.identities} identities, {result.unlinked} ambiguous left unlinked "
+          f"in {result.seconds:.2f}s ({result.records / max(result.seconds, 1e-9):.0f} records/s, batch {args.batch_size})")
+    print(f"second run: {again.records} records linked in {again.seconds:.2f}s")
+    for label, samples in (("timeline by identity", indexed), ("history by name", by_name)):
+        times = [ms for ms, _ in samples]
+        rows = sum(count for _, count in samples) / max(len(samples), 1)
+        print(f"  {label:<21} p50 {metrics.percentile(times, 50):8.2f}  p95 {metrics.percentile(times, 95):8.2f} ms"
+              f"  ({rows:.1f} rows each)")
+    speedup = metrics.percentile([ms for ms, _ in by_name], 50) / max(metrics.percentile([ms for ms, _ in indexed], 50), 1e-9)
+    print(f"  timeline {speedup:.0f}x faster at p50")
+    if again.records or again.identities:
+        failures.append(f"second run linked {again.records} records, created {again.identities} identities")
+    if bad:
+        failures.append(f"{bad} links disagree with their record's name, gender or birth year")
+    if problems:
+        failures.append(f"timeline plan scans: {'; '.join(problems)}")
+    if speedup < 1:
+        failures.append("timeline by identity is slower than matching names")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: link job idempotent, links consistent, timelines index-backed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# Live bed board under load: many sessions hold the board and refresh it on a
+# timer while admissions, discharges and transfers are committed. One watcher
+# serves them all; sessions only query for the beds a change touched. Fails if
+# any board differs from a fresh load at the end, or if the sessions together
+# loaded more than a tenth of the rows that reloading every tick would have.
+#
+#   cd hospital_hms && python -m benchmarks.live [--sessions 50 --seconds 6 --writes-per-second 5]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+import beds
+import database
+from cache import query_cache
+import datagen
+import live
+from migrations import migrate
+
+MAX_SHARE = 0.1
+
+
+def session(view, tick, stopping, ticks):
+    while not stopping.is_set():
+        view.refresh()
+        ticks.append(1)
+        time.sleep(tick)
+
+
+def write_load(rate, stopping, counters):
+    rng = random.Random(0)
+    admitted = [patient_id for (patient_id,) in database.query("SELECT id FROM Patients WHERE status = 'Admitted'")]
+    while not stopping.is_set():
+        roll = rng.random()
+        try:
+            if roll < 0.45 or not admitted:
+                patient_id, _, _ = beds.admit("Live Board", 40, "Other", date.today(), "")
+                admitted.append(patient_id)
+                counters["admit"] += 1
+            elif roll < 0.9:
+                beds.discharge(admitted.pop(rng.randrange(len(admitted))))
+                counters["discharge"] += 1
+            else:
+                beds.transfer(rng.choice(admitted))
+                counters["transfer"] += 1
+        except beds.BedAllocationError:
+            counters["full"] += 1
+        time.sleep(1 / rate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh many live bed boards while beds change.")
+    parser.add_argument("--visits", type=int, default=20000)
+    parser.add_argument("--beds", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=6)
+    parser.add_argument("--tick", type=float, default=live.POLL_SECONDS, help="seconds between a session's refreshes")
+    parser.add_argument("--writes-per-second", type=float, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "live.db")
+        conn = database.open_connection(path)
+        migrate(conn)
+        datagen.populate(conn, args.visits, args.beds)
+        conn.close()
+        database.use_database(path)
+        database.init_db()
+        watcher = live.start()
+
+        views = [live.LiveView(beds.board, beds.board_affected, ["beds", "patients"]) for _ in range(args.sessions)]
+        for view in views:
+            view.refresh()
+        initial = sum(view.rows_loaded for view in views)
+        cache_before = query_cache.stats()
+        counters = {"admit": 0, "discharge": 0, "transfer": 0, "full": 0}
+        ticks = []
+        stopping = threading.Event()
+        threads = [threading.Thread(target=session, args=(view, args.tick, stopping, ticks)) for view in views]
+        threads.append(threading.Thread(target=write_load, args=(args.writes_per_second, stopping, counters)))
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stopping.set()
+        for thread in threads:
+            thread.join()
+
+        cache_after = query_cache.stats()
+        feed = watcher.feed()
+        for view in views:
+            view.refresh(poll=True)
+        expected = beds.board()
+        stale = sum(not view.frame.equals(expected) for view in views)
+        live.stop()
+        database.use_database(database.DB_PATH)
+
+    rows = sum(view.rows_loaded for view in views) - initial
+    naive = len(ticks) * len(expected)
+    patches = sum(view.patches for view in views)
+    reloads = sum(view.reloads for view in views)
+    print(f"{args.sessions} sessions, {len(ticks)} refreshes in {args.seconds:.0f}s; "
+          f"{counters['admit']} admits, {counters['discharge']} discharges, {counters['transfer']} transfers")
+    print(f"  watcher: {feed.polls} data_version checks, {feed.reads} change log reads")
+    print(f"  sessions: {patches} patches, {reloads - len(views)} full reloads, "
+          f"{len(ticks) - patches} refreshes without a change")
+    print(f"  board reads: {cache_after['misses'] - cache_before['misses']} queries run, "
+          f"{cache_after['hits'] - cache_before['hits']} shared from the cache")
+    print(f"  rows loaded after the first load {rows} vs {naive} reloading every refresh ({rows / max(naive, 1):.1%})")
+    failures = []
+    if stale:
+        failures.append(f"{stale} of {len(views)} boards differ from a fresh load")
+    if rows > naive * MAX_SHARE:
+        failures.append(f"sessions loaded {rows / naive:.0%} of the rows reloading every refresh would")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
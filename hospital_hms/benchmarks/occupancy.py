@@ -0,0 +1,83 @@
+# Occupancy analytics over the generated years of bed events: point-in-time
+# lookups, the hourly timeline and heatmap over the whole history, and length
+# of stay. Checks the vectorised timeline against occupancy_at() at random
+# points and fails if a full-history timeline or heatmap takes over a second.
+#
+#   cd hospital_hms && python -m benchmarks.occupancy [--beds 1000 --points 100]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import database
+import datagen
+import occupancy
+from migrations import migrate
+
+LIMIT_SECONDS = 1.0
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time occupancy queries over years of bed events.")
+    parser.add_argument("--visits", type=int, default=20000)
+    parser.add_argument("--beds", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=100, help="random instants checked against the timeline")
+    args = parser.parse_args(argv)
+
+    start = datagen.END_DATE - timedelta(days=datagen.YEARS * 365)
+    end = datagen.END_DATE + timedelta(days=1)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "occupancy.db")
+        conn = database.open_connection(path)
+        migrate(conn)
+        counts = datagen.populate(conn, args.visits, args.beds)
+        stays = conn.execute("SELECT COUNT(*) FROM BedIntervals").fetchone()[0]
+        conn.close()
+        database.use_database(path)
+        database.init_db()
+
+        counts_by_hour, timeline_s = timed(occupancy.timeline, start, end)
+        _, heatmap_s = timed(occupancy.heatmap, start, end)
+        _, stay_s = timed(occupancy.length_of_stay, start, end)
+        rng = random.Random(0)
+        instants = [counts_by_hour.index[rng.randrange(len(counts_by_hour))] for _ in range(args.points)]
+        started = time.perf_counter()
+        mismatches = 0
+        for instant in instants:
+            point = occupancy.occupancy_at(instant).set_index("Ward")["Occupied"]
+            row = counts_by_hour.loc[instant]
+            if any(point.get(ward, 0) != row.get(ward, 0) for ward in set(point.index) | set(row.index)):
+                mismatches += 1
+        point_ms = (time.perf_counter() - started) * 1000 / max(len(instants), 1)
+        database.use_database(database.DB_PATH)
+
+    print(f"{counts['bed_events']} bed events, {stays} stays, {args.beds} beds over {datagen.YEARS} years")
+    print(f"  occupancy_at      {point_ms:8.2f} ms per instant ({args.points} instants)")
+    print(f"  hourly timeline   {timeline_s * 1000:8.1f} ms  ({len(counts_by_hour)} points x {counts_by_hour.shape[1]} wards)")
+    print(f"  weekday heatmap   {heatmap_s * 1000:8.1f} ms")
+    print(f"  length of stay    {stay_s * 1000:8.1f} ms")
+    if mismatches:
+        failures.append(f"timeline disagrees with occupancy_at() at {mismatches} of {args.points} instants")
+    for name, seconds in (("timeline", timeline_s), ("heatmap", heatmap_s)):
+        if seconds > LIMIT_SECONDS:
+            failures.append(f"{name} took {seconds:.2f}s, over {LIMIT_SECONDS:.0f}s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+# Per-page read benchmark: runs the queries and DataFrame builds behind each
+# app page against generated data and reports latency percentiles and peak
+# memory. Results are saved as JSON; pass an earlier file as --baseline to
+# flag regressions.
+#
+#   cd hospital_hms && python -m benchmarks.pages [--scale medium] [--db data/bench.db] [--baseline old.json]
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+import beds
+import codes
+import database
+import datagen
+import fulltext
+import stats
+import stock
+from cache import query, query_cache, query_one, query_value
+from metrics import percentile
+from migrations import migrate
+from pagination import fetch_page
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, "results")
+PERCENTILES = [50, 90, 95, 99]
+# p95 slowdown against the baseline that counts as a regression: relative, and
+# absolute so sub-millisecond jitter is not reported
+TOLERANCE = 0.25
+MIN_DELTA_MS = 1.0
+
+
+# Each page function mirrors the reads app.py makes for one render of that page
+def dashboard(period):
+    def render():
+        rollup = stats.load_rollup(*stats.period_bounds(datagen.END_DATE, period))
+        stats.totals(rollup)
+        if period != "Day":
+            stats.daily_trend(rollup, *stats.period_bounds(datagen.END_DATE, period))
+            stats.visits_by_department(rollup)
+        stats.tests_by_type(rollup)
+    return render
+
+
+def checkups():
+    page = fetch_page("visits")
+    codes.frame(page.rows, ["ID", "Name", "Age", "Gender", "Visit Date", "Department", "Notes"],
+                {"Gender": "Genders", "Visit Date": "day", "Department": "Departments"})
+    fetch_page("visits", page.last_key)
+    query_one("""
+        SELECT v.inflow_id, v.name, v.age, g.name, v.visit_date, d.name, v.notes
+        FROM PatientInflow v
+        LEFT JOIN Genders g ON g.id = v.gender
+        LEFT JOIN Departments d ON d.id = v.department
+        WHERE v.inflow_id = ?
+    """, (page.rows[0][0],))
+
+
+def tests():
+    query("""
+        SELECT id, name FROM Patients
+        WHERE name LIKE ? ESCAPE '\\'
+        ORDER BY name COLLATE NOCASE
+        LIMIT 50
+    """, ("Ra%",))
+    page = fetch_page("tests")
+    codes.frame(page.rows, ["Test ID", "Patient Name", "Test Type", "Date", "Result", "Patient ID"],
+                {"Test Type": "TestTypes", "Date": "day"})
+    query_one("""
+        SELECT t.test_id, p.name, tt.name, t.test_date, t.result, t.patient_id
+        FROM PatientTests t
+        JOIN Patients p ON t.patient_id = p.id
+        LEFT JOIN TestTypes tt ON tt.id = t.test_type
+        WHERE t.test_id = ?
+    """, (page.rows[0][0],))
+
+
+def patients():
+    page = fetch_page("admitted")
+    beds.patient_frame(page.rows)
+
+
+def bed_management():
+    query_value("SELECT COUNT(*) FROM Beds WHERE status = 'Vacant'")
+    page = fetch_page("beds", filters={"status": "Vacant", "ward": "ICU"})
+    pd.DataFrame(page.rows, columns=["bed_id", "ward", "room", "status"])
+
+
+def inventory():
+    page = fetch_page("inventory", filters={"name": fulltext.build_match("para")})
+    pd.DataFrame(page.rows, columns=["ID", "Item", "Qty", "Unit", "Reorder At"])
+    stock.low_stock()
+
+
+def search():
+    fulltext.search("fever", list(fulltext.SCOPES))
+
+
+PAGES = {
+    "dashboard_week": dashboard("Week"),
+    "dashboard_year": dashboard("Year"),
+    "patient_checkups": checkups,
+    "patient_tests": tests,
+    "patient_management": patients,
+    "bed_management": bed_management,
+    "inventory": inventory,
+    "search": search,
+}
+
+
+def measure(render, iterations, warmup, warm_cache):
+    for _ in range(warmup):
+        render()
+    samples = []
+    for _ in range(iterations):
+        if not warm_cache:
+            query_cache.clear()
+        started = time.perf_counter()
+        render()
+        samples.append((time.perf_counter() - started) * 1000)
+    # Memory is traced in a separate run so tracing overhead stays out of the timings
+    query_cache.clear()
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {f"p{pct}_ms": round(percentile(samples, pct), 3) for pct in PERCENTILES}
+    result.update(
+        mean_ms=round(sum(samples) / len(samples), 3),
+        max_ms=round(max(samples), 3),
+        peak_kb=round(peak / 1024, 1),
+    )
+    return result
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results["pages"].items():
+        previous = baseline.get("pages", {}).get(name)
+        if not previous:
+            continue
+        change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] if previous["p95_ms"] else 0.0
+        slower = current["p95_ms"] - previous["p95_ms"] > MIN_DELTA_MS
+        flag = "REGRESSED" if change > tolerance and slower else ""
+        print(f"  {name:<20} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({change:+.0%}) {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the reads behind each app page.")
+    parser.add_argument("--scale", choices=list(datagen.SCALES), default="small")
+    parser.add_argument("--visits", type=int, help="overrides the scale's visit count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="reuse (or create) this generated database instead of a temporary one")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--warm", action="store_true", help="keep the query cache between iterations")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/pages-SCALE-TIMESTAMP.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    scale = dict(datagen.SCALES[args.scale])
+    if args.visits:
+        scale["visits"] = args.visits
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "pages.db")
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            conn = database.open_connection(path)
+            migrate(conn)
+            datagen.populate(conn, scale["visits"], scale["beds"], args.seed)
+            conn.close()
+            print(f"generated {scale['visits']} visits, {scale['beds']} beds in {time.perf_counter() - started:.1f}s")
+        database.use_database(path)
+        database.init_db()
+
+        results = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "scale": args.scale,
+            "visits": scale["visits"],
+            "beds": scale["beds"],
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "warm_cache": args.warm,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pages": {},
+        }
+        for name in args.pages:
+            results["pages"][name] = stats_row = measure(PAGES[name], args.iterations, args.warmup, args.warm)
+            print(f"{name:<20} p50 {stats_row['p50_ms']:>8.2f}  p95 {stats_row['p95_ms']:>8.2f}  "
+                  f"p99 {stats_row['p99_ms']:>8.2f}  max {stats_row['max_ms']:>8.2f} ms  peak {stats_row['peak_kb']:>8.1f} KiB")
+        database.use_database(database.DB_PATH)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pages-{args.scale}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} page(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# Storage footprint of the compact columns: generates a shard, decodes a copy
+# of the tables holding day numbers and lookup codes back to the ISO text and
+# names they used to store (same indexes), and compares table plus index bytes
+# from dbstat and the pandas memory of the listings built from each.
+#
+#   cd hospital_hms && python -m benchmarks.storage [--visits 100000]
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from contextlib import closing
+
+import pandas as pd
+
+import codes
+import database
+import datagen
+from migrations import DAY_COLUMNS, LOOKUP_OF, migrate, name_sql
+
+TABLES = list(DAY_COLUMNS)
+
+
+def decode(conn, table):
+    # Copies table into the attached "legacy" database with dates and names as text
+    sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    values = []
+    for col in columns:
+        lookup = LOOKUP_OF.get((table, col))
+        if col in DAY_COLUMNS[table]:
+            values.append(f"date({col})")
+        elif lookup:
+            values.append(name_sql(lookup, col))
+        else:
+            values.append(col)
+            continue
+        sql = re.sub(rf"(\b{col}\s+)INTEGER\b", r"\1TEXT", sql, count=1)
+    conn.execute(re.sub(r"^\s*CREATE\s+TABLE\s+\S+", f"CREATE TABLE legacy.{table}", sql, count=1))
+    conn.execute(f"INSERT INTO legacy.{table} ({', '.join(columns)}) SELECT {', '.join(values)} FROM main.{table}")
+    for (index,) in conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    ).fetchall():
+        conn.execute(re.sub(r"(INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?)", r"\1legacy.", index, count=1))
+
+
+def sizes(conn, schema):
+    # table -> bytes of the table and its indexes
+    owners = dict(conn.execute(f"SELECT name, tbl_name FROM {schema}.sqlite_master WHERE type IN ('table', 'index')"))
+    totals = dict.fromkeys(TABLES, 0)
+    for name, size in conn.execute(f"SELECT name, SUM(pgsize) FROM dbstat('{schema}') GROUP BY name"):
+        if owners.get(name) in totals:
+            totals[owners[name]] += size
+    return totals
+
+
+def frames(conn, table):
+    # (frame of the text copy, frame of the compact table) with the same rows
+    columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    text = pd.DataFrame(conn.execute(f"SELECT * FROM legacy.{table}").fetchall(), columns=columns)
+    types = {col: "day" for col in DAY_COLUMNS[table]}
+    types.update({col: lookup for (source, col), lookup in LOOKUP_OF.items() if source == table})
+    typed = codes.frame(conn.execute(f"SELECT * FROM main.{table}").fetchall(), columns, types)
+    return text, typed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare storage of compact and text dates and names.")
+    parser.add_argument("--visits", type=int, default=100000)
+    parser.add_argument("--beds", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "storage.db")
+        with closing(database.open_connection(path)) as conn:
+            migrate(conn)
+            datagen.populate(conn, args.visits, args.beds)
+        database.use_database(path)
+        database.init_db()
+        with closing(database.open_connection(path)) as conn:
+            conn.execute("ATTACH DATABASE ? AS legacy", (os.path.join(tmp, "legacy.db"),))
+            conn.execute("BEGIN")
+            for table in TABLES:
+                decode(conn, table)
+            conn.commit()
+            conn.execute("VACUUM main")
+            compact, text = sizes(conn, "main"), sizes(conn, "legacy")
+            memory = {}
+            for table in TABLES:
+                before, after = frames(conn, table)
+                memory[table] = (before.memory_usage(deep=True).sum(), after.memory_usage(deep=True).sum())
+        database.use_database(database.DB_PATH)
+
+    failures = []
+    print(f"{'table':<14} {'text disk':>10} {'compact':>10} {'ratio':>6}   {'text frame':>10} {'typed':>10} {'ratio':>6}")
+    for table in TABLES:
+        before, after = memory[table]
+        print(f"{table:<14} {text[table] / 2**20:>8.2f}Mi {compact[table] / 2**20:>8.2f}Mi "
+              f"{text[table] / max(compact[table], 1):>5.2f}x   {before / 2**20:>8.2f}Mi {after / 2**20:>8.2f}Mi "
+              f"{before / max(after, 1):>5.2f}x")
+        if compact[table] > text[table]:
+            failures.append(f"{table} takes more disk compact than as text")
+        if after > before:
+            failures.append(f"{table} frame takes more memory typed than as text")
+    disk = sum(text.values()) / max(sum(compact.values()), 1)
+    frame = sum(before for before, _ in memory.values()) / max(sum(after for _, after in memory.values()), 1)
+    print(f"total: disk {disk:.2f}x smaller, frames {frame:.2f}x smaller")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: compact columns are smaller on disk and in memory")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
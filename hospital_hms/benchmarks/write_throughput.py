@@ -0,0 +1,127 @@
+# Form-submit write throughput: many concurrent sessions committing one
+# statement at a time on pooled connections ("direct", the behaviour without
+# the writer) versus the single-writer group-commit queue ("writer").
+#
+#   cd hospital_hms && python -m benchmarks.write_throughput [--sessions 32 --writes 200]
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import codes
+import database
+import datagen
+import writer
+from metrics import percentile
+from migrations import migrate
+
+MODES = ["direct", "writer"]
+
+
+def form_submit(rng, beds):
+    # One of the small single-statement writes the app's forms issue
+    roll = rng.random()
+    if roll < 0.4:
+        age, department = rng.randrange(90), rng.choice(datagen.DEPARTMENTS)
+        database.write(lambda conn: conn.execute(
+            "INSERT INTO PatientInflow (name, age, gender, visit_date, department, notes) VALUES (?, ?, ?, ?, ?, ?)",
+            ("Bench Patient", age, codes.code(conn, "Genders", "Other"), codes.day(datagen.END_DATE),
+             codes.code(conn, "Departments", department), "walk-in"),
+        ))
+    elif roll < 0.7:
+        patient_id, test_type = rng.randrange(1, 100), rng.choice(datagen.TEST_TYPES)
+        database.write(lambda conn: conn.execute(
+            "INSERT INTO PatientTests (patient_id, test_type, test_date, result) VALUES (?, ?, ?, ?)",
+            (patient_id, codes.code(conn, "TestTypes", test_type), codes.day(datagen.END_DATE), "pending review"),
+        ))
+    elif roll < 0.9:
+        database.execute(
+            "UPDATE Beds SET status = ? WHERE bed_id = ?",
+            (rng.choice(["Vacant", "Occupied"]), rng.randrange(1, beds + 1)),
+        )
+    else:
+        database.execute(
+            "INSERT INTO Inventory (item_name, quantity, unit) VALUES (?, ?, ?)",
+            ("Bench item", rng.randrange(100), "units"),
+        )
+
+
+def session(seed, writes, beds, latencies, errors, lock):
+    rng = random.Random(seed)
+    mine, failed = [], 0
+    for _ in range(writes):
+        started = time.perf_counter()
+        try:
+            form_submit(rng, beds)
+        except sqlite3.OperationalError:
+            failed += 1
+            continue
+        mine.append((time.perf_counter() - started) * 1000)
+    with lock:
+        latencies.extend(mine)
+        errors[0] += failed
+
+
+def run(mode, sessions, writes, beds, tmp):
+    path = os.path.join(tmp, f"{mode}.db")
+    conn = database.open_connection(path)
+    migrate(conn)
+    datagen.populate(conn, 10000, beds)
+    conn.close()
+    database.use_database(path)
+    database.init_db()
+    coordinator = writer.start() if mode == "writer" else None
+
+    latencies, errors, lock = [], [0], threading.Lock()
+    threads = [
+        threading.Thread(target=session, args=(seed, writes, beds, latencies, errors, lock))
+        for seed in range(sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    batch = coordinator.jobs / coordinator.batches if coordinator and coordinator.batches else 1.0
+    if coordinator:
+        writer.stop()
+    database.use_database(database.DB_PATH)
+    return {
+        "ops_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) if latencies else 0.0,
+        "p99_ms": percentile(latencies, 99) if latencies else 0.0,
+        "errors": errors[0],
+        "batch": batch,
+        "elapsed": elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare commit-per-statement writes with the group-commit writer.")
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent threads submitting forms")
+    parser.add_argument("--writes", type=int, default=200, help="writes per session")
+    parser.add_argument("--beds", type=int, default=500)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            results[mode] = result = run(mode, args.sessions, args.writes, args.beds, tmp)
+            print(f"{mode:<7} {result['ops_per_s']:>8.0f} writes/s  p50 {result['p50_ms']:>7.2f} ms  "
+                  f"p99 {result['p99_ms']:>8.2f} ms  locked errors {result['errors']}  "
+                  f"avg commit batch {result['batch']:.1f}  ({result['elapsed']:.2f}s)")
+    if len(results) == 2 and results["direct"]["ops_per_s"]:
+        print(f"writer / direct throughput: {results['writer']['ops_per_s'] / results['direct']['ops_per_s']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
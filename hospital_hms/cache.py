@@ -0,0 +1,149 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import database
+import metrics
+
+MAX_ENTRIES = 512
+# Total cached rows across entries; large results are evicted first by LRU order
+MAX_ROWS = 200000
+
+# Tables a SELECT reads from, including joins and subqueries
+READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+
+
+class _Watch:
+    # Change detection for one shard: a connection kept open for PRAGMA data_version
+    # and the TableVersions read after the last change
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = database.open_connection(path)
+        self.data_version = None
+        self.versions = {}
+        # Bumped when something wrote without going through the data layer
+        self.epoch = 0
+        # data_version checks; counted here rather than as query samples, one per lookup
+        self.checks = 0
+
+    def _read(self, sql):
+        started = time.perf_counter()
+        rows = self.conn.execute(sql).fetchall()
+        metrics.record_query(sql, started, len(rows), shard=self.path)
+        return rows
+
+    def refresh(self):
+        self.checks += 1
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            versions = dict(self._read("SELECT table_name, version FROM TableVersions"))
+            if self.data_version is not None and versions == self.versions:
+                self.epoch += 1
+            self.data_version = data_version
+            self.versions = versions
+
+    def snapshot(self, tables):
+        return self.epoch, tuple(self.versions.get(table, 0) for table in tables)
+
+
+class QueryCache:
+    # Process-wide read-through cache shared by every Streamlit session. Entries
+    # remember the version of each table they read; a write committed through
+    # database.transaction() bumps those versions in TableVersions. PRAGMA
+    # data_version tells us cheaply whether anything was committed since the
+    # last check, so the versions are only re-read after a write. Entries and
+    # versions are kept per shard.
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._watches = {}
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    def _watch(self, path):
+        watch = self._watches.get(path)
+        if watch is None:
+            watch = self._watches[path] = _Watch(path)
+        watch.refresh()
+        return watch
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+            _, (_, rows) = self._entries.popitem(last=False)
+            self._rows -= len(rows)
+            self.evictions += 1
+
+    def fetch(self, sql, params=()):
+        if database.in_transaction():
+            # Uncommitted rows must never reach other sessions
+            return database.query(sql, params)
+        started = time.perf_counter()
+        params = tuple(params)
+        path = database.database_path()
+        key = (path, sql, params)
+        tables = sorted({table.lower() for table in READ_TABLES.findall(sql)})
+        with self._lock:
+            # Taken before running the query: a write landing in between only costs a miss
+            snapshot = self._watch(path).snapshot(tables)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == snapshot:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.record_query(sql, started, len(entry[1]), cached=True)
+                    return list(entry[1])
+                del self._entries[key]
+                self._rows -= len(entry[1])
+                self.stale += 1
+            self.misses += 1
+        rows = tuple(database.query(sql, params))
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (snapshot, rows)
+                self._rows += len(rows)
+                self._evict()
+        return list(rows)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+            for watch in self._watches.values():
+                watch.conn.close()
+            self._watches.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "version_checks": sum(watch.checks for watch in self._watches.values()),
+            }
+
+
+query_cache = QueryCache()
+
+
+def query(sql, params=()):
+    return query_cache.fetch(sql, params)
+
+
+def query_one(sql, params=()):
+    rows = query_cache.fetch(sql, params)
+    return rows[0] if rows else None
+
+
+def query_value(sql, params=(), default=None):
+    row = query_one(sql, params)
+    return row[0] if row else default
@@ -0,0 +1,92 @@
+# Compact column values: dates are Julian day numbers and gender, department and
+# test type are codes into lookup tables (see migrations.LOOKUPS). frame() turns
+# result rows holding them into a DataFrame with datetime64 and categorical columns.
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from cache import query
+
+# Test types the app offers. Imports accept only these, so PatientTests.test_type
+# (NOT NULL) never meets a blank or unknown name.
+TEST_TYPES = ["Blood Test", "X-Ray", "Thyroid Test", "Urine Test", "Diabetes Test", "CT Scan", "MRI", "B12 Test"]
+# Julian day number less the proleptic Gregorian ordinal, and the day number of the Unix epoch
+ORDINAL_OFFSET = 1721425
+UNIX_EPOCH_DAY = 2440588
+
+
+def day(value):
+    # date / datetime / ISO text -> day number; None and "" stay None
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.toordinal() + ORDINAL_OFFSET
+
+
+def date_of(day_number):
+    return None if day_number is None else date.fromordinal(day_number - ORDINAL_OFFSET)
+
+
+def code(conn, lookup, name):
+    # Code for name inside a write transaction, adding the name if it is new
+    name = (name or "").strip()
+    if not name:
+        return None
+    row = conn.execute(f"SELECT id FROM {lookup} WHERE name = ?", (name,)).fetchone()
+    if row:
+        return row[0]
+    return conn.execute(f"INSERT INTO {lookup} (name) VALUES (?)", (name,)).lastrowid
+
+
+# lookup -> (rows, ids, categorical dtype) as last read; rebuilt when the rows change
+_dtypes = {}
+
+
+def names(lookup):
+    # (ids, categorical dtype of the names) in id order; cached until the lookup gains a name
+    rows = query(f"SELECT id, name FROM {lookup} ORDER BY id")
+    known = _dtypes.get(lookup)
+    if known is None or known[0] != rows:
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        known = _dtypes[lookup] = (rows, ids, pd.CategoricalDtype([row[1] for row in rows]))
+    return known[1], known[2]
+
+
+def _numbers(values):
+    # Day numbers or codes as floats, NaN for NULL
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def dates(values):
+    days = _numbers(values)
+    out = np.full(len(days), np.datetime64("NaT"), dtype="datetime64[s]")
+    known = ~np.isnan(days)
+    out[known] = (days[known] - UNIX_EPOCH_DAY).astype(np.int64).astype("datetime64[D]")
+    return out
+
+
+def categorical(values, lookup):
+    ids, dtype = names(lookup)
+    codes = _numbers(values)
+    position = np.minimum(np.searchsorted(ids, np.nan_to_num(codes)), max(len(ids) - 1, 0))
+    found = ~np.isnan(codes) & (len(ids) > 0)
+    found[found] &= ids[position[found]] == codes[found]
+    return pd.Categorical.from_codes(np.where(found, position, -1), dtype=dtype, validate=False)
+
+
+def frame(rows, columns, types=None):
+    # types: column -> "day" (day numbers to datetime64), a lookup table name
+    # (codes to a categorical of its names) or "category" (text to categorical).
+    # Columns are converted before the DataFrame is built, so no object copy is made.
+    data = dict(zip(columns, zip(*rows))) if rows else {column: np.array([], dtype=object) for column in columns}
+    for column, kind in (types or {}).items():
+        if kind == "day":
+            data[column] = dates(data[column])
+        elif kind == "category":
+            data[column] = pd.Categorical(data[column])
+        else:
+            data[column] = categorical(data[column], kind)
+    return pd.DataFrame(data, columns=columns)
@@ -1,38 +1,339 @@
-import sqlite3
-
-conn = sqlite3.connect("data/hospital.db", check_same_thread=False)
-cursor = conn.cursor()
-
-def create_tables():
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            age INTEGER,
-            gender TEXT,
-            admission_date TEXT,
-            discharge_date TEXT,
-            status TEXT,
-            bed_id INTEGER,
-            department TEXT
-        )
-    ''')
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Beds (
-        bed_id INTEGER PRIMARY KEY,
-        ward TEXT,
-        room TEXT,
-        status TEXT
-    )
-''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Inventory (
-            item_id INTEGER PRIMARY KEY,
-            item_name TEXT NOT NULL,
-            quantity INTEGER,
-            unit TEXT
-        )
-    ''')
-
-
-    conn.commit()
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from migrations import WRITE_DEPENDENTS, migrate
+
+
+def _facilities(spec):
+    # "Central=data/central.db, North=data/north.db" -> {"Central": "data/central.db", ...}
+    facilities = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, path = entry.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"HMS_FACILITIES entry {entry!r} is not NAME=PATH")
+        facilities[name.strip()] = path.strip()
+    return facilities
+
+
+# One database file (shard) per facility. Without HMS_FACILITIES there is a single
+# facility stored at HMS_DB_PATH; the first facility listed is the default.
+FACILITIES = _facilities(os.environ.get("HMS_FACILITIES", "")) or {
+    "Main": os.environ.get("HMS_DB_PATH", "data/hospital.db"),
+}
+DEFAULT_FACILITY = next(iter(FACILITIES))
+DB_PATH = FACILITIES[DEFAULT_FACILITY]
+
+# Connection tuning applied once per pooled connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -32000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+# With WAL archiving (backup.py schedule) only the archiver checkpoints, after it
+# has copied every committed frame; see backup.py
+WAL_ARCHIVING = os.environ.get("HMS_WAL_ARCHIVE") == "1"
+if WAL_ARCHIVING:
+    PRAGMAS += ("PRAGMA wal_autocheckpoint = 0",)
+
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256
+
+# Target table of an INSERT / REPLACE / UPDATE / DELETE statement
+WRITE_TARGET = re.compile(
+    r"^\s*(?:INSERT|REPLACE|UPDATE|DELETE)(?:\s+OR\s+\w+)?\s+(?:INTO\s+|FROM\s+)?([A-Za-z_]\w*)",
+    re.IGNORECASE,
+)
+
+
+def open_connection(path=DB_PATH):
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves (see transaction())
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    # setup(conn), if given, runs once on each connection the pool opens
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, setup=None):
+        self.path = path
+        self.size = size
+        self.setup = setup
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = open_connection(self.path)
+                if self.setup is not None:
+                    self.setup(conn)
+                self._created += 1
+                return conn
+        return self._idle.get()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+# Database path -> pool; each shard has its own connections, lock and WAL
+_pools = {}
+_pools_lock = threading.Lock()
+_default_path = DB_PATH
+# Per thread: the bound shard path, the held connection and the open transaction
+_local = threading.local()
+# Set by writer.start(): every write() then goes through the group-commit thread
+_writer = None
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+class WriteTracker:
+    # Connection wrapper handed out by transaction(); notes the tables each
+    # statement writes so their versions can be bumped on commit
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.tables = set()
+
+    def _note(self, sql):
+        match = WRITE_TARGET.match(sql)
+        if match:
+            table = match.group(1).lower()
+            self.tables.add(table)
+            self.tables.update(WRITE_DEPENDENTS.get(table, ()))
+
+    def execute(self, sql, params=()):
+        self._note(sql)
+        started = time.perf_counter()
+        cursor = self._conn.execute(sql, params)
+        metrics.record_query(sql, started, cursor.rowcount if cursor.rowcount >= 0 else None)
+        return cursor
+
+    def executemany(self, sql, rows):
+        self._note(sql)
+        started = time.perf_counter()
+        cursor = self._conn.executemany(sql, rows)
+        metrics.record_query(sql, started, cursor.rowcount)
+        return cursor
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def database_path():
+    return getattr(_local, "path", None) or _default_path
+
+
+def facility():
+    # Name of the facility this thread works on
+    path = database_path()
+    return next((name for name, shard in FACILITIES.items() if shard == path), None)
+
+
+def use_facility(name):
+    # Bind this thread to a facility's shard; Streamlit runs each session's script on its own thread
+    _local.path = FACILITIES[name] if name else None
+
+
+@contextmanager
+def at(path):
+    # Temporarily bind this thread to the shard at path
+    previous = getattr(_local, "path", None)
+    _local.path = path
+    try:
+        yield path
+    finally:
+        _local.path = previous
+
+
+def _pool():
+    path = database_path()
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def in_transaction():
+    return getattr(_local, "tracker", None) is not None
+
+
+def use_database(path):
+    # Point the default shard at another database file (CLI tools, benchmarks)
+    global _default_path
+    with _pools_lock:
+        pool = _pools.pop(_default_path, None)
+        if pool is not None:
+            pool.close()
+        _initialized.discard(_default_path)
+        _default_path = path
+
+
+def use_writer(writer):
+    global _writer
+    _writer = writer
+
+
+@contextmanager
+def connection():
+    # A thread keeps the same pooled connection for nested calls
+    held = getattr(_local, "conn", None)
+    if held is not None:
+        yield held
+        return
+    pool = _pool()
+    conn = pool.acquire()
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        pool.release(conn)
+
+
+@contextmanager
+def bound(conn):
+    # Make conn this thread's connection for nested connection()/transaction() calls
+    previous = getattr(_local, "conn", None)
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = previous
+
+
+@contextmanager
+def transaction(conn=None):
+    # conn: a connection the caller owns (the writer thread); defaults to the pool
+    with (bound(conn) if conn is not None else connection()) as conn:
+        tracker = getattr(_local, "tracker", None)
+        if tracker is not None:
+            yield tracker
+            return
+        tracker = _local.tracker = WriteTracker(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield tracker
+            # Committed in the same transaction so readers never see data newer than its version
+            conn.executemany("""
+                INSERT INTO TableVersions (table_name, version) VALUES (?, 1)
+                ON CONFLICT (table_name) DO UPDATE SET version = version + 1
+            """, [(table,) for table in sorted(tracker.tables)])
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _local.tracker = None
+        conn.commit()
+
+
+def query(sql, params=()):
+    started = time.perf_counter()
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    metrics.record_query(sql, started, len(rows))
+    return rows
+
+
+def query_one(sql, params=()):
+    started = time.perf_counter()
+    with connection() as conn:
+        row = conn.execute(sql, params).fetchone()
+    metrics.record_query(sql, started, int(row is not None))
+    return row
+
+
+def query_value(sql, params=(), default=None):
+    row = query_one(sql, params)
+    return row[0] if row else default
+
+
+def stream(sql, params=(), batch_size=50000):
+    # Yields rows in batches from a private connection: one read snapshot for the
+    # whole scan, and the shared pool stays free while a long read runs
+    path = database_path()
+    started = time.perf_counter()
+    rows = 0
+    conn = open_connection(path)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            rows += len(batch)
+            yield batch
+    finally:
+        conn.close()
+        # Timed from open to close, including the time the consumer spent on each batch
+        metrics.record_query(sql, started, rows, shard=path)
+
+
+def write(fn):
+    # Runs fn(conn) in a write transaction and returns its result. With the writer
+    # running the work is queued and group-committed with other sessions' writes;
+    # either way the result is only returned once it has committed.
+    if _writer is not None and not in_transaction():
+        return _writer.submit(fn).result()
+    with transaction() as conn:
+        return fn(conn)
+
+
+def execute(sql, params=()):
+    return write(lambda conn: conn.execute(sql, params))
+
+
+def executemany(sql, rows):
+    return write(lambda conn: conn.executemany(sql, rows))
+
+
+def init_facilities():
+    for path in FACILITIES.values():
+        with at(path):
+            init_db()
+
+
+def init_db():
+    # Run pending migrations once per process and shard, before any page touches the schema
+    path = database_path()
+    if path in _initialized:
+        return
+    with _init_lock:
+        if path not in _initialized:
+            with connection() as conn:
+                migrate(conn)
+            _initialized.add(path)
@@ -0,0 +1,247 @@
+# Deterministic synthetic data for benchmarks and plan checks. The same seed
+# and sizes always produce the same rows.
+#
+#   python datagen.py data/bench.db [--scale medium | --visits 250000 --beds 3000] [--seed 0]
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from codes import TEST_TYPES, date_of, day
+from database import open_connection
+from identity import backfill
+from migrations import (
+    create_indexes, create_triggers, drop_indexes, drop_triggers, intern_names, migrate, rebuild_bed_intervals,
+    rebuild_daily_stats, rebuild_search,
+)
+
+# Named sizes: visits and tests scale together; patients and admissions are a tenth
+SCALES = {
+    "small": {"visits": 10000, "beds": 500},
+    "medium": {"visits": 1000000, "beds": 5000},
+    "large": {"visits": 10000000, "beds": 20000},
+}
+CHUNK_SIZE = 100000
+INVENTORY_ITEMS = 2000
+# Generated dates cover the years before END_DATE
+END_DATE = date(2025, 12, 31)
+YEARS = 5
+
+DEPARTMENTS = ["Cardiology", "Orthopedics", "General Physician", "Pediatrics", "Neurology", "ENT"]
+WARDS = DEPARTMENTS + ["Ward A", "Ward B", "ICU"]
+GENDERS = ["Male", "Female", "Other"]
+FIRST_NAMES = [
+    "Aarav", "Priya", "Rahul", "Ananya", "Vikram", "Sneha", "Arjun", "Kavya", "Rohan", "Isha",
+    "Karan", "Meera", "Aditya", "Divya", "Sanjay", "Pooja", "Nikhil", "Lakshmi", "Ravi", "Neha",
+]
+LAST_NAMES = [
+    "Sharma", "Reddy", "Patel", "Iyer", "Gupta", "Nair", "Rao", "Singh", "Kumar", "Das",
+    "Menon", "Joshi", "Verma", "Pillai", "Chopra", "Bose", "Mehta", "Kapoor", "Shetty", "Varma",
+]
+NOTES = [
+    "fever and headache", "persistent cough", "sore throat", "routine checkup", "chest pain on exertion",
+    "knee pain after fall", "high blood pressure follow-up", "skin rash", "stomach ache and nausea",
+    "dizziness", "back pain", "ear infection", "seasonal allergy", "diabetes review", "sprained ankle",
+]
+RESULTS = ["normal", "within range", "elevated", "low", "abnormal, repeat advised", "pending review"]
+MEDICINES = [
+    "Paracetamol", "Ibuprofen", "Amoxicillin", "Cetirizine", "Metformin", "Omeprazole", "Azithromycin",
+    "Amlodipine", "Atorvastatin", "Pantoprazole", "Salbutamol", "Losartan", "Dolo", "Vitamin D3", "ORS",
+]
+FORMS = [("500mg tablets", "strips"), ("250mg syrup", "bottles"), ("injection", "vials"), ("cream", "tubes")]
+
+
+def sizes(visits, beds):
+    return {
+        "visits": visits,
+        "tests": visits,
+        "patients": max(visits // 10, 1),
+        "admissions": max(visits // 10, 1),
+        "beds": beds,
+        "inventory": INVENTORY_ITEMS,
+        "issues": max(visits // 10, 1),
+    }
+
+
+def _chunks(conn, sql, rows, chunk_size):
+    # One transaction per chunk keeps the WAL bounded on multi-million-row loads
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            conn.execute("BEGIN")
+            conn.executemany(sql, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.execute("BEGIN")
+        conn.executemany(sql, batch)
+        conn.commit()
+
+
+def _codes(conn, lookup, names):
+    intern_names(conn, lookup, "SELECT value FROM json_each(?)", (json.dumps(names),))
+    codes = dict(conn.execute(f"SELECT name, id FROM {lookup}"))
+    return [codes[name] for name in names]
+
+
+def populate(conn, visits, beds, seed=0, chunk_size=CHUNK_SIZE, end_date=END_DATE):
+    # conn must be migrated and empty. Indexes and triggers are dropped for the
+    # load and rebuilt once, together with DailyStats, the search indexes and the
+    # patient index links.
+    rng = random.Random(seed)
+    counts = sizes(visits, beds)
+    days = [(end_date - timedelta(days=offset)).isoformat() for offset in range(YEARS * 365)]
+    # Stored dates and names are day numbers and lookup codes; each list lines up with its source
+    day_numbers = [day(value) for value in days]
+    names = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+
+    conn.execute("BEGIN")
+    drop_triggers(conn)
+    drop_indexes(conn)
+    genders = _codes(conn, "Genders", GENDERS)
+    departments = _codes(conn, "Departments", DEPARTMENTS)
+    test_types = _codes(conn, "TestTypes", TEST_TYPES)
+    conn.commit()
+
+    # Inpatients each hold a distinct bed, so allocator invariants hold on generated data
+    patients = counts["patients"]
+    occupied = rng.sample(range(1, beds + 1), min(int(beds * 0.7), patients // 20))
+    admitted = dict(zip(rng.sample(range(patients), len(occupied)), occupied))
+    occupied = set(occupied)
+    ward_of = {bed_id: WARDS[(bed_id - 1) * len(WARDS) // beds] for bed_id in range(1, beds + 1)}
+
+    _chunks(conn, "INSERT INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)", (
+        (bed_id, ward_of[bed_id], f"{ward_of[bed_id]} {bed_id}", "Occupied" if bed_id in occupied else "Vacant")
+        for bed_id in range(1, beds + 1)
+    ), chunk_size)
+
+    def patient(index):
+        bed_id = admitted.get(index)
+        name, age, gender = rng.choice(names), rng.randrange(1, 95), rng.choice(genders)
+        # Rough growth curve for children, adult range after that
+        weight = round(rng.uniform(8, 14) + 3 * min(age, 14) if age < 16 else rng.uniform(45, 100), 1)
+        if bed_id is None:
+            admission = rng.choice(day_numbers)
+            return (name, age, gender, admission, admission, "Discharged", None, rng.choice(departments), weight)
+        # Current inpatients came in during the last two weeks
+        ward = ward_of[bed_id]
+        department = departments[DEPARTMENTS.index(ward)] if ward in DEPARTMENTS else rng.choice(departments)
+        return (name, age, gender, day_numbers[rng.randrange(14)], None, "Admitted", bed_id, department, weight)
+
+    _chunks(conn, """
+        INSERT INTO Patients (name, age, gender, admission_date, discharge_date, status, bed_id, department, weight_kg)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (patient(index) for index in range(patients)), chunk_size)
+
+    _chunks(conn, "INSERT INTO PatientInflow (name, age, gender, visit_date, department, notes) VALUES (?, ?, ?, ?, ?, ?)", (
+        (rng.choice(names), rng.randrange(1, 95), rng.choice(genders), rng.choice(day_numbers),
+         rng.choice(departments), rng.choice(NOTES))
+        for _ in range(visits)
+    ), chunk_size)
+
+    _chunks(conn, "INSERT INTO PatientTests (patient_id, test_type, test_date, result) VALUES (?, ?, ?, ?)", (
+        (rng.randrange(1, patients + 1), rng.choice(test_types), rng.choice(day_numbers), rng.choice(RESULTS))
+        for _ in range(counts["tests"])
+    ), chunk_size)
+
+    _chunks(conn, "INSERT INTO Admissions (patient_name, admit_date, discharge_date, bed_number, notes) VALUES (?, ?, ?, ?, ?)", (
+        (rng.choice(names), admit, admit, rng.randrange(1, beds + 1), rng.choice(NOTES))
+        for admit in (rng.choice(day_numbers) for _ in range(counts["admissions"]))
+    ), chunk_size)
+
+    # Stock is issued over the last 90 days on top of an opening balance, so each
+    # item's ledger sums to its quantity; about a tenth sit at or below reorder level
+    items = counts["inventory"]
+    stock = [rng.randrange(0, 1000) for _ in range(items)]
+    issues = [(rng.randrange(items), rng.randrange(1, 20), rng.choice(days[:90])) for _ in range(counts["issues"])]
+    opening = list(stock)
+    for index, quantity, _ in issues:
+        opening[index] += quantity
+
+    _chunks(conn, "INSERT INTO Inventory (item_id, item_name, quantity, unit, reorder_level) VALUES (?, ?, ?, ?, ?)", (
+        (index + 1, f"{MEDICINES[index % len(MEDICINES)]} {FORMS[index // len(MEDICINES) % len(FORMS)][0]} #{index + 1}",
+         stock[index], FORMS[index // len(MEDICINES) % len(FORMS)][1], rng.randrange(0, 200))
+        for index in range(items)
+    ), chunk_size)
+
+    opened = f"{days[90]} 08:00:00"
+    _chunks(conn, "INSERT INTO StockMovements (item_id, kind, quantity, moved_at, note) VALUES (?, ?, ?, ?, ?)", itertools.chain(
+        ((index + 1, "adjustment", quantity, opened, "opening balance") for index, quantity in enumerate(opening) if quantity),
+        ((index + 1, "issue", -quantity, f"{moved_on} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00", None)
+         for index, quantity, moved_on in issues),
+    ), chunk_size)
+
+    # Years of stays on every bed, ending in the current occupancy: occupied beds
+    # hold their admitted patient from admission, earlier stays are discharged ones
+    current = {bed_id: (patient_id, admitted_on) for bed_id, patient_id, admitted_on in conn.execute(
+        "SELECT bed_id, id, admission_date FROM Patients WHERE status = 'Admitted'"
+    )}
+    history_start = datetime.fromisoformat(days[-1])
+    events = [0]
+
+    def bed_events():
+        for bed_id in range(1, beds + 1):
+            ward = ward_of[bed_id]
+            until = datetime.combine(date_of(current[bed_id][1]) if bed_id in current else end_date, datetime.min.time())
+            at = history_start + timedelta(hours=rng.randrange(72))
+            while True:
+                stay = timedelta(hours=rng.randrange(12, 288))
+                if at + stay >= until:
+                    break
+                patient_id = rng.randrange(1, patients + 1)
+                yield bed_id, patient_id, "admit", "Occupied", ward, str(at)
+                at += stay
+                yield bed_id, patient_id, "discharge", "Vacant", ward, str(at)
+                at += timedelta(hours=rng.randrange(2, 480))
+                events[0] += 2
+            if bed_id in current:
+                yield bed_id, current[bed_id][0], "admit", "Occupied", ward, str(until)
+                events[0] += 1
+
+    _chunks(conn, "INSERT INTO BedEvents (bed_id, patient_id, kind, status, ward, happened_at) VALUES (?, ?, ?, ?, ?, ?)",
+            bed_events(), chunk_size)
+    counts["bed_events"] = events[0]
+
+    conn.execute("BEGIN")
+    create_indexes(conn)
+    backfill(conn)
+    rebuild_daily_stats(conn)
+    rebuild_bed_intervals(conn)
+    rebuild_search(conn)
+    create_triggers(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill a database with deterministic synthetic records.")
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--visits", type=int, help="overrides the scale's visit count")
+    parser.add_argument("--beds", type=int, help="overrides the scale's bed count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists; generated data goes into a fresh database")
+    scale = SCALES[args.scale]
+    conn = open_connection(args.path)
+    migrate(conn)
+    started = time.perf_counter()
+    counts = populate(conn, args.visits or scale["visits"], args.beds or scale["beds"], args.seed, args.chunk_size)
+    conn.close()
+    summary = ", ".join(f"{count} {table}" for table, count in counts.items())
+    print(f"{args.path}: {summary} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
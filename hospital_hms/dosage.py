@@ -0,0 +1,139 @@
+# Dosage guidance from the DosageRules bands. Each medicine's rules compile to
+# sorted lower bounds: one patient is looked up with bisect, a whole ward at
+# once with numpy.searchsorted over the same bounds.
+
+from bisect import bisect_right
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cache import query
+from database import write
+
+# Rules for this medicine name apply to any medicine without rules of its own
+ANY_MEDICINE = "*"
+# Weights above this share the top weight band; keeps the flattened keys ordered
+MAX_WEIGHT_KG = 1000.0
+
+Guidance = namedtuple("Guidance", ["band", "guidance"])
+
+
+def _key(position, weight_kg):
+    # Orders rules by age band, then by weight within the band
+    return position * (MAX_WEIGHT_KG + 1) + min(weight_kg, MAX_WEIGHT_KG)
+
+
+class Bands:
+    # rules: (min_age, min_weight_kg, band, guidance) rows for one medicine
+
+    def __init__(self, rules):
+        rules = sorted(rules)
+        self.ages = sorted({rule[0] for rule in rules})
+        positions = [bisect_right(self.ages, rule[0]) - 1 for rule in rules]
+        self.keys = [_key(position, rule[1]) for position, rule in zip(positions, rules)]
+        # First rule of each age band, used when a weight is below every weight bound
+        self.starts = [positions.index(position) for position in range(len(self.ages))]
+        self.bands = [rule[2] for rule in rules]
+        self.guidance = [rule[3] for rule in rules]
+
+    def lookup(self, age, weight_kg=None):
+        position = bisect_right(self.ages, age) - 1
+        if position < 0:
+            return None
+        index = bisect_right(self.keys, _key(position, weight_kg or 0)) - 1
+        index = max(index, self.starts[position])
+        return Guidance(self.bands[index], self.guidance[index])
+
+    def lookup_many(self, ages, weights_kg):
+        # Vectorised lookup: float arrays in (NaN = unknown), rule indexes out, -1 where
+        # the age is unknown or below every band
+        positions = np.searchsorted(self.ages, ages, side="right") - 1
+        covered = (positions >= 0) & ~np.isnan(ages)
+        positions = np.clip(positions, 0, None)
+        weights = np.clip(np.nan_to_num(weights_kg, nan=0.0), 0, MAX_WEIGHT_KG)
+        index = np.searchsorted(self.keys, positions * (MAX_WEIGHT_KG + 1) + weights, side="right") - 1
+        index = np.maximum(index, np.asarray(self.starts)[positions])
+        return np.where(covered, index, -1)
+
+
+_compiled = None
+
+
+def rule_sets():
+    # medicine (lower case) -> Bands; recompiled only when DosageRules changes
+    global _compiled
+    rows = query("""
+        SELECT medicine, min_age, min_weight_kg, band, guidance
+        FROM DosageRules
+        ORDER BY medicine, min_age, min_weight_kg
+    """)
+    compiled = _compiled
+    if compiled is None or compiled[0] != rows:
+        by_medicine = {}
+        for medicine, *rule in rows:
+            by_medicine.setdefault(medicine.lower(), []).append(rule)
+        compiled = _compiled = (rows, {medicine: Bands(rules) for medicine, rules in by_medicine.items()})
+    return compiled[1]
+
+
+def _candidates(medicine):
+    # The medicine's own bands first, then the catch-all bands
+    sets = rule_sets()
+    names = [medicine.strip().lower(), ANY_MEDICINE] if medicine else [ANY_MEDICINE]
+    return [sets[name] for name in names if name in sets]
+
+
+def advise(medicine, age, weight_kg=None):
+    for bands in _candidates(medicine):
+        found = bands.lookup(age, weight_kg)
+        if found:
+            return found
+    return None
+
+
+def advise_admitted(medicine):
+    # Guidance for every admitted patient in one pass over numpy arrays
+    df = pd.DataFrame(query("""
+        SELECT p.id, p.name, p.age, p.weight_kg, b.ward, p.bed_id
+        FROM Patients p
+        LEFT JOIN Beds b ON b.bed_id = p.bed_id
+        WHERE p.status = 'Admitted'
+    """), columns=["ID", "Name", "Age", "Weight (kg)", "Ward", "Bed"])
+    ages = pd.to_numeric(df["Age"], errors="coerce").to_numpy(dtype=float)
+    weights = pd.to_numeric(df["Weight (kg)"], errors="coerce").to_numpy(dtype=float)
+    bands = np.full(len(df), None, dtype=object)
+    guidance = np.full(len(df), None, dtype=object)
+    unresolved = np.ones(len(df), dtype=bool)
+    for rules in _candidates(medicine):
+        index = rules.lookup_many(ages, weights)
+        hit = unresolved & (index >= 0)
+        bands[hit] = np.asarray(rules.bands, dtype=object)[index[hit]]
+        guidance[hit] = np.asarray(rules.guidance, dtype=object)[index[hit]]
+        unresolved &= ~hit
+    df["Band"] = bands
+    df["Guidance"] = guidance
+    return df.sort_values(["Ward", "Bed"], ignore_index=True)
+
+
+def save_rules(rules):
+    # rules: (medicine, min_age, min_weight_kg, band, guidance) rows replacing the table
+    # in one transaction; rows missing a medicine, age or guidance are dropped
+    cleaned = {}
+    for medicine, min_age, min_weight_kg, band, guidance in rules:
+        if not isinstance(medicine, str) or not medicine.strip() or not isinstance(guidance, str) or pd.isna(min_age):
+            continue
+        min_weight_kg = 0.0 if pd.isna(min_weight_kg) else float(min_weight_kg)
+        band = band if isinstance(band, str) else ""
+        cleaned[(medicine.strip().lower(), float(min_age), min_weight_kg)] = (
+            medicine.strip(), float(min_age), min_weight_kg, band.strip(), guidance.strip()
+        )
+
+    def run(conn):
+        conn.execute("DELETE FROM DosageRules")
+        conn.executemany(
+            "INSERT INTO DosageRules (medicine, min_age, min_weight_kg, band, guidance) VALUES (?, ?, ?, ?, ?)",
+            list(cleaned.values())
+        )
+    write(run)
+    return len(cleaned)
@@ -0,0 +1,217 @@
+# Streaming export of tables to CSV or Parquet. Rows are pulled from a
+# dedicated connection in fixed-size batches, so memory stays bounded no
+# matter how large the table is.
+#
+#   python export.py visits visits.parquet [--start 2024-01-01 --end 2024-12-31] [--department ER]
+
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import codes
+import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+BATCH_SIZE = 50000
+FORMATS = ["csv", "parquet"]
+MIME_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Exportable tables. "date" is the day-number column the date range applies to;
+# "order" must be index-backed so a filtered export is a range scan without a
+# temp sort. Files carry ISO dates and lookup names, not day numbers and codes.
+EXPORTS = {
+    "visits": {
+        "select": """
+            SELECT v.inflow_id, v.name, v.age, g.name, date(v.visit_date), d.name, v.notes
+            FROM PatientInflow v
+            LEFT JOIN Genders g ON g.id = v.gender
+            LEFT JOIN Departments d ON d.id = v.department
+        """,
+        "columns": [("inflow_id", "int"), ("name", "text"), ("age", "int"), ("gender", "text"),
+                    ("visit_date", "text"), ("department", "text"), ("notes", "text")],
+        "date": "v.visit_date",
+        "filters": {"department": "v.department IN (SELECT id FROM Departments WHERE name = ? COLLATE NOCASE)"},
+        "order": "v.visit_date",
+    },
+    "tests": {
+        "select": """
+            SELECT t.test_id, t.patient_id, p.name, tt.name, date(t.test_date), t.result
+            FROM PatientTests t
+            LEFT JOIN Patients p ON p.id = t.patient_id
+            LEFT JOIN TestTypes tt ON tt.id = t.test_type
+        """,
+        "columns": [("test_id", "int"), ("patient_id", "int"), ("patient_name", "text"),
+                    ("test_type", "text"), ("test_date", "text"), ("result", "text")],
+        "date": "t.test_date",
+        "filters": {"test_type": "t.test_type IN (SELECT id FROM TestTypes WHERE name = ?)"},
+        "order": "t.test_date",
+    },
+    "patients": {
+        "select": """
+            SELECT p.id, p.name, p.age, g.name, date(p.admission_date), date(p.discharge_date), p.status,
+                   p.bed_id, d.name, p.weight_kg
+            FROM Patients p
+            LEFT JOIN Genders g ON g.id = p.gender
+            LEFT JOIN Departments d ON d.id = p.department
+        """,
+        "columns": [("id", "int"), ("name", "text"), ("age", "int"), ("gender", "text"),
+                    ("admission_date", "text"), ("discharge_date", "text"), ("status", "text"),
+                    ("bed_id", "int"), ("department", "text"), ("weight_kg", "real")],
+        "date": "p.admission_date",
+        "filters": {
+            "department": "p.department IN (SELECT id FROM Departments WHERE name = ? COLLATE NOCASE)",
+            "status": "p.status = ?",
+        },
+        "order": "p.id",
+    },
+    "inventory": {
+        "select": "SELECT item_id, item_name, quantity, unit, reorder_level FROM Inventory",
+        "columns": [
+            ("item_id", "int"), ("item_name", "text"), ("quantity", "int"), ("unit", "text"), ("reorder_level", "int"),
+        ],
+        "order": "item_id",
+    },
+    "beds": {
+        "select": "SELECT bed_id, ward, room, status FROM Beds",
+        "columns": [("bed_id", "int"), ("ward", "text"), ("room", "text"), ("status", "text")],
+        "filters": {"ward": "ward = ? COLLATE NOCASE", "status": "status = ?"},
+        "order": "bed_id",
+    },
+}
+
+
+def formats():
+    return FORMATS if pa is not None else ["csv"]
+
+
+def export_sql(kind, start=None, end=None, filters=None):
+    # filters: {filter name: value}; None values are ignored
+    spec = EXPORTS[kind]
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - set(spec.get("filters", {}))
+    if unknown:
+        raise ValueError(f"{kind} cannot be filtered by {', '.join(sorted(unknown))}")
+    predicates, params = [], []
+    if start is not None or end is not None:
+        if "date" not in spec:
+            raise ValueError(f"{kind} has no date to filter on")
+        if start is not None:
+            predicates.append(f"{spec['date']} >= ?")
+            params.append(codes.day(start))
+        if end is not None:
+            predicates.append(f"{spec['date']} <= ?")
+            params.append(codes.day(end))
+    for key, predicate in spec.get("filters", {}).items():
+        if key in filters:
+            predicates.append(predicate)
+            params.append(filters[key])
+    sql = " ".join(spec["select"].split())
+    if predicates:
+        sql += " WHERE " + " AND ".join(predicates)
+    return sql + f" ORDER BY {spec['order']}", params
+
+
+def iter_batches(kind, start=None, end=None, filters=None, batch_size=BATCH_SIZE):
+    sql, params = export_sql(kind, start, end, filters)
+    yield from database.stream(sql, params, batch_size)
+
+
+def write_csv(batches, columns, out):
+    writer = csv.writer(out)
+    writer.writerow([name for name, _ in columns])
+    written = 0
+    for batch in batches:
+        writer.writerows(batch)
+        written += len(batch)
+    return written
+
+
+def write_parquet(batches, columns, out):
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    types = {"int": pa.int64(), "real": pa.float64(), "text": pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    written = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        # One row group per batch
+        for batch in batches:
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            written += len(batch)
+        if not written:
+            writer.write_table(schema.empty_table())
+    return written
+
+
+def export(kind, out, fmt="csv", start=None, end=None, filters=None, batch_size=BATCH_SIZE):
+    # out: binary file object or path; returns the number of rows written
+    batches = iter_batches(kind, start, end, filters, batch_size)
+    columns = EXPORTS[kind]["columns"]
+    if fmt == "parquet":
+        return write_parquet(batches, columns, out)
+    if fmt != "csv":
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if isinstance(out, str):
+        with open(out, "w", newline="", encoding="utf-8") as f:
+            return write_csv(batches, columns, f)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    try:
+        return write_csv(batches, columns, text)
+    finally:
+        text.detach()
+
+
+def export_to_tempfile(kind, fmt="csv", start=None, end=None, filters=None):
+    # Spools to disk rather than memory; used for browser downloads
+    out = tempfile.TemporaryFile()
+    export(kind, out, fmt, start, end, filters)
+    out.seek(0)
+    return out
+
+
+def file_name(kind, fmt, start=None, end=None):
+    parts = [kind] + [day.isoformat() for day in (start, end) if day is not None]
+    return "_".join(parts) + f".{fmt}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a table to CSV or Parquet in bounded memory.")
+    parser.add_argument("kind", choices=list(EXPORTS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    for name in sorted({key for spec in EXPORTS.values() for key in spec.get("filters", {})}):
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--facility", choices=list(database.FACILITIES), default=database.DEFAULT_FACILITY)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if os.path.splitext(args.path)[1].lower() == ".parquet" else "csv")
+    filters = {key: getattr(args, key) for key in EXPORTS[args.kind].get("filters", {})}
+    extra = [key for spec in EXPORTS.values() for key in spec.get("filters", {})
+             if getattr(args, key) is not None and key not in filters]
+    if extra:
+        parser.error(f"{args.kind} cannot be filtered by {', '.join(sorted(set(extra)))}")
+
+    database.use_facility(args.facility)
+    database.init_db()
+    started = time.perf_counter()
+    written = export(args.kind, args.path, fmt, args.start, args.end, filters, args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"{written} {args.kind} rows written to {args.path} in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
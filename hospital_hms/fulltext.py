@@ -0,0 +1,77 @@
+import re
+from collections import namedtuple
+
+from cache import query
+
+RESULTS_PER_PAGE = 20
+
+Hit = namedtuple("Hit", ["scope", "record_id", "title", "snippet", "rank"])
+
+# One ranked FTS5 query per searchable record type; each yields the Hit columns.
+# The inner ORDER BY rank LIMIT lets FTS5 keep only the top matches per scope.
+SCOPES = {
+    "Visits": """
+        SELECT 'Visits', v.inflow_id, v.name || ' – ' || COALESCE(date(v.visit_date), '') || ' (' || COALESCE(d.name, '') || ')',
+               m.snip, m.rank
+        FROM (SELECT rowid, rank, snippet(VisitsFTS, -1, '**', '**', '…', 12) AS snip
+              FROM VisitsFTS WHERE VisitsFTS MATCH ? ORDER BY rank LIMIT ?) m
+        JOIN PatientInflow v ON v.inflow_id = m.rowid
+        LEFT JOIN Departments d ON d.id = v.department
+    """,
+    "Tests": """
+        SELECT 'Tests', t.test_id, COALESCE(p.name, 'Unknown patient') || ' – ' || COALESCE(tt.name, '') || ' on ' || COALESCE(date(t.test_date), ''),
+               m.snip, m.rank
+        FROM (SELECT rowid, rank, snippet(TestsFTS, -1, '**', '**', '…', 12) AS snip
+              FROM TestsFTS WHERE TestsFTS MATCH ? ORDER BY rank LIMIT ?) m
+        JOIN PatientTests t ON t.test_id = m.rowid
+        LEFT JOIN Patients p ON p.id = t.patient_id
+        LEFT JOIN TestTypes tt ON tt.id = t.test_type
+    """,
+    "Patients": """
+        SELECT 'Patients', p.id, p.name || ' (ID: ' || p.id || ', ' || COALESCE(p.status, '') || ')',
+               m.snip, m.rank
+        FROM (SELECT rowid, rank, snippet(PatientsFTS, -1, '**', '**', '…', 12) AS snip
+              FROM PatientsFTS WHERE PatientsFTS MATCH ? ORDER BY rank LIMIT ?) m
+        JOIN Patients p ON p.id = m.rowid
+    """,
+    "Inventory": """
+        SELECT 'Inventory', i.item_id, i.item_name || ' (' || COALESCE(i.quantity, 0) || ' ' || COALESCE(i.unit, '') || ')',
+               m.snip, m.rank
+        FROM (SELECT rowid, rank, snippet(InventoryFTS, -1, '**', '**', '…', 12) AS snip
+              FROM InventoryFTS WHERE InventoryFTS MATCH ? ORDER BY rank LIMIT ?) m
+        JOIN Inventory i ON i.item_id = m.rowid
+    """,
+}
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def build_match(text):
+    # "quoted words" become phrases, bare words become prefix terms; all are ANDed
+    terms = []
+    for phrase, word in _TERM.findall(text):
+        if phrase:
+            tokens = _WORD.findall(phrase)
+            if tokens:
+                terms.append('"' + " ".join(tokens) + '"')
+        else:
+            terms.extend(f'"{token}"*' for token in _WORD.findall(word))
+    return " ".join(terms)
+
+
+def search_sql(scopes=None):
+    selects = [" ".join(SCOPES[scope].split()) for scope in scopes or SCOPES]
+    return " UNION ALL ".join(selects) + " ORDER BY 5 LIMIT ? OFFSET ?"
+
+
+def search(text, scopes=None, page=0, per_page=RESULTS_PER_PAGE):
+    # Returns one page of hits (best first) and whether another page follows
+    match = build_match(text)
+    scopes = list(scopes or SCOPES)
+    if not match or not scopes:
+        return [], False
+    # No scope can contribute more than the rows up to the end of this page
+    depth = (page + 1) * per_page + 1
+    rows = query(search_sql(scopes), [match, depth] * len(scopes) + [per_page + 1, page * per_page])
+    return [Hit(*row) for row in rows[:per_page]], len(rows) > per_page
@@ -0,0 +1,227 @@
+# Master patient index. Visits and admissions name their patient in free text,
+# so patients, visits and admissions are each linked to a PatientIdentities row
+# found through blocking keys: the normalized name, gender and a band of the
+# birth year implied by age at the record's date. One index range gives the
+# candidates and the closest birth year within a year wins. A record missing
+# age or gender joins its name's only identity, and stays unlinked when the
+# name has several. Tests follow their patient. Records written by the app are
+# linked as they are written; link() backfills the rest (older rows, imports,
+# archived rows) in batches.
+#
+#   python identity.py [--batch-size 5000]
+
+import argparse
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import namedtuple
+from contextlib import closing
+
+import archive
+import cache
+from codes import date_of, frame
+from database import DEFAULT_FACILITY, FACILITIES, database_path, init_db, open_connection, use_facility, write
+
+BATCH_SIZE = 5000
+# Birth years are blocked in bands of this many years
+BAND_YEARS = 5
+# Age at a date leaves the birth year uncertain by one
+BIRTH_YEAR_SLACK = 1
+# Linked table -> (key, name, age, gender, date) columns; None where the table has none
+LINKED = {
+    "Patients": ("id", "name", "age", "gender", "admission_date"),
+    "PatientInflow": ("inflow_id", "name", "age", "gender", "visit_date"),
+    "Admissions": ("admission_id", "patient_name", None, None, "admit_date"),
+}
+
+LinkResult = namedtuple("LinkResult", ["records", "identities", "unlinked", "seconds"])
+
+IDENTITY_COLUMNS = ["ID", "Name", "Gender", "Born", "Admissions", "Visits"]
+# Each arm is an index lookup on identity_id in the shard and the archive
+TIMELINE_SQL = """
+    SELECT admission_date, 'Admitted', department, status, id, archived
+    FROM AllPatients WHERE identity_id = ?
+    UNION ALL
+    SELECT discharge_date, 'Discharged', department, NULL, id, archived
+    FROM AllPatients WHERE identity_id = ? AND discharge_date IS NOT NULL
+    UNION ALL
+    SELECT visit_date, 'Visit', department, notes, inflow_id, archived
+    FROM AllVisits WHERE identity_id = ?
+    UNION ALL
+    SELECT t.test_date, 'Test', NULL, tt.name || ': ' || COALESCE(t.result, ''), t.test_id, t.archived
+    FROM AllTests t LEFT JOIN TestTypes tt ON tt.id = t.test_type
+    WHERE t.patient_id IN (SELECT id FROM AllPatients WHERE identity_id = ?)
+    UNION ALL
+    SELECT admit_date, 'Bed admission', NULL, 'Bed ' || bed_number, admission_id, 0
+    FROM Admissions WHERE identity_id = ?
+"""
+TIMELINE_COLUMNS = ["Date", "Event", "Department", "Detail", "Record", "Archived"]
+
+
+def name_key(name):
+    # Case, accents, punctuation and word order are ignored: "D'Souza,  Ána" -> "ana dsouza"
+    text = "".join(ch for ch in unicodedata.normalize("NFKD", name or "") if not unicodedata.combining(ch))
+    return " ".join(sorted(re.sub(r"[^\w\s]", "", text.casefold()).split()))
+
+
+def birth_year(age, day_number):
+    return None if age is None or day_number is None else date_of(day_number).year - age
+
+
+def resolve(conn, name, age=None, gender=None, day_number=None):
+    # Identity of a record inside a write transaction, created when no candidate
+    # matches; None for a record without a name or an ambiguous one. gender is a Genders code.
+    key = name_key(name)
+    if not key:
+        return None
+    born = birth_year(age, day_number)
+    if born is None or gender is None:
+        rows = conn.execute("SELECT mpi_id, gender FROM PatientIdentities WHERE name_key = ? LIMIT 2", (key,)).fetchall()
+        if len(rows) > 1 or rows and gender is not None and rows[0][1] not in (None, gender):
+            return None
+        if rows:
+            return rows[0][0]
+    else:
+        rows = conn.execute("""
+            SELECT mpi_id, birth_year FROM PatientIdentities
+            WHERE name_key = ? AND gender = ? AND birth_band BETWEEN ? AND ?
+        """, (key, gender, (born - BIRTH_YEAR_SLACK) // BAND_YEARS, (born + BIRTH_YEAR_SLACK) // BAND_YEARS)).fetchall()
+        close = [(abs(year - born), mpi_id) for mpi_id, year in rows if abs(year - born) <= BIRTH_YEAR_SLACK]
+        if close:
+            return min(close)[1]
+    return conn.execute(
+        "INSERT INTO PatientIdentities (name, name_key, gender, birth_year, birth_band) VALUES (?, ?, ?, ?, ?)",
+        (" ".join(name.split()), key, gender, born, None if born is None else born // BAND_YEARS)
+    ).lastrowid
+
+
+def _pending(conn, schema, table, after, batch_size):
+    key, *columns = LINKED[table]
+    return conn.execute(f"""
+        SELECT {key}, {", ".join(col or "NULL" for col in columns)} FROM {schema}.{table}
+        WHERE identity_id IS NULL AND {key} > ?
+        ORDER BY {key} LIMIT ?
+    """, (after, batch_size)).fetchall()
+
+
+def _update_sql(schema, table):
+    target = table if schema == "main" else f"{schema}.{table}"
+    return f"UPDATE {target} SET identity_id = ? WHERE {LINKED[table][0]} = ?"
+
+
+def _links(conn, rows):
+    # (identity, key) for each pending row that resolves
+    links = []
+    for key, *record in rows:
+        mpi_id = resolve(conn, *record)
+        if mpi_id is not None:
+            links.append((mpi_id, key))
+    return links
+
+
+def _link(conn, schema, table, rows):
+    # Shard rows are updated in the write transaction that resolves them; archived
+    # rows after it commits, on the archive connection. Resolving again after an
+    # interruption finds the identities already created.
+    update = _update_sql(schema, table)
+
+    def run(writer):
+        links = _links(writer, rows)
+        if schema == "main":
+            writer.executemany(update, links)
+        return links
+
+    links = write(run)
+    if schema == "archive":
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(update, links)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return len(links)
+
+
+def link(batch_size=BATCH_SIZE, progress=None):
+    # Links every unlinked record, shard first, then its archive if there is one
+    started = time.perf_counter()
+    archived = os.path.exists(archive.archive_path())
+    records = unlinked = 0
+    with closing(archive.open_archive() if archived else open_connection(database_path())) as conn:
+        before = conn.execute("SELECT COUNT(*) FROM main.PatientIdentities").fetchone()[0]
+        for schema in ("main", "archive") if archived else ("main",):
+            for table in LINKED:
+                if schema == "archive" and table not in archive.ARCHIVED:
+                    continue
+                after = 0
+                while True:
+                    rows = _pending(conn, schema, table, after, batch_size)
+                    if not rows:
+                        break
+                    after = rows[-1][0]
+                    linked = _link(conn, schema, table, rows)
+                    records += linked
+                    unlinked += len(rows) - linked
+                    if progress:
+                        progress(records)
+        identities = conn.execute("SELECT COUNT(*) FROM main.PatientIdentities").fetchone()[0] - before
+        if records:
+            # Statistics gathered before the backfill see identity_id as all NULL
+            for table in ["PatientIdentities", *LINKED]:
+                conn.execute(f"ANALYZE main.{table}")
+    return LinkResult(records, identities, unlinked, time.perf_counter() - started)
+
+
+def backfill(conn, batch_size=BATCH_SIZE):
+    # link() for bulk loads: the shard's unlinked records, resolved and updated on
+    # conn inside the caller's transaction
+    for table in LINKED:
+        after = 0
+        while True:
+            rows = _pending(conn, "main", table, after, batch_size)
+            if not rows:
+                break
+            after = rows[-1][0]
+            conn.executemany(_update_sql("main", table), _links(conn, rows))
+
+
+def find_identities(name, limit=50):
+    # Identities whose normalized name equals name's, with their admissions and visits still in the shard
+    rows = cache.query("""
+        SELECT i.mpi_id, i.name, i.gender, i.birth_year,
+               (SELECT COUNT(*) FROM Patients p WHERE p.identity_id = i.mpi_id),
+               (SELECT COUNT(*) FROM PatientInflow v WHERE v.identity_id = i.mpi_id)
+        FROM PatientIdentities i
+        WHERE i.name_key = ?
+        ORDER BY i.gender, i.birth_band LIMIT ?
+    """, (name_key(name), limit))
+    return frame(rows, IDENTITY_COLUMNS, {"Gender": "Genders"})
+
+
+def timeline(identity_id):
+    # Every admission, discharge, visit, test and bed admission of one identity,
+    # archived ones included, newest first
+    rows = archive.query(TIMELINE_SQL, (identity_id,) * TIMELINE_SQL.count("?"))
+    history = frame(rows, TIMELINE_COLUMNS, {"Date": "day", "Event": "category", "Department": "Departments"})
+    return history.sort_values("Date", ascending=False, kind="stable", ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Link patients, visits and admissions to the master patient index.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="records per transaction")
+    parser.add_argument("--facility", choices=list(FACILITIES), default=DEFAULT_FACILITY)
+    args = parser.parse_args(argv)
+
+    use_facility(args.facility)
+    init_db()
+    result = link(args.batch_size, progress=lambda records: print(f"  {records} records ...", file=sys.stderr))
+    print(f"linked {result.records} records, {result.identities} new identities, {result.unlinked} left unlinked "
+          f"in {result.seconds:.1f}s ({result.records / max(result.seconds, 1e-9):.0f} records/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+# Bulk import of visits, tests, patients, inventory and beds from CSV or JSONL.
+# Rows are streamed, validated and inserted in chunked transactions.
+#
+#   python importer.py visits history.csv [--chunk-size 10000] [--bulk]
+#
+# --bulk is for offline loads only: stop the app before running it.
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import date
+
+import beds
+from codes import TEST_TYPES, day
+from database import DEFAULT_FACILITY, FACILITIES, init_db, query_value, use_facility, write
+from migrations import (
+    CHANGE_TABLES, FTS_TABLES, INDEXES, LOOKUP_OF, ROLLUP_SOURCES, TRIGGERS, code_sql,
+    create_indexes, create_triggers, drop_indexes, drop_triggers, log_table_change, rebuild_daily_stats,
+    intern_names, rebuild_search, record_open_stays, record_opening_balances,
+)
+
+CHUNK_SIZE = 10000
+# Rejected rows kept for the report; the rest are only counted
+MAX_REJECTS_KEPT = 1000
+FORMATS = ["csv", "jsonl"]
+
+Field = namedtuple("Field", ["name", "convert", "required", "default"], defaults=[False, None])
+ImportResult = namedtuple("ImportResult", ["kind", "imported", "rejected", "rejects", "seconds"])
+
+
+def text(value):
+    return str(value).strip()
+
+
+def integer(value):
+    number = int(str(value).strip())
+    if number < 0:
+        raise ValueError("must not be negative")
+    return number
+
+
+def decimal(value):
+    number = float(str(value).strip())
+    if not number >= 0:
+        raise ValueError("must not be negative")
+    return number
+
+
+def iso_date(value):
+    return day(date.fromisoformat(str(value).strip()))
+
+
+def choice(*options):
+    lookup = {option.lower(): option for option in options}
+
+    def convert(value):
+        try:
+            return lookup[str(value).strip().lower()]
+        except KeyError:
+            raise ValueError(f"must be one of {', '.join(options)}") from None
+    return convert
+
+
+GENDER = choice("Male", "Female", "Other")
+
+# Importable record types: kind -> (table, fields, insert verb)
+SPECS = {
+    "visits": ("PatientInflow", [
+        Field("name", text, True),
+        Field("age", integer),
+        Field("gender", GENDER),
+        Field("visit_date", iso_date, True),
+        Field("department", text),
+        Field("notes", text),
+    ], "INSERT"),
+    "tests": ("PatientTests", [
+        Field("patient_id", integer, True),
+        Field("test_type", choice(*TEST_TYPES), True),
+        Field("test_date", iso_date, True),
+        Field("result", text),
+    ], "INSERT"),
+    "patients": ("Patients", [
+        Field("name", text, True),
+        Field("age", integer),
+        Field("gender", GENDER),
+        Field("admission_date", iso_date),
+        Field("discharge_date", iso_date),
+        Field("status", choice("Admitted", "Discharged"), default="Discharged"),
+        Field("bed_id", integer),
+        Field("department", text),
+        Field("weight_kg", decimal),
+    ], "INSERT"),
+    "inventory": ("Inventory", [
+        Field("item_name", text, True),
+        Field("quantity", integer, default=0),
+        Field("unit", text),
+        Field("reorder_level", integer, default=0),
+    ], "INSERT"),
+    # Re-running a bed import leaves existing beds untouched
+    "beds": ("Beds", [
+        Field("bed_id", integer),
+        Field("ward", text, True),
+        Field("room", text),
+        Field("status", choice("Vacant", "Occupied"), default="Vacant"),
+    ], "INSERT OR IGNORE"),
+}
+
+
+def lookup_fields(kind):
+    # (position, lookup) of the fields stored as lookup codes
+    table, fields, _ = SPECS[kind]
+    return [(position, LOOKUP_OF[table, field.name]) for position, field in enumerate(fields)
+            if (table, field.name) in LOOKUP_OF]
+
+
+def insert_sql(kind):
+    table, fields, verb = SPECS[kind]
+    names = ", ".join(field.name for field in fields)
+    values = [code_sql(LOOKUP_OF[table, field.name], "?") if (table, field.name) in LOOKUP_OF else "?"
+              for field in fields]
+    return f"{verb} INTO {table} ({names}) VALUES ({', '.join(values)})"
+
+
+def field_position(kind, name):
+    return [field.name for field in SPECS[kind][1]].index(name)
+
+
+def _existing(conn, sql, values):
+    # The values sql (with one json_each(?) list) finds
+    return {row[0] for row in conn.execute(sql, (json.dumps(sorted(values)),))}
+
+
+def check_patients(conn, chunk):
+    # Admitted patients need an admission date and a vacant bed no other row of the
+    # import takes; any bed given must exist
+    status, bed, admitted_on = (field_position("patients", name) for name in ("status", "bed_id", "admission_date"))
+    bed_ids = {values[bed] for _, values in chunk if values[bed] is not None}
+    known = _existing(conn, "SELECT bed_id FROM Beds WHERE bed_id IN (SELECT value FROM json_each(?))", bed_ids)
+    vacant = _existing(conn, """
+        SELECT bed_id FROM Beds WHERE status = 'Vacant' AND bed_id IN (SELECT value FROM json_each(?))
+    """, bed_ids)
+    rejects = []
+    for number, values in chunk:
+        admitted = values[status] == "Admitted"
+        if admitted and values[bed] is None:
+            rejects.append((number, "bed_id is required for admitted patients"))
+        elif admitted and values[admitted_on] is None:
+            rejects.append((number, "admission_date is required for admitted patients"))
+        elif values[bed] is not None and values[bed] not in known:
+            rejects.append((number, f"bed_id: no bed {values[bed]}"))
+        elif admitted and values[bed] not in vacant:
+            rejects.append((number, f"bed_id: bed {values[bed]} is not vacant"))
+        elif admitted:
+            vacant.discard(values[bed])
+    return rejects
+
+
+def check_tests(conn, chunk):
+    patient = field_position("tests", "patient_id")
+    known = _existing(conn, "SELECT id FROM Patients WHERE id IN (SELECT value FROM json_each(?))",
+                      {values[patient] for _, values in chunk})
+    return [(number, f"patient_id: no patient {values[patient]}") for number, values in chunk
+            if values[patient] not in known]
+
+
+# Checks against the database, run in the insert transaction: kind -> check(conn, chunk) -> rejects
+CHECKS = {
+    "patients": check_patients,
+    "tests": check_tests,
+}
+
+
+def insert_chunk(conn, kind, chunk):
+    # chunk: (row number, values) pairs. Returns (rows inserted, (row number, reason) rejects)
+    rejects = CHECKS[kind](conn, chunk) if kind in CHECKS else []
+    rejected = {number for number, _ in rejects}
+    rows = [values for number, values in chunk if number not in rejected]
+    # Names new to a lookup are added first, so the insert only has to look codes up
+    for position, lookup in lookup_fields(kind):
+        names = sorted({row[position] for row in rows if row[position]})
+        if names:
+            intern_names(conn, lookup, "SELECT value FROM json_each(?)", (json.dumps(names),))
+    inserted = conn.executemany(insert_sql(kind), rows).rowcount if rows else 0
+    if kind == "patients":
+        # Imported inpatients occupy their beds
+        status, bed = field_position("patients", "status"), field_position("patients", "bed_id")
+        conn.execute("""
+            UPDATE Beds SET status = 'Occupied'
+            WHERE bed_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps([row[bed] for row in rows if row[status] == "Admitted"]),))
+    return inserted, rejects
+
+
+def validate(kind, record):
+    _, fields, _ = SPECS[kind]
+    values = []
+    for field in fields:
+        raw = record.get(field.name)
+        if raw is None or str(raw).strip() == "":
+            if field.required:
+                raise ValueError(f"{field.name} is required")
+            values.append(field.default)
+            continue
+        try:
+            values.append(field.convert(raw))
+        except ValueError as e:
+            raise ValueError(f"{field.name}: {e}") from None
+    return tuple(values)
+
+
+def read_records(stream, fmt):
+    # Yields (row number, dict); stream is a text file object
+    if fmt == "csv":
+        for number, record in enumerate(csv.DictReader(stream), 1):
+            yield number, record
+    elif fmt == "jsonl":
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = e
+            yield number, record
+    else:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def format_of(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return "jsonl" if extension in ("jsonl", "ndjson", "json") else "csv"
+
+
+def defer_maintenance(table):
+    # Indexes and triggers on the table, dropped for a bulk load and rebuilt afterwards
+    indexes = [name for name, target in INDEXES.items() if target.startswith(f"{table}(")]
+    triggers = [name for name in TRIGGERS if name.startswith(f"trg_{table.lower()}_")]
+    return indexes, triggers
+
+
+def rebuild_after_bulk(conn, table, indexes, triggers):
+    create_indexes(conn, indexes)
+    if table in ROLLUP_SOURCES:
+        rebuild_daily_stats(conn)
+    fts = [name for name, (source, _, _) in FTS_TABLES.items() if source == table]
+    if fts:
+        rebuild_search(conn, fts)
+    create_triggers(conn, triggers)
+    if table in CHANGE_TABLES:
+        # The change triggers were dropped too: live views reload the table
+        log_table_change(conn, table)
+    conn.execute(f"ANALYZE {table}")
+
+
+def import_records(kind, records, chunk_size=CHUNK_SIZE, bulk=False, progress=None):
+    # records: iterable of (row number, dict). With bulk=True the table's indexes and
+    # triggers are dropped first and rebuilt in one pass at the end, which is much
+    # faster for loads that dwarf the existing table. Offline only: rows other
+    # sessions wrote meanwhile would miss the rollups and search, so only the CLI
+    # offers it, with the app stopped.
+    table = SPECS[kind][0]
+    imported = rejected = 0
+    rejects = []
+    started = time.perf_counter()
+
+    def reject(number, reason):
+        nonlocal rejected
+        rejected += 1
+        if len(rejects) < MAX_REJECTS_KEPT:
+            rejects.append((number, reason))
+
+    def valid_rows():
+        for number, record in records:
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError(f"not a record: {record}")
+                yield number, validate(kind, record)
+            except ValueError as e:
+                reject(number, str(e))
+
+    indexes, triggers = defer_maintenance(table) if bulk else ([], [])
+    def drop_maintenance(conn):
+        drop_triggers(conn, triggers)
+        drop_indexes(conn, indexes)
+
+    if bulk:
+        write(drop_maintenance)
+    try:
+        rows = valid_rows()
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            # One transaction per chunk bounds memory and the WAL while keeping commits rare
+            inserted, refused = write(lambda conn: insert_chunk(conn, kind, chunk))
+            imported += inserted
+            for number, reason in refused:
+                reject(number, reason)
+            if progress:
+                progress(imported, rejected)
+    finally:
+        if bulk:
+            write(lambda conn: rebuild_after_bulk(conn, table, indexes, triggers))
+
+    if kind == "inventory":
+        # Imported quantities enter the stock ledger as opening balances
+        write(record_opening_balances)
+    if kind in ("beds", "patients"):
+        # Beds imported or made Occupied start their stay in the event log
+        write(record_open_stays)
+        beds.free_beds.reset()
+    return ImportResult(kind, imported, rejected, rejects, time.perf_counter() - started)
+
+
+def import_file(kind, stream, fmt, **options):
+    # Accepts binary uploads (Streamlit's UploadedFile) as well as text files
+    if isinstance(stream, (io.BufferedIOBase, io.RawIOBase)):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return import_records(kind, read_records(stream, fmt), **options)
+
+
+def provision_wards(wards, status="Vacant"):
+    # wards: {ward: number of beds to add}; rooms continue each ward's numbering
+    def run(conn):
+        rows = []
+        next_id = query_value("SELECT COALESCE(MAX(bed_id), 0) FROM Beds") + 1
+        for ward, count in wards.items():
+            existing = query_value("SELECT COUNT(*) FROM Beds WHERE ward = ? COLLATE NOCASE", (ward,))
+            for number in range(existing + 1, existing + count + 1):
+                rows.append((next_id, ward, f"{ward} {number}", status))
+                next_id += 1
+        conn.executemany("INSERT INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    added = write(run)
+    beds.free_beds.reset()
+    return added
+
+
+def report(result):
+    rate = result.imported / result.seconds if result.seconds else 0
+    lines = [
+        f"{result.kind}: {result.imported} imported, {result.rejected} rejected "
+        f"in {result.seconds:.2f}s ({rate:.0f} rows/s)"
+    ]
+    lines += [f"  row {number}: {reason}" for number, reason in result.rejects[:20]]
+    if result.rejected > 20:
+        lines.append(f"  ... {result.rejected - 20} more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import records from CSV or JSONL files.")
+    parser.add_argument("kind", choices=list(SPECS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--bulk", action="store_true",
+                        help="drop the table's indexes and triggers during the load and rebuild them after; "
+                             "stop the app first")
+    parser.add_argument("--facility", choices=list(FACILITIES), default=DEFAULT_FACILITY)
+    args = parser.parse_args(argv)
+
+    use_facility(args.facility)
+    init_db()
+    with open(args.path, encoding="utf-8-sig", newline="") as f:
+        result = import_records(
+            args.kind, read_records(f, args.format or format_of(args.path)),
+            chunk_size=args.chunk_size, bulk=args.bulk,
+            progress=lambda done, bad: print(f"  {done} rows ...", file=sys.stderr),
+        )
+    print(report(result))
+    return 1 if result.rejected else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
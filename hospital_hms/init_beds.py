@@ -1,16 +1,52 @@
-import sqlite3
-
-conn = sqlite3.connect("data/hospital.db")
-cursor = conn.cursor()
-
-beds = [
-    (1, "Ward A", "Room 101", "Vacant"),
-    (2, "Ward A", "Room 102", "Vacant"),
-    (3, "Ward B", "Room 201", "Vacant"),
-    (4, "Ward B", "Room 202", "Vacant"),
-    (5, "ICU", "ICU 1", "Vacant")
-]
-
-cursor.executemany("INSERT OR IGNORE INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)", beds)
-conn.commit()
-conn.close()
+# Provision beds: the default five, whole wards, or a CSV/JSONL bed list.
+#
+#   python init_beds.py [--ward "Ward C=20" --ward "ICU=6"] [--file beds.csv]
+
+import argparse
+import sys
+
+from database import DEFAULT_FACILITY, FACILITIES, executemany, init_db, use_facility
+from importer import format_of, import_records, provision_wards, read_records, report
+
+DEFAULT_BEDS = [
+    (1, "Ward A", "Room 101", "Vacant"),
+    (2, "Ward A", "Room 102", "Vacant"),
+    (3, "Ward B", "Room 201", "Vacant"),
+    (4, "Ward B", "Room 202", "Vacant"),
+    (5, "ICU", "ICU 1", "Vacant")
+]
+
+
+def ward_count(value):
+    ward, _, count = value.rpartition("=")
+    if not ward or not count.isdigit():
+        raise argparse.ArgumentTypeError(f"expected WARD=COUNT, got {value!r}")
+    return ward.strip(), int(count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Provision hospital beds.")
+    parser.add_argument("--ward", type=ward_count, action="append", default=[], metavar="WARD=COUNT",
+                        help="add COUNT vacant beds to WARD (repeatable)")
+    parser.add_argument("--file", help="CSV or JSONL with bed_id, ward, room, status columns")
+    parser.add_argument("--facility", choices=list(FACILITIES), default=DEFAULT_FACILITY)
+    args = parser.parse_args(argv)
+
+    use_facility(args.facility)
+    init_db()
+    if not args.ward and not args.file:
+        executemany("INSERT OR IGNORE INTO Beds (bed_id, ward, room, status) VALUES (?, ?, ?, ?)", DEFAULT_BEDS)
+        return 0
+    if args.ward:
+        added = provision_wards(dict(args.ward))
+        print(f"{added} beds added across {len(args.ward)} ward(s)")
+    if args.file:
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            result = import_records("beds", read_records(f, format_of(args.file)))
+        print(report(result))
+        return 1 if result.rejected else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
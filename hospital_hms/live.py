@@ -0,0 +1,225 @@
+# Live views. One watcher thread per process polls each shard's PRAGMA
+# data_version and, only after a commit, reads the new ChangeLog rows once into
+# memory. Any number of open sessions then learn what changed without querying,
+# and reload just the affected rows of the views they hold.
+
+import atexit
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+import database
+import metrics
+
+POLL_SECONDS = 0.5
+# How often an open live panel checks the feed
+REFRESH_SECONDS = 2
+# Changes held in memory per shard; a view further behind reloads in full
+BUFFER_SIZE = 5000
+
+
+class Feed:
+    # The changes committed to one shard since the watcher first looked at it
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._data_version = None
+        self._changes = deque(maxlen=BUFFER_SIZE)
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        # Changes after floor and up to seq are all held
+        self.floor = self.seq = None
+        self.polls = self.reads = 0
+
+    def _reset(self, seq):
+        with self._lock:
+            self._changes.clear()
+            self.floor = self.seq = seq
+
+    def _read(self, sql, params=()):
+        started = time.perf_counter()
+        rows = self._conn.execute(sql, params).fetchall()
+        metrics.record_query(sql, started, len(rows), shard=self.path)
+        return rows
+
+    def poll(self):
+        with self._poll_lock:
+            if self._conn is None:
+                self._conn = database.open_connection(self.path)
+            self.polls += 1
+            # Counted in polls, not recorded: one every POLL_SECONDS would crowd real queries out of the ring
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            self.reads += 1
+            if self.seq is None:
+                self._reset(self._read("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog")[0][0])
+                return
+            rows = self._read("SELECT seq, table_name, row_id FROM ChangeLog WHERE seq > ? ORDER BY seq", (self.seq,))
+            if not rows:
+                latest = self._read("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog")[0][0]
+                if latest < self.seq:
+                    # The shard was replaced (restored or regenerated)
+                    self._reset(latest)
+                return
+            if rows[0][0] != self.seq + 1:
+                # ChangeLog was pruned past what we had read
+                self._reset(rows[-1][0])
+                return
+            with self._lock:
+                self._changes.extend(rows)
+                self.seq = rows[-1][0]
+                if len(self._changes) == self._changes.maxlen:
+                    self.floor = max(self.floor, self._changes[0][0] - 1)
+
+    def since(self, seq, tables):
+        # (latest seq, {table: changed row ids}) after seq, or None when those
+        # changes are no longer all held. A row id of None: the whole table changed.
+        with self._lock:
+            if seq is None or self.seq is None or not self.floor <= seq <= self.seq:
+                return None
+            changed = {table: set() for table in tables}
+            for change_seq, table, row_id in reversed(self._changes):
+                if change_seq <= seq:
+                    break
+                if table in changed:
+                    changed[table].add(row_id)
+            return self.seq, changed
+
+    def close(self):
+        with self._poll_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                # data_version is per connection
+                self._data_version = None
+
+
+class Watcher:
+    # Polls every shard a session has asked about, on one thread for the process
+
+    def __init__(self, interval=POLL_SECONDS):
+        self.interval = interval
+        self._feeds = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        for feed in self._feeds.values():
+            feed.close()
+
+    def feed(self, path=None):
+        path = path or database.database_path()
+        feed = self._feeds.get(path)
+        if feed is None:
+            with self._lock:
+                feed = self._feeds.get(path)
+                if feed is None:
+                    feed = Feed(path)
+                    # Polled once here so the first view starts from a known seq
+                    feed.poll()
+                    self._feeds[path] = feed
+        return feed
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            for feed in list(self._feeds.values()):
+                try:
+                    feed.poll()
+                except sqlite3.Error:
+                    # A shard being replaced or migrated; try again next round
+                    feed.close()
+
+
+class LiveView:
+    # A table held by one session. load(ids) returns a DataFrame indexed by row
+    # key, with every row when ids is None; affected(frame, changes) returns the
+    # keys to reload for {table: changed row ids}, or None to reload everything.
+
+    def __init__(self, load, affected, tables):
+        self.load = load
+        self.affected = affected
+        self.tables = tables
+        self.frame = None
+        self.path = self.key = self.seq = None
+        self.reloads = self.patches = self.rows_loaded = 0
+
+    def _reload(self, feed, key):
+        # The seq is taken first: a change landing during the load is applied again later
+        self.path, self.key, self.seq = feed.path, key, feed.seq
+        self.frame = self.load(None)
+        self.reloads += 1
+        self.rows_loaded += len(self.frame)
+
+    def refresh(self, key=None, poll=False):
+        # key: whatever else selects the rows (a page cursor); a new key reloads.
+        # poll: look at the shard now instead of waiting for the watcher, so a
+        # session sees its own write straight away.
+        feed = watcher().feed()
+        if poll:
+            feed.poll()
+        if self.frame is None or feed.path != self.path or key != self.key:
+            self._reload(feed, key)
+            return self.frame
+        delta = feed.since(self.seq, self.tables)
+        if delta is None:
+            self._reload(feed, key)
+            return self.frame
+        seq, changes = delta
+        if not any(changes.values()):
+            self.seq = seq
+            return self.frame
+        keys = None if any(None in ids for ids in changes.values()) else self.affected(self.frame, changes)
+        if keys is None:
+            self._reload(feed, key)
+            return self.frame
+        self.seq = seq
+        if keys:
+            keys = sorted(keys)
+            fresh = self.load(keys)
+            self.frame = pd.concat([self.frame.drop(keys, errors="ignore"), fresh]).sort_index()
+            self.patches += 1
+            self.rows_loaded += len(fresh)
+        return self.frame
+
+
+_lock = threading.Lock()
+_watcher = None
+
+
+def start():
+    # Idempotent: Streamlit re-runs app.py on every interaction
+    global _watcher
+    with _lock:
+        if _watcher is None:
+            _watcher = Watcher().start()
+            atexit.register(stop)
+    return _watcher
+
+
+def watcher():
+    return _watcher or start()
+
+
+def stop():
+    global _watcher
+    with _lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+# Samples kept in memory per kind; older ones fall off the ring
+RING_SIZE = 5000
+# Optional sinks, off unless configured
+PROMETHEUS_FILE = os.environ.get("HMS_PROMETHEUS_FILE")
+PERSIST_TO_TABLE = os.environ.get("HMS_METRICS_TABLE") == "1"
+EXPORT_INTERVAL = 15
+
+# shard: path of the database the statement ran on, or the page read from
+QuerySample = namedtuple("QuerySample", ["seq", "recorded_at", "page", "statement", "seconds", "rows", "cached", "shard"])
+PageSample = namedtuple("PageSample", ["seq", "recorded_at", "page", "seconds", "shard"])
+
+_lock = threading.Lock()
+_queries = deque(maxlen=RING_SIZE)
+_pages = deque(maxlen=RING_SIZE)
+_seq = 0
+_persisted = 0
+_last_export = 0.0
+# Page being rendered by this thread (Streamlit runs each session's script on its own thread)
+_local = threading.local()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def current_page():
+    return getattr(_local, "page", None)
+
+
+def _next_seq():
+    global _seq
+    _seq += 1
+    return _seq
+
+
+def _shard():
+    from database import database_path  # database imports this module
+
+    return database_path()
+
+
+def record_query(statement, started, rows=None, cached=False, shard=None):
+    # started: time.perf_counter() taken before the statement ran; shard defaults to this thread's
+    seconds = time.perf_counter() - started
+    statement = " ".join(statement.split())
+    shard = shard or _shard()
+    with _lock:
+        _queries.append(QuerySample(_next_seq(), time.time(), current_page(), statement, seconds, rows, cached, shard))
+
+
+def tag_page(page):
+    _local.page = page
+
+
+def begin_page(page):
+    _local.page = page
+    _local.started = time.perf_counter()
+
+
+def end_page(cache_stats=None):
+    # Renders cut short by st.rerun()/st.stop() never get here and are not counted
+    page, started = current_page(), getattr(_local, "started", None)
+    if page is None or started is None:
+        return
+    seconds = time.perf_counter() - started
+    _local.page = _local.started = None
+    shard = _shard()
+    with _lock:
+        _pages.append(PageSample(_next_seq(), time.time(), page, seconds, shard))
+    export_if_due(cache_stats)
+
+
+def snapshot():
+    with _lock:
+        return list(_queries), list(_pages)
+
+
+def clear():
+    with _lock:
+        _queries.clear()
+        _pages.clear()
+
+
+def page_summary(pages=None):
+    # page -> {"renders", "p50_ms", "p95_ms", "p99_ms", "max_ms"}
+    if pages is None:
+        pages = snapshot()[1]
+    by_page = {}
+    for sample in pages:
+        by_page.setdefault(sample.page, []).append(sample.seconds * 1000)
+    return {
+        page: {
+            "renders": len(times),
+            "p50_ms": percentile(times, 50),
+            "p95_ms": percentile(times, 95),
+            "p99_ms": percentile(times, 99),
+            "max_ms": max(times),
+        }
+        for page, times in sorted(by_page.items())
+    }
+
+
+def slowest_statements(queries=None, limit=20):
+    # Executions grouped by statement text, slowest worst case first; cache hits excluded
+    if queries is None:
+        queries = snapshot()[0]
+    grouped = {}
+    for sample in queries:
+        if not sample.cached:
+            grouped.setdefault(sample.statement, []).append(sample)
+    rows = []
+    for statement, samples in grouped.items():
+        times = [sample.seconds * 1000 for sample in samples]
+        rows.append({
+            "statement": statement,
+            "calls": len(samples),
+            "p95_ms": percentile(times, 95),
+            "max_ms": max(times),
+            "total_ms": sum(times),
+            "rows": max(sample.rows or 0 for sample in samples),
+            "pages": ", ".join(sorted({sample.page or "-" for sample in samples})),
+        })
+    rows.sort(key=lambda row: row["max_ms"], reverse=True)
+    return rows[:limit]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text(cache_stats=None):
+    queries, pages = snapshot()
+    lines = [
+        "# HELP hms_page_render_seconds Streamlit page render time over the in-memory window.",
+        "# TYPE hms_page_render_seconds summary",
+    ]
+    by_page = {}
+    for sample in pages:
+        by_page.setdefault(sample.page, []).append(sample.seconds)
+    for page, times in sorted(by_page.items()):
+        for quantile in (0.5, 0.95, 0.99):
+            lines.append(f'hms_page_render_seconds{{page="{_label(page)}",quantile="{quantile}"}} '
+                         f"{percentile(times, quantile * 100):.6f}")
+        lines.append(f'hms_page_render_seconds_sum{{page="{_label(page)}"}} {sum(times):.6f}')
+        lines.append(f'hms_page_render_seconds_count{{page="{_label(page)}"}} {len(times)}')
+
+    lines += [
+        "# HELP hms_query_seconds SQL statement time by calling page over the in-memory window.",
+        "# TYPE hms_query_seconds summary",
+    ]
+    by_page = {}
+    for sample in queries:
+        if not sample.cached:
+            by_page.setdefault(sample.page or "-", []).append(sample.seconds)
+    for page, times in sorted(by_page.items()):
+        for quantile in (0.5, 0.95, 0.99):
+            lines.append(f'hms_query_seconds{{page="{_label(page)}",quantile="{quantile}"}} '
+                         f"{percentile(times, quantile * 100):.6f}")
+        lines.append(f'hms_query_seconds_sum{{page="{_label(page)}"}} {sum(times):.6f}')
+        lines.append(f'hms_query_seconds_count{{page="{_label(page)}"}} {len(times)}')
+
+    if cache_stats:
+        lines += [
+            "# HELP hms_query_cache_hits_total Reads served from the query cache.",
+            "# TYPE hms_query_cache_hits_total counter",
+            f"hms_query_cache_hits_total {cache_stats['hits']}",
+            "# HELP hms_query_cache_misses_total Reads that went to SQLite.",
+            "# TYPE hms_query_cache_misses_total counter",
+            f"hms_query_cache_misses_total {cache_stats['misses']}",
+            "# HELP hms_query_cache_entries Entries currently cached.",
+            "# TYPE hms_query_cache_entries gauge",
+            f"hms_query_cache_entries {cache_stats['entries']}",
+            "# HELP hms_query_cache_version_checks_total PRAGMA data_version checks behind cache lookups.",
+            "# TYPE hms_query_cache_version_checks_total counter",
+            f"hms_query_cache_version_checks_total {cache_stats['version_checks']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, cache_stats=None):
+    # Written to a temporary name and renamed so scrapers never read a partial file
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        f.write(prometheus_text(cache_stats))
+    os.replace(temp, path)
+
+
+def persist():
+    # Appends samples not yet saved to QueryMetrics / PageMetrics of the shard they were taken on
+    from database import at, executemany  # database imports this module
+
+    global _persisted
+    with _lock:
+        since = _persisted
+        queries = [sample for sample in _queries if sample.seq > since]
+        pages = [sample for sample in _pages if sample.seq > since]
+        _persisted = _seq
+    for shard in sorted({s.shard for s in queries} | {s.shard for s in pages}):
+        with at(shard):
+            shard_queries = [s for s in queries if s.shard == shard]
+            if shard_queries:
+                executemany(
+                    "INSERT INTO QueryMetrics (recorded_at, page, statement, seconds, rows, cached) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(s.recorded_at, s.page, s.statement, s.seconds, s.rows, int(s.cached)) for s in shard_queries],
+                )
+            shard_pages = [s for s in pages if s.shard == shard]
+            if shard_pages:
+                executemany(
+                    "INSERT INTO PageMetrics (recorded_at, page, seconds) VALUES (?, ?, ?)",
+                    [(s.recorded_at, s.page, s.seconds) for s in shard_pages],
+                )
+    return len(queries) + len(pages)
+
+
+def export_if_due(cache_stats=None):
+    global _last_export
+    if not (PROMETHEUS_FILE or PERSIST_TO_TABLE):
+        return
+    with _lock:
+        now = time.monotonic()
+        if now - _last_export < EXPORT_INTERVAL:
+            return
+        _last_export = now
+    if PROMETHEUS_FILE:
+        write_prometheus(PROMETHEUS_FILE, cache_stats)
+    if PERSIST_TO_TABLE:
+        persist()
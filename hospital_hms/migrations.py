@@ -0,0 +1,1213 @@
+# Versioned schema migrations, tracked with PRAGMA user_version.
+# Pending steps run together in one transaction; append new steps, never edit old ones.
+# Each step carries the DDL it first ran, so an upgraded database runs what a fresh
+# one did; INDEXES and TRIGGERS at the end are the current schema, merged from them.
+
+import re
+
+
+def _columns(conn, table):
+    return [col[1] for col in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _baseline(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS Patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            age INTEGER,
+            gender TEXT,
+            admission_date TEXT,
+            discharge_date TEXT,
+            status TEXT,
+            bed_id INTEGER,
+            department TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS Beds (
+            bed_id INTEGER PRIMARY KEY,
+            ward TEXT,
+            room TEXT,
+            status TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS Inventory (
+            item_id INTEGER PRIMARY KEY,
+            item_name TEXT NOT NULL,
+            quantity INTEGER,
+            unit TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS Admissions (
+            admission_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT,
+            admit_date TEXT,
+            discharge_date TEXT,
+            bed_number INTEGER,
+            notes TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS PatientInflow (
+            inflow_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            age INTEGER,
+            gender TEXT,
+            visit_date TEXT,
+            department TEXT,
+            notes TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS PatientTests (
+            test_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            test_type TEXT NOT NULL,
+            test_date TEXT,
+            result TEXT,
+            FOREIGN KEY (patient_id) REFERENCES Patients(id)
+        )
+    ''')
+
+
+def _reconcile_legacy_columns(conn):
+    # Older databases were created by the page-level DDL that used to live in app.py
+    if "patient_id" not in _columns(conn, "PatientTests"):
+        conn.execute("ALTER TABLE PatientTests ADD COLUMN patient_id INTEGER")
+    inventory_columns = _columns(conn, "Inventory")
+    if "id" in inventory_columns and "item_id" not in inventory_columns:
+        conn.execute("ALTER TABLE Inventory RENAME COLUMN id TO item_id")
+
+
+def create_indexes(conn, names=None, indexes=None):
+    # names from indexes, INDEXES unless a step passes its own; all of them when names is None
+    indexes = INDEXES if indexes is None else indexes
+    for name in indexes if names is None else names:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {indexes[name]}")
+
+
+def drop_indexes(conn, names=None):
+    for name in INDEXES if names is None else names:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+_HOT_INDEXES = {
+    "idx_admissions_admit_date": "Admissions(admit_date)",
+    "idx_inflow_visit_date": "PatientInflow(visit_date)",
+    "idx_tests_date_type": "PatientTests(test_date, test_type)",
+    "idx_tests_patient": "PatientTests(patient_id)",
+    "idx_patients_status": "Patients(status)",
+    "idx_beds_status_ward": "Beds(status, ward)",
+}
+
+
+def _add_hot_indexes(conn):
+    create_indexes(conn, indexes=_HOT_INDEXES)
+    conn.execute("ANALYZE")
+
+
+# DailyStats rollup sources: table -> (date column, department column, test type column, counter)
+ROLLUP_SOURCES = {
+    "Admissions": ("admit_date", None, None, "admissions"),
+    "PatientInflow": ("visit_date", "department", None, "visits"),
+    "PatientTests": ("test_date", None, "test_type", "tests"),
+}
+
+
+def _rollup_key(row, date_col, dept_col, type_col):
+    # Day numbers and lookup codes; 0 stands for none
+    return [
+        f"COALESCE({row}.{col}, 0)" if col else "0"
+        for col in (date_col, dept_col, type_col)
+    ]
+
+
+# Full-text indexes over base tables (external content): fts table -> (table, key, columns)
+FTS_TABLES = {
+    "VisitsFTS": ("PatientInflow", "inflow_id", ["name", "department", "notes"]),
+    "TestsFTS": ("PatientTests", "test_id", ["test_type", "result"]),
+    "PatientsFTS": ("Patients", "id", ["name", "department"]),
+    "InventoryFTS": ("Inventory", "item_id", ["item_name", "unit"]),
+}
+
+
+# Low-cardinality text columns stored as codes into a lookup table: lookup -> (table, column) pairs.
+# Lookup rows are only ever added, so a code keeps its name.
+LOOKUPS = {
+    "Genders": [("Patients", "gender"), ("PatientInflow", "gender")],
+    "Departments": [("Patients", "department"), ("PatientInflow", "department")],
+    "TestTypes": [("PatientTests", "test_type")],
+}
+LOOKUP_OF = {(table, column): lookup for lookup, columns in LOOKUPS.items() for table, column in columns}
+
+# Dates stored as Julian day numbers; SQLite's date() turns one back into ISO text
+DAY_COLUMNS = {
+    "Patients": ["admission_date", "discharge_date"],
+    "Admissions": ["admit_date", "discharge_date"],
+    "PatientInflow": ["visit_date"],
+    "PatientTests": ["test_date"],
+}
+
+
+def day_sql(expr):
+    # ISO date text (or a day number already) -> day number
+    return f"CAST(julianday({expr}) + 0.5 AS INTEGER)"
+
+
+def code_sql(lookup, expr):
+    return f"(SELECT id FROM {lookup} WHERE name = NULLIF({expr}, ''))"
+
+
+def name_sql(lookup, expr):
+    return f"(SELECT name FROM {lookup} WHERE id = {expr})"
+
+
+# Each Occupied event opens a stay in BedIntervals; any other event closes the open one
+_INTERVAL_TRIGGER = """
+    AFTER INSERT ON BedEvents BEGIN
+        UPDATE BedIntervals SET ended = NEW.happened_at WHERE bed_id = NEW.bed_id AND ended IS NULL;
+        INSERT OR REPLACE INTO BedIntervals (bed_id, started, ended, ward, patient_id)
+        SELECT NEW.bed_id, NEW.happened_at, NULL, NEW.ward, NEW.patient_id WHERE NEW.status = 'Occupied';
+    END
+"""
+
+# Tables whose row changes are logged to ChangeLog for the live views: table -> key column
+CHANGE_TABLES = {"Beds": "bed_id", "Patients": "id"}
+
+
+def create_triggers(conn, names=None, triggers=None):
+    # names from triggers, TRIGGERS unless a step passes its own; all of them when names is None
+    triggers = TRIGGERS if triggers is None else triggers
+    for name in triggers if names is None else names:
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {triggers[name]}")
+
+
+def drop_triggers(conn, names=None):
+    for name in TRIGGERS if names is None else names:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rollup_insert(table, target="DailyStats", where="true"):
+    # Adds the counts of table's rows matching where into a DailyStats-shaped table
+    date_col, dept_col, type_col, counter = ROLLUP_SOURCES[table]
+    key = _rollup_key(table, date_col, dept_col, type_col)
+    return f"""
+        INSERT INTO {target} (stat_date, department, test_type, {counter})
+        SELECT {', '.join(key)}, COUNT(*) FROM {table} WHERE {where}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (stat_date, department, test_type) DO UPDATE SET {counter} = {counter} + excluded.{counter}
+    """
+
+
+def rebuild_daily_stats(conn):
+    conn.execute("DELETE FROM DailyStats")
+    for table in ROLLUP_SOURCES:
+        conn.execute(rollup_insert(table))
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ArchivedStats'").fetchone():
+        # Archived rows are gone from the hot tables but still count
+        conn.execute("""
+            INSERT INTO DailyStats (stat_date, department, test_type, admissions, visits, tests)
+            SELECT stat_date, department, test_type, admissions, visits, tests FROM ArchivedStats WHERE true
+            ON CONFLICT (stat_date, department, test_type) DO UPDATE SET
+                admissions = admissions + excluded.admissions,
+                visits = visits + excluded.visits,
+                tests = tests + excluded.tests
+        """)
+
+
+def _count_rollups(conn, sources):
+    # DailyStats refilled by an old step from (table, key expressions, counter) sources
+    conn.execute("DELETE FROM DailyStats")
+    for table, key, counter in sources:
+        conn.execute(f"""
+            INSERT INTO DailyStats (stat_date, department, test_type, {counter})
+            SELECT {key}, COUNT(*) FROM {table} WHERE true
+            GROUP BY 1, 2, 3
+            ON CONFLICT (stat_date, department, test_type) DO UPDATE SET {counter} = {counter} + excluded.{counter}
+        """)
+
+
+# Text keys, '' standing for none
+_DAILY_STATS_TRIGGERS = {
+    "trg_admissions_rollup_insert": (
+        "AFTER INSERT ON Admissions BEGIN "
+        "INSERT INTO DailyStats (stat_date, department, test_type, admissions) "
+        "VALUES (COALESCE(NEW.admit_date, ''), '', '', 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET admissions = admissions + 1; "
+        "END"
+    ),
+    "trg_admissions_rollup_delete": (
+        "AFTER DELETE ON Admissions BEGIN "
+        "UPDATE DailyStats SET admissions = admissions - 1 "
+        "WHERE stat_date = COALESCE(OLD.admit_date, '') AND department = '' AND test_type = ''; "
+        "END"
+    ),
+    "trg_admissions_rollup_update": (
+        "AFTER UPDATE OF admit_date ON Admissions BEGIN "
+        "UPDATE DailyStats SET admissions = admissions - 1 "
+        "WHERE stat_date = COALESCE(OLD.admit_date, '') AND department = '' AND test_type = ''; "
+        "INSERT INTO DailyStats (stat_date, department, test_type, admissions) "
+        "VALUES (COALESCE(NEW.admit_date, ''), '', '', 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET admissions = admissions + 1; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_insert": (
+        "AFTER INSERT ON PatientInflow BEGIN "
+        "INSERT INTO DailyStats (stat_date, department, test_type, visits) "
+        "VALUES (COALESCE(NEW.visit_date, ''), COALESCE(NEW.department, ''), '', 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET visits = visits + 1; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_delete": (
+        "AFTER DELETE ON PatientInflow BEGIN "
+        "UPDATE DailyStats SET visits = visits - 1 "
+        "WHERE stat_date = COALESCE(OLD.visit_date, '') "
+        "AND department = COALESCE(OLD.department, '') "
+        "AND test_type = ''; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_update": (
+        "AFTER UPDATE OF visit_date, department ON PatientInflow BEGIN "
+        "UPDATE DailyStats SET visits = visits - 1 "
+        "WHERE stat_date = COALESCE(OLD.visit_date, '') "
+        "AND department = COALESCE(OLD.department, '') "
+        "AND test_type = ''; "
+        "INSERT INTO DailyStats (stat_date, department, test_type, visits) "
+        "VALUES (COALESCE(NEW.visit_date, ''), COALESCE(NEW.department, ''), '', 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET visits = visits + 1; "
+        "END"
+    ),
+    "trg_patienttests_rollup_insert": (
+        "AFTER INSERT ON PatientTests BEGIN "
+        "INSERT INTO DailyStats (stat_date, department, test_type, tests) "
+        "VALUES (COALESCE(NEW.test_date, ''), '', COALESCE(NEW.test_type, ''), 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET tests = tests + 1; "
+        "END"
+    ),
+    "trg_patienttests_rollup_delete": (
+        "AFTER DELETE ON PatientTests BEGIN "
+        "UPDATE DailyStats SET tests = tests - 1 "
+        "WHERE stat_date = COALESCE(OLD.test_date, '') "
+        "AND department = '' "
+        "AND test_type = COALESCE(OLD.test_type, ''); "
+        "END"
+    ),
+    "trg_patienttests_rollup_update": (
+        "AFTER UPDATE OF test_date, test_type ON PatientTests BEGIN "
+        "UPDATE DailyStats SET tests = tests - 1 "
+        "WHERE stat_date = COALESCE(OLD.test_date, '') "
+        "AND department = '' "
+        "AND test_type = COALESCE(OLD.test_type, ''); "
+        "INSERT INTO DailyStats (stat_date, department, test_type, tests) "
+        "VALUES (COALESCE(NEW.test_date, ''), '', COALESCE(NEW.test_type, ''), 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET tests = tests + 1; "
+        "END"
+    ),
+}
+
+
+def _add_daily_stats(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS DailyStats (
+            stat_date TEXT NOT NULL,
+            department TEXT NOT NULL DEFAULT '',
+            test_type TEXT NOT NULL DEFAULT '',
+            admissions INTEGER NOT NULL DEFAULT 0,
+            visits INTEGER NOT NULL DEFAULT 0,
+            tests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stat_date, department, test_type)
+        ) WITHOUT ROWID
+    ''')
+    _count_rollups(conn, [
+        ("Admissions", "COALESCE(admit_date, ''), '', ''", "admissions"),
+        ("PatientInflow", "COALESCE(visit_date, ''), COALESCE(department, ''), ''", "visits"),
+        ("PatientTests", "COALESCE(test_date, ''), '', COALESCE(test_type, '')", "tests"),
+    ])
+    create_triggers(conn, triggers=_DAILY_STATS_TRIGGERS)
+
+
+_LISTING_INDEXES = {
+    "idx_beds_ward": "Beds(ward COLLATE NOCASE)",
+    "idx_patients_name": "Patients(name COLLATE NOCASE)",
+}
+
+
+def _add_listing_indexes(conn):
+    create_indexes(conn, indexes=_LISTING_INDEXES)
+
+
+def rebuild_search(conn, names=None):
+    for fts in FTS_TABLES if names is None else names:
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _create_search(conn, tables):
+    # Empty FTS tables: fts table -> (content table or view, key, columns)
+    for fts, (content, key, columns) in tables.items():
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {columns},
+                content='{content}', content_rowid='{key}',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+
+
+# Values indexed straight from the base table columns
+_SEARCH_TRIGGERS = {
+    "trg_patientinflow_fts_insert": (
+        "AFTER INSERT ON PatientInflow BEGIN "
+        "INSERT INTO VisitsFTS (rowid, name, department, notes) "
+        "VALUES (NEW.inflow_id, NEW.name, NEW.department, NEW.notes); "
+        "END"
+    ),
+    "trg_patientinflow_fts_delete": (
+        "AFTER DELETE ON PatientInflow BEGIN "
+        "INSERT INTO VisitsFTS (VisitsFTS, rowid, name, department, notes) "
+        "VALUES ('delete', OLD.inflow_id, OLD.name, OLD.department, OLD.notes); "
+        "END"
+    ),
+    "trg_patientinflow_fts_update": (
+        "AFTER UPDATE OF name, department, notes ON PatientInflow BEGIN "
+        "INSERT INTO VisitsFTS (VisitsFTS, rowid, name, department, notes) "
+        "VALUES ('delete', OLD.inflow_id, OLD.name, OLD.department, OLD.notes); "
+        "INSERT INTO VisitsFTS (rowid, name, department, notes) "
+        "VALUES (NEW.inflow_id, NEW.name, NEW.department, NEW.notes); "
+        "END"
+    ),
+    "trg_patienttests_fts_insert": (
+        "AFTER INSERT ON PatientTests BEGIN "
+        "INSERT INTO TestsFTS (rowid, test_type, result) "
+        "VALUES (NEW.test_id, NEW.test_type, NEW.result); "
+        "END"
+    ),
+    "trg_patienttests_fts_delete": (
+        "AFTER DELETE ON PatientTests BEGIN "
+        "INSERT INTO TestsFTS (TestsFTS, rowid, test_type, result) "
+        "VALUES ('delete', OLD.test_id, OLD.test_type, OLD.result); "
+        "END"
+    ),
+    "trg_patienttests_fts_update": (
+        "AFTER UPDATE OF test_type, result ON PatientTests BEGIN "
+        "INSERT INTO TestsFTS (TestsFTS, rowid, test_type, result) "
+        "VALUES ('delete', OLD.test_id, OLD.test_type, OLD.result); "
+        "INSERT INTO TestsFTS (rowid, test_type, result) "
+        "VALUES (NEW.test_id, NEW.test_type, NEW.result); "
+        "END"
+    ),
+    "trg_patients_fts_insert": (
+        "AFTER INSERT ON Patients BEGIN "
+        "INSERT INTO PatientsFTS (rowid, name, department) "
+        "VALUES (NEW.id, NEW.name, NEW.department); "
+        "END"
+    ),
+    "trg_patients_fts_delete": (
+        "AFTER DELETE ON Patients BEGIN "
+        "INSERT INTO PatientsFTS (PatientsFTS, rowid, name, department) "
+        "VALUES ('delete', OLD.id, OLD.name, OLD.department); "
+        "END"
+    ),
+    "trg_patients_fts_update": (
+        "AFTER UPDATE OF name, department ON Patients BEGIN "
+        "INSERT INTO PatientsFTS (PatientsFTS, rowid, name, department) "
+        "VALUES ('delete', OLD.id, OLD.name, OLD.department); "
+        "INSERT INTO PatientsFTS (rowid, name, department) "
+        "VALUES (NEW.id, NEW.name, NEW.department); "
+        "END"
+    ),
+    "trg_inventory_fts_insert": (
+        "AFTER INSERT ON Inventory BEGIN "
+        "INSERT INTO InventoryFTS (rowid, item_name, unit) "
+        "VALUES (NEW.item_id, NEW.item_name, NEW.unit); "
+        "END"
+    ),
+    "trg_inventory_fts_delete": (
+        "AFTER DELETE ON Inventory BEGIN "
+        "INSERT INTO InventoryFTS (InventoryFTS, rowid, item_name, unit) "
+        "VALUES ('delete', OLD.item_id, OLD.item_name, OLD.unit); "
+        "END"
+    ),
+    "trg_inventory_fts_update": (
+        "AFTER UPDATE OF item_name, unit ON Inventory BEGIN "
+        "INSERT INTO InventoryFTS (InventoryFTS, rowid, item_name, unit) "
+        "VALUES ('delete', OLD.item_id, OLD.item_name, OLD.unit); "
+        "INSERT INTO InventoryFTS (rowid, item_name, unit) "
+        "VALUES (NEW.item_id, NEW.item_name, NEW.unit); "
+        "END"
+    ),
+}
+
+
+def _add_full_text_search(conn):
+    search = {
+        "VisitsFTS": ("PatientInflow", "inflow_id", "name, department, notes"),
+        "TestsFTS": ("PatientTests", "test_id", "test_type, result"),
+        "PatientsFTS": ("Patients", "id", "name, department"),
+        "InventoryFTS": ("Inventory", "item_id", "item_name, unit"),
+    }
+    _create_search(conn, search)
+    rebuild_search(conn, list(search))
+    create_triggers(conn, triggers=_SEARCH_TRIGGERS)
+
+
+def _write_dependents():
+    dependents = {}
+    for table in ROLLUP_SOURCES:
+        dependents.setdefault(table.lower(), set()).add("dailystats")
+    for fts, (table, _, _) in FTS_TABLES.items():
+        dependents.setdefault(table.lower(), set()).add(fts.lower())
+    dependents["bedevents"] = {"bedintervals"}
+    return dependents
+
+
+# Tables (lower-cased) a write to the key table also changes through triggers
+WRITE_DEPENDENTS = _write_dependents()
+
+
+def _add_table_versions(conn):
+    # Per-table write generations, bumped by database.transaction() on commit
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS TableVersions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_metrics_tables(conn):
+    # Optional sink for metrics.persist(); the in-memory ring is the primary store
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS QueryMetrics (
+            recorded_at REAL NOT NULL,
+            page TEXT,
+            statement TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            rows INTEGER,
+            cached INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS PageMetrics (
+            recorded_at REAL NOT NULL,
+            page TEXT NOT NULL,
+            seconds REAL NOT NULL
+        )
+    ''')
+
+
+def record_opening_balances(conn):
+    # Items whose stock never went through the ledger get one opening adjustment,
+    # so the movements for an item always sum to its quantity
+    conn.execute("""
+        INSERT INTO StockMovements (item_id, kind, quantity, moved_at, note)
+        SELECT item_id, 'adjustment', quantity, datetime('now'), 'opening balance'
+        FROM Inventory
+        WHERE quantity != 0 AND item_id NOT IN (SELECT item_id FROM StockMovements)
+    """)
+
+
+_STOCK_INDEXES = {
+    # Partial index: holds only items at or below their reorder level
+    "idx_inventory_low_stock": "Inventory(item_id) WHERE quantity <= reorder_level",
+    "idx_movements_item": "StockMovements(item_id, moved_at)",
+    "idx_movements_kind": "StockMovements(kind, moved_at)",
+}
+
+
+def _add_stock_ledger(conn):
+    if "reorder_level" not in _columns(conn, "Inventory"):
+        conn.execute("ALTER TABLE Inventory ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS StockMovements (
+            movement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('receipt', 'issue', 'adjustment')),
+            quantity INTEGER NOT NULL,
+            moved_at TEXT NOT NULL,
+            note TEXT
+        )
+    ''')
+    conn.execute("UPDATE Inventory SET quantity = 0 WHERE quantity IS NULL")
+    create_indexes(conn, indexes=_STOCK_INDEXES)
+    conn.execute("""
+        INSERT INTO StockMovements (item_id, kind, quantity, moved_at, note)
+        SELECT item_id, 'adjustment', quantity, datetime('now'), 'opening balance'
+        FROM Inventory
+        WHERE quantity != 0 AND item_id NOT IN (SELECT item_id FROM StockMovements)
+    """)
+
+
+# Seed recommender rules: the checks the AI Assistant page used to hardcode, plus
+# common ways the same symptoms are written in visit notes
+SYMPTOM_RULES = [
+    ("fever", "Paracetamol"),
+    ("headache", "Ibuprofen"),
+    ("cold", "Cough Syrup"),
+    ("sore throat", "Cough Syrup"),
+    ("stomach pain", "Antacid"),
+    ("vomiting", "Ondansetron"),
+]
+SYMPTOM_SYNONYMS = [
+    ("high temperature", "fever"),
+    ("pyrexia", "fever"),
+    ("febrile", "fever"),
+    ("head ache", "headache"),
+    ("migraine", "headache"),
+    ("common cold", "cold"),
+    ("runny nose", "cold"),
+    ("throat pain", "sore throat"),
+    ("stomach ache", "stomach pain"),
+    ("abdominal pain", "stomach pain"),
+    ("tummy ache", "stomach pain"),
+    ("throwing up", "vomiting"),
+    ("emesis", "vomiting"),
+]
+
+
+def _add_symptom_rules(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS SymptomRules (
+            symptom TEXT NOT NULL,
+            medicine TEXT NOT NULL,
+            PRIMARY KEY (symptom, medicine)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS SymptomSynonyms (
+            phrase TEXT PRIMARY KEY,
+            symptom TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany("INSERT OR IGNORE INTO SymptomRules (symptom, medicine) VALUES (?, ?)", SYMPTOM_RULES)
+    conn.executemany("INSERT OR IGNORE INTO SymptomSynonyms (phrase, symptom) VALUES (?, ?)", SYMPTOM_SYNONYMS)
+
+
+def _add_note_summaries(conn):
+    # Keyed by a hash of the summarizer version and the note text, see summarizer.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS NoteSummaries (
+            content_hash TEXT PRIMARY KEY,
+            summary TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+# Seed dosage bands: the age ladder the AI Assistant page used to hardcode, with the
+# teenage band split on weight. Rows are (medicine, min age, min weight, band, guidance);
+# "*" applies to any medicine without rules of its own.
+DOSAGE_RULES = [
+    ("*", 0, 0, "Infant", "Consult pediatrician. Liquid form only. Usually measured in drops or ml."),
+    ("*", 1, 0, "Toddler", "1/4 of adult dose or syrup-based."),
+    ("*", 6, 0, "Child", "1/2 of adult dose. Avoid strong antibiotics unless prescribed."),
+    ("*", 13, 0, "Teenager", "3/4 of adult dose."),
+    ("*", 13, 50, "Teenager", "Full adult dose."),
+    ("*", 19, 0, "Adult", "Full dose (usually 1 tablet every 6–8 hours)."),
+    ("*", 61, 0, "Elderly", "Start with 1/2 dose. Monitor kidney/liver health."),
+]
+
+
+def _add_dosage_rules(conn):
+    if "weight_kg" not in _columns(conn, "Patients"):
+        conn.execute("ALTER TABLE Patients ADD COLUMN weight_kg REAL")
+    # A band covers ages (and weights) from its lower bounds up to the next band's
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS DosageRules (
+            medicine TEXT NOT NULL COLLATE NOCASE,
+            min_age REAL NOT NULL,
+            min_weight_kg REAL NOT NULL DEFAULT 0,
+            band TEXT NOT NULL,
+            guidance TEXT NOT NULL,
+            PRIMARY KEY (medicine, min_age, min_weight_kg)
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany("""
+        INSERT OR IGNORE INTO DosageRules (medicine, min_age, min_weight_kg, band, guidance) VALUES (?, ?, ?, ?, ?)
+    """, DOSAGE_RULES)
+
+
+# Rows moved to the archive keep counting towards the dashboard
+_ARCHIVE_ROLLUP_DELETES = {
+    "trg_admissions_rollup_delete": (
+        "AFTER DELETE ON Admissions WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags "
+        "WHERE flag = 'archiving') BEGIN "
+        "UPDATE DailyStats SET admissions = admissions - 1 "
+        "WHERE stat_date = COALESCE(OLD.admit_date, '') AND department = '' AND test_type = ''; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_delete": (
+        "AFTER DELETE ON PatientInflow WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags "
+        "WHERE flag = 'archiving') BEGIN "
+        "UPDATE DailyStats SET visits = visits - 1 "
+        "WHERE stat_date = COALESCE(OLD.visit_date, '') "
+        "AND department = COALESCE(OLD.department, '') "
+        "AND test_type = ''; "
+        "END"
+    ),
+    "trg_patienttests_rollup_delete": (
+        "AFTER DELETE ON PatientTests WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags "
+        "WHERE flag = 'archiving') BEGIN "
+        "UPDATE DailyStats SET tests = tests - 1 "
+        "WHERE stat_date = COALESCE(OLD.test_date, '') "
+        "AND department = '' "
+        "AND test_type = COALESCE(OLD.test_type, ''); "
+        "END"
+    ),
+}
+_ARCHIVE_SUPPORT_INDEXES = {
+    # Archive candidates, oldest discharge first; see archive.py
+    "idx_patients_discharged": "Patients(discharge_date) WHERE status = 'Discharged'",
+}
+
+
+def _add_archive_support(conn):
+    # A flag row inserted and deleted inside one write transaction; no other
+    # connection ever sees it (see archive.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS MaintenanceFlags (
+            flag TEXT PRIMARY KEY
+        ) WITHOUT ROWID
+    ''')
+    # Counts of rows moved to the archive, so DailyStats can still be rebuilt
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ArchivedStats (
+            stat_date TEXT NOT NULL,
+            department TEXT NOT NULL DEFAULT '',
+            test_type TEXT NOT NULL DEFAULT '',
+            admissions INTEGER NOT NULL DEFAULT 0,
+            visits INTEGER NOT NULL DEFAULT 0,
+            tests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stat_date, department, test_type)
+        ) WITHOUT ROWID
+    ''')
+    drop_triggers(conn, list(_ARCHIVE_ROLLUP_DELETES))
+    create_triggers(conn, triggers=_ARCHIVE_ROLLUP_DELETES)
+    create_indexes(conn, indexes=_ARCHIVE_SUPPORT_INDEXES)
+
+
+def rebuild_bed_intervals(conn):
+    # Stays from the event log: each Occupied event until the bed's next event
+    conn.execute("DELETE FROM BedIntervals")
+    conn.execute("""
+        INSERT OR REPLACE INTO BedIntervals (bed_id, started, ended, ward, patient_id)
+        SELECT bed_id, happened_at, next_at, ward, patient_id FROM (
+            SELECT bed_id, happened_at, status, ward, patient_id,
+                   LEAD(happened_at) OVER (PARTITION BY bed_id ORDER BY happened_at, event_id) AS next_at
+            FROM BedEvents
+        ) WHERE status = 'Occupied'
+    """)
+
+
+def record_open_stays(conn):
+    # Occupied beds without an open stay (occupied before the event log, or by an
+    # import) get an opening event, dated from their admitted patient if any
+    conn.execute("""
+        INSERT INTO BedEvents (bed_id, patient_id, kind, status, ward, happened_at)
+        SELECT bed_id, patient_id, 'opening', 'Occupied', ward,
+               COALESCE(date((SELECT admission_date FROM Patients WHERE id = patient_id)) || ' 00:00:00',
+                        datetime('now', 'localtime'))
+        FROM (
+            SELECT b.bed_id, b.ward,
+                   (SELECT MIN(id) FROM Patients p WHERE p.bed_id = b.bed_id AND p.status = 'Admitted') AS patient_id
+            FROM Beds b
+            WHERE b.status = 'Occupied' AND b.bed_id NOT IN (SELECT bed_id FROM BedIntervals WHERE ended IS NULL)
+        )
+    """)
+
+
+_BED_EVENT_INDEXES = {
+    "idx_bed_events_bed": "BedEvents(bed_id, happened_at)",
+    # Stays overlapping a window: open stays plus those ending after its start
+    "idx_bed_intervals_ended": "BedIntervals(ended, started)",
+}
+
+
+def _add_bed_events(conn):
+    # Append-only log of bed status changes; status is the bed's status after the event
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS BedEvents (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bed_id INTEGER NOT NULL,
+            patient_id INTEGER,
+            kind TEXT NOT NULL CHECK (kind IN ('opening', 'admit', 'discharge', 'transfer', 'status')),
+            status TEXT NOT NULL,
+            ward TEXT,
+            happened_at TEXT NOT NULL
+        )
+    ''')
+    # One row per stay, kept by trg_bedevents_intervals; ended is NULL while occupied
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS BedIntervals (
+            bed_id INTEGER NOT NULL,
+            started TEXT NOT NULL,
+            ended TEXT,
+            ward TEXT,
+            patient_id INTEGER,
+            PRIMARY KEY (bed_id, started)
+        ) WITHOUT ROWID
+    ''')
+    create_indexes(conn, indexes=_BED_EVENT_INDEXES)
+    create_triggers(conn, triggers={"trg_bedevents_intervals": _INTERVAL_TRIGGER})
+    # record_open_stays() as it was while dates were ISO text
+    conn.execute("""
+        INSERT INTO BedEvents (bed_id, patient_id, kind, status, ward, happened_at)
+        SELECT bed_id, patient_id, 'opening', 'Occupied', ward,
+               COALESCE((SELECT admission_date FROM Patients WHERE id = patient_id) || ' 00:00:00',
+                        datetime('now', 'localtime'))
+        FROM (
+            SELECT b.bed_id, b.ward,
+                   (SELECT MIN(id) FROM Patients p WHERE p.bed_id = b.bed_id AND p.status = 'Admitted') AS patient_id
+            FROM Beds b
+            WHERE b.status = 'Occupied' AND b.bed_id NOT IN (SELECT bed_id FROM BedIntervals WHERE ended IS NULL)
+        )
+    """)
+
+
+def log_table_change(conn, table):
+    # A ChangeLog row without a row id: every row of table may have changed, as
+    # after a bulk load with the change triggers dropped
+    conn.execute("INSERT INTO ChangeLog (table_name) VALUES (?)", (table.lower(),))
+
+
+# ChangeLog keeps the last 10000 changes; older ones are pruned as new ones arrive
+_CHANGE_LOG_TRIGGERS = {
+    "trg_beds_changes_insert": (
+        "AFTER INSERT ON Beds BEGIN "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'beds', NEW.bed_id; "
+        "END"
+    ),
+    "trg_beds_changes_delete": (
+        "AFTER DELETE ON Beds BEGIN "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'beds', OLD.bed_id; "
+        "END"
+    ),
+    "trg_beds_changes_update": (
+        "AFTER UPDATE ON Beds BEGIN "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'beds', NEW.bed_id; "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'beds', OLD.bed_id "
+        "WHERE OLD.bed_id IS NOT NEW.bed_id; "
+        "END"
+    ),
+    "trg_patients_changes_insert": (
+        "AFTER INSERT ON Patients BEGIN "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'patients', NEW.id; "
+        "END"
+    ),
+    "trg_patients_changes_delete": (
+        "AFTER DELETE ON Patients BEGIN "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'patients', OLD.id; "
+        "END"
+    ),
+    "trg_patients_changes_update": (
+        "AFTER UPDATE ON Patients BEGIN "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'patients', NEW.id; "
+        "INSERT INTO ChangeLog (table_name, row_id) SELECT 'patients', OLD.id "
+        "WHERE OLD.id IS NOT NEW.id; "
+        "END"
+    ),
+    "trg_changelog_prune": (
+        "AFTER INSERT ON ChangeLog BEGIN "
+        "DELETE FROM ChangeLog "
+        "WHERE seq <= NEW.seq - 10000; "
+        "END"
+    ),
+}
+_CHANGE_LOG_INDEXES = {
+    # The patient in each bed, for the live bed board
+    "idx_patients_admitted_bed": "Patients(bed_id) WHERE status = 'Admitted'",
+}
+
+
+def _add_change_log(conn):
+    # Committed row changes to CHANGE_TABLES, in commit order; read by live.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER
+        )
+    ''')
+    create_indexes(conn, indexes=_CHANGE_LOG_INDEXES)
+    create_triggers(conn, triggers=_CHANGE_LOG_TRIGGERS)
+
+
+def intern_names(conn, lookup, select, params=()):
+    # Adds the names select yields to lookup, new names in sorted order
+    conn.execute(f"""
+        INSERT INTO {lookup} (name)
+        WITH names (value) AS ({select})
+        SELECT DISTINCT value FROM names
+        WHERE value != '' AND value NOT IN (SELECT name FROM {lookup})
+        ORDER BY value
+    """, params)
+
+
+def _compact_table(conn, table, days, lookup_of):
+    # Rebuilds table with its day and lookup columns retyped INTEGER and converted.
+    # Indexes are recreated from their SQL; triggers are left to the caller.
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    columns = _columns(conn, table)
+    values = []
+    for col in columns:
+        lookup = lookup_of.get((table, col))
+        if col in days:
+            values.append(f"CAST(julianday({col}) + 0.5 AS INTEGER)")
+        elif lookup:
+            values.append(f"(SELECT id FROM {lookup} WHERE name = NULLIF({col}, ''))")
+        else:
+            values.append(col)
+            continue
+        sql = re.sub(rf"(\b{col}\s+)TEXT\b", r"\1INTEGER", sql, count=1)
+    indexes = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )]
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    conn.execute(re.sub(rf"\b{table}\b", f"{table}_compact", sql, count=1))
+    conn.execute(f"INSERT INTO {table}_compact ({', '.join(columns)}) SELECT {', '.join(values)} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_compact RENAME TO {table}")
+    if sequence:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+    for index in indexes:
+        conn.execute(index)
+
+
+def _compact_stats(conn, table):
+    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_text")
+    conn.execute(f'''
+        CREATE TABLE {table} (
+            stat_date INTEGER NOT NULL,
+            department INTEGER NOT NULL DEFAULT 0,
+            test_type INTEGER NOT NULL DEFAULT 0,
+            admissions INTEGER NOT NULL DEFAULT 0,
+            visits INTEGER NOT NULL DEFAULT 0,
+            tests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stat_date, department, test_type)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f"""
+        INSERT INTO {table} (stat_date, department, test_type, admissions, visits, tests)
+        SELECT CAST(julianday(stat_date) + 0.5 AS INTEGER),
+               COALESCE((SELECT id FROM Departments WHERE name = NULLIF(department, '')), 0),
+               COALESCE((SELECT id FROM TestTypes WHERE name = NULLIF(test_type, '')), 0),
+               SUM(admissions), SUM(visits), SUM(tests)
+        FROM {table}_text WHERE stat_date != ''
+        GROUP BY 1, 2, 3
+    """)
+    conn.execute(f"DROP TABLE {table}_text")
+
+
+# The columns _compact_columns converted: lookup -> (table, column) pairs, and day columns
+_COMPACT_LOOKUPS = {
+    "Genders": [("Patients", "gender"), ("PatientInflow", "gender")],
+    "Departments": [("Patients", "department"), ("PatientInflow", "department")],
+    "TestTypes": [("PatientTests", "test_type")],
+}
+_COMPACT_DAYS = {
+    "Patients": ["admission_date", "discharge_date"],
+    "Admissions": ["admit_date", "discharge_date"],
+    "PatientInflow": ["visit_date"],
+    "PatientTests": ["test_date"],
+}
+# Rollup keys are day numbers and codes, 0 standing for none; search indexes the lookup names
+_COMPACT_TRIGGERS = {
+    "trg_admissions_rollup_insert": (
+        "AFTER INSERT ON Admissions BEGIN "
+        "INSERT INTO DailyStats (stat_date, department, test_type, admissions) "
+        "VALUES (COALESCE(NEW.admit_date, 0), 0, 0, 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET admissions = admissions + 1; "
+        "END"
+    ),
+    "trg_admissions_rollup_delete": (
+        "AFTER DELETE ON Admissions WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags "
+        "WHERE flag = 'archiving') BEGIN "
+        "UPDATE DailyStats SET admissions = admissions - 1 "
+        "WHERE stat_date = COALESCE(OLD.admit_date, 0) AND department = 0 AND test_type = 0; "
+        "END"
+    ),
+    "trg_admissions_rollup_update": (
+        "AFTER UPDATE OF admit_date ON Admissions BEGIN "
+        "UPDATE DailyStats SET admissions = admissions - 1 "
+        "WHERE stat_date = COALESCE(OLD.admit_date, 0) AND department = 0 AND test_type = 0; "
+        "INSERT INTO DailyStats (stat_date, department, test_type, admissions) "
+        "VALUES (COALESCE(NEW.admit_date, 0), 0, 0, 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET admissions = admissions + 1; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_insert": (
+        "AFTER INSERT ON PatientInflow BEGIN "
+        "INSERT INTO DailyStats (stat_date, department, test_type, visits) "
+        "VALUES (COALESCE(NEW.visit_date, 0), COALESCE(NEW.department, 0), 0, 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET visits = visits + 1; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_delete": (
+        "AFTER DELETE ON PatientInflow WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags "
+        "WHERE flag = 'archiving') BEGIN "
+        "UPDATE DailyStats SET visits = visits - 1 "
+        "WHERE stat_date = COALESCE(OLD.visit_date, 0) "
+        "AND department = COALESCE(OLD.department, 0) "
+        "AND test_type = 0; "
+        "END"
+    ),
+    "trg_patientinflow_rollup_update": (
+        "AFTER UPDATE OF visit_date, department ON PatientInflow BEGIN "
+        "UPDATE DailyStats SET visits = visits - 1 "
+        "WHERE stat_date = COALESCE(OLD.visit_date, 0) "
+        "AND department = COALESCE(OLD.department, 0) "
+        "AND test_type = 0; "
+        "INSERT INTO DailyStats (stat_date, department, test_type, visits) "
+        "VALUES (COALESCE(NEW.visit_date, 0), COALESCE(NEW.department, 0), 0, 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET visits = visits + 1; "
+        "END"
+    ),
+    "trg_patienttests_rollup_insert": (
+        "AFTER INSERT ON PatientTests BEGIN "
+        "INSERT INTO DailyStats (stat_date, department, test_type, tests) "
+        "VALUES (COALESCE(NEW.test_date, 0), 0, COALESCE(NEW.test_type, 0), 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET tests = tests + 1; "
+        "END"
+    ),
+    "trg_patienttests_rollup_delete": (
+        "AFTER DELETE ON PatientTests WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags "
+        "WHERE flag = 'archiving') BEGIN "
+        "UPDATE DailyStats SET tests = tests - 1 "
+        "WHERE stat_date = COALESCE(OLD.test_date, 0) "
+        "AND department = 0 "
+        "AND test_type = COALESCE(OLD.test_type, 0); "
+        "END"
+    ),
+    "trg_patienttests_rollup_update": (
+        "AFTER UPDATE OF test_date, test_type ON PatientTests BEGIN "
+        "UPDATE DailyStats SET tests = tests - 1 "
+        "WHERE stat_date = COALESCE(OLD.test_date, 0) "
+        "AND department = 0 "
+        "AND test_type = COALESCE(OLD.test_type, 0); "
+        "INSERT INTO DailyStats (stat_date, department, test_type, tests) "
+        "VALUES (COALESCE(NEW.test_date, 0), 0, COALESCE(NEW.test_type, 0), 1) "
+        "ON CONFLICT (stat_date, department, test_type) DO UPDATE SET tests = tests + 1; "
+        "END"
+    ),
+    "trg_patientinflow_fts_insert": (
+        "AFTER INSERT ON PatientInflow BEGIN "
+        "INSERT INTO VisitsFTS (rowid, name, department, notes) "
+        "VALUES (NEW.inflow_id, NEW.name, (SELECT name FROM Departments WHERE id = NEW.department), NEW.notes); "
+        "END"
+    ),
+    "trg_patientinflow_fts_delete": (
+        "AFTER DELETE ON PatientInflow BEGIN "
+        "INSERT INTO VisitsFTS (VisitsFTS, rowid, name, department, notes) "
+        "VALUES ('delete', OLD.inflow_id, OLD.name, "
+        "(SELECT name FROM Departments WHERE id = OLD.department), OLD.notes); "
+        "END"
+    ),
+    "trg_patientinflow_fts_update": (
+        "AFTER UPDATE OF name, department, notes ON PatientInflow BEGIN "
+        "INSERT INTO VisitsFTS (VisitsFTS, rowid, name, department, notes) "
+        "VALUES ('delete', OLD.inflow_id, OLD.name, "
+        "(SELECT name FROM Departments WHERE id = OLD.department), OLD.notes); "
+        "INSERT INTO VisitsFTS (rowid, name, department, notes) "
+        "VALUES (NEW.inflow_id, NEW.name, (SELECT name FROM Departments WHERE id = NEW.department), NEW.notes); "
+        "END"
+    ),
+    "trg_patienttests_fts_insert": (
+        "AFTER INSERT ON PatientTests BEGIN "
+        "INSERT INTO TestsFTS (rowid, test_type, result) "
+        "VALUES (NEW.test_id, (SELECT name FROM TestTypes WHERE id = NEW.test_type), NEW.result); "
+        "END"
+    ),
+    "trg_patienttests_fts_delete": (
+        "AFTER DELETE ON PatientTests BEGIN "
+        "INSERT INTO TestsFTS (TestsFTS, rowid, test_type, result) "
+        "VALUES ('delete', OLD.test_id, (SELECT name FROM TestTypes WHERE id = OLD.test_type), OLD.result); "
+        "END"
+    ),
+    "trg_patienttests_fts_update": (
+        "AFTER UPDATE OF test_type, result ON PatientTests BEGIN "
+        "INSERT INTO TestsFTS (TestsFTS, rowid, test_type, result) "
+        "VALUES ('delete', OLD.test_id, (SELECT name FROM TestTypes WHERE id = OLD.test_type), OLD.result); "
+        "INSERT INTO TestsFTS (rowid, test_type, result) "
+        "VALUES (NEW.test_id, (SELECT name FROM TestTypes WHERE id = NEW.test_type), NEW.result); "
+        "END"
+    ),
+    "trg_patients_fts_insert": (
+        "AFTER INSERT ON Patients BEGIN "
+        "INSERT INTO PatientsFTS (rowid, name, department) "
+        "VALUES (NEW.id, NEW.name, (SELECT name FROM Departments WHERE id = NEW.department)); "
+        "END"
+    ),
+    "trg_patients_fts_delete": (
+        "AFTER DELETE ON Patients BEGIN "
+        "INSERT INTO PatientsFTS (PatientsFTS, rowid, name, department) "
+        "VALUES ('delete', OLD.id, OLD.name, (SELECT name FROM Departments WHERE id = OLD.department)); "
+        "END"
+    ),
+    "trg_patients_fts_update": (
+        "AFTER UPDATE OF name, department ON Patients BEGIN "
+        "INSERT INTO PatientsFTS (PatientsFTS, rowid, name, department) "
+        "VALUES ('delete', OLD.id, OLD.name, (SELECT name FROM Departments WHERE id = OLD.department)); "
+        "INSERT INTO PatientsFTS (rowid, name, department) "
+        "VALUES (NEW.id, NEW.name, (SELECT name FROM Departments WHERE id = NEW.department)); "
+        "END"
+    ),
+    "trg_inventory_fts_insert": (
+        "AFTER INSERT ON Inventory BEGIN "
+        "INSERT INTO InventoryFTS (rowid, item_name, unit) "
+        "VALUES (NEW.item_id, NEW.item_name, NEW.unit); "
+        "END"
+    ),
+    "trg_inventory_fts_delete": (
+        "AFTER DELETE ON Inventory BEGIN "
+        "INSERT INTO InventoryFTS (InventoryFTS, rowid, item_name, unit) "
+        "VALUES ('delete', OLD.item_id, OLD.item_name, OLD.unit); "
+        "END"
+    ),
+    "trg_inventory_fts_update": (
+        "AFTER UPDATE OF item_name, unit ON Inventory BEGIN "
+        "INSERT INTO InventoryFTS (InventoryFTS, rowid, item_name, unit) "
+        "VALUES ('delete', OLD.item_id, OLD.item_name, OLD.unit); "
+        "INSERT INTO InventoryFTS (rowid, item_name, unit) "
+        "VALUES (NEW.item_id, NEW.item_name, NEW.unit); "
+        "END"
+    ),
+    "trg_bedevents_intervals": _INTERVAL_TRIGGER,
+    **_CHANGE_LOG_TRIGGERS,
+}
+
+
+def _compact_columns(conn):
+    # Dates become day numbers and gender, department and test type lookup codes,
+    # in the tables and in the DailyStats keys; full-text search reads the names
+    # through views. Every table is rebuilt, so triggers go first.
+    lookup_of = {(table, col): lookup for lookup, columns in _COMPACT_LOOKUPS.items() for table, col in columns}
+    for lookup in _COMPACT_LOOKUPS:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {lookup} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    for lookup, sources in _COMPACT_LOOKUPS.items():
+        intern_names(conn, lookup, " UNION ALL ".join(f"SELECT {col} FROM {table}" for table, col in sources))
+    intern_names(conn, "Departments", "SELECT department FROM ArchivedStats")
+    intern_names(conn, "TestTypes", "SELECT test_type FROM ArchivedStats")
+    drop_triggers(conn, [*_DAILY_STATS_TRIGGERS, *_SEARCH_TRIGGERS, "trg_bedevents_intervals", *_CHANGE_LOG_TRIGGERS])
+    search = {
+        "VisitsFTS": ("PatientInflowSearch", "inflow_id", "name, department, notes"),
+        "TestsFTS": ("PatientTestsSearch", "test_id", "test_type, result"),
+        "PatientsFTS": ("PatientsSearch", "id", "name, department"),
+    }
+    for fts in search:
+        conn.execute(f"DROP TABLE IF EXISTS {fts}")
+    for table in sorted({table for table, _ in lookup_of} | set(_COMPACT_DAYS)):
+        _compact_table(conn, table, _COMPACT_DAYS.get(table, ()), lookup_of)
+    _compact_stats(conn, "ArchivedStats")
+    _compact_stats(conn, "DailyStats")
+    _count_rollups(conn, [
+        ("Admissions", "COALESCE(admit_date, 0), 0, 0", "admissions"),
+        ("PatientInflow", "COALESCE(visit_date, 0), COALESCE(department, 0), 0", "visits"),
+        ("PatientTests", "COALESCE(test_date, 0), 0, COALESCE(test_type, 0)", "tests"),
+    ])
+    conn.execute("""
+        INSERT INTO DailyStats (stat_date, department, test_type, admissions, visits, tests)
+        SELECT stat_date, department, test_type, admissions, visits, tests FROM ArchivedStats WHERE true
+        ON CONFLICT (stat_date, department, test_type) DO UPDATE SET
+            admissions = admissions + excluded.admissions,
+            visits = visits + excluded.visits,
+            tests = tests + excluded.tests
+    """)
+    conn.execute(
+        "CREATE VIEW IF NOT EXISTS PatientInflowSearch AS SELECT row.inflow_id AS inflow_id, row.name AS name, "
+        "(SELECT name FROM Departments WHERE id = row.department) AS department, row.notes AS notes "
+        "FROM PatientInflow row"
+    )
+    conn.execute(
+        "CREATE VIEW IF NOT EXISTS PatientTestsSearch AS SELECT row.test_id AS test_id, "
+        "(SELECT name FROM TestTypes WHERE id = row.test_type) AS test_type, row.result AS result "
+        "FROM PatientTests row"
+    )
+    conn.execute(
+        "CREATE VIEW IF NOT EXISTS PatientsSearch AS SELECT row.id AS id, row.name AS name, "
+        "(SELECT name FROM Departments WHERE id = row.department) AS department "
+        "FROM Patients row"
+    )
+    _create_search(conn, search)
+    rebuild_search(conn, list(search))
+    create_triggers(conn, triggers=_COMPACT_TRIGGERS)
+    conn.execute("ANALYZE")
+
+
+_IDENTITY_INDEXES = {
+    # Master patient index: blocking keys, then the linked records of each identity; see identity.py
+    "idx_identities_block": "PatientIdentities(name_key, gender, birth_band)",
+    "idx_patients_identity": "Patients(identity_id) WHERE identity_id IS NOT NULL",
+    "idx_inflow_identity": "PatientInflow(identity_id) WHERE identity_id IS NOT NULL",
+    "idx_admissions_identity": "Admissions(identity_id) WHERE identity_id IS NOT NULL",
+}
+
+
+def _add_patient_index(conn):
+    # One row per person; records are linked as the app writes them and backfilled
+    # by identity.link(). birth_band is birth_year in identity.BAND_YEARS-year bands.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS PatientIdentities (
+            mpi_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            gender INTEGER,
+            birth_year INTEGER,
+            birth_band INTEGER
+        )
+    ''')
+    for table in ("Patients", "PatientInflow", "Admissions"):
+        if "identity_id" not in _columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN identity_id INTEGER")
+    create_indexes(conn, indexes=_IDENTITY_INDEXES)
+
+
+# The current schema's indexes and triggers, for code that drops and rebuilds them
+# around bulk loads. A change goes in a new step with DDL of its own, merged in here.
+INDEXES = {
+    **_HOT_INDEXES, **_LISTING_INDEXES, **_STOCK_INDEXES, **_ARCHIVE_SUPPORT_INDEXES,
+    **_BED_EVENT_INDEXES, **_CHANGE_LOG_INDEXES, **_IDENTITY_INDEXES,
+}
+TRIGGERS = dict(_COMPACT_TRIGGERS)
+
+MIGRATIONS = [
+    _baseline,
+    _reconcile_legacy_columns,
+    _add_hot_indexes,
+    _add_daily_stats,
+    _add_listing_indexes,
+    _add_full_text_search,
+    _add_table_versions,
+    _add_metrics_tables,
+    _add_stock_ledger,
+    _add_symptom_rules,
+    _add_note_summaries,
+    _add_dosage_rules,
+    _add_archive_support,
+    _add_bed_events,
+    _add_change_log,
+    _compact_columns,
+    _add_patient_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-read under the write lock in case another process migrated first
+        version = schema_version(conn)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -0,0 +1,96 @@
+# Network-wide reads across every facility shard. fan_out() runs a function
+# against each shard in parallel and returns the results per facility;
+# load_rollup() reads DailyStats from all shards in one statement over a
+# read-only connection with the shards ATTACHed.
+
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import pandas as pd
+
+from codes import day, frame
+import database
+import fulltext
+import metrics
+import stats
+
+MAX_WORKERS = 8
+# SQLite's default limit on attached databases; larger networks fan out instead
+MAX_ATTACHED = 10
+
+
+def fan_out(fn, names=None):
+    # fn() runs on a worker thread bound to each facility's shard
+    names = list(names or database.FACILITIES)
+    page = metrics.current_page()
+
+    def run(name):
+        metrics.tag_page(page)
+        database.use_facility(name)
+        try:
+            return fn()
+        finally:
+            database.use_facility(None)
+            metrics.tag_page(None)
+
+    if len(names) == 1:
+        return {names[0]: run(names[0])}
+    with ThreadPoolExecutor(min(len(names), MAX_WORKERS)) as pool:
+        return dict(zip(names, pool.map(run, names)))
+
+
+def attached(names):
+    # In-memory connection with each shard attached read-only as shard0, shard1, ...
+    conn = sqlite3.connect(":memory:", uri=True, check_same_thread=False, isolation_level=None)
+    for number, name in enumerate(names):
+        conn.execute(f"ATTACH DATABASE ? AS shard{number}", (f"file:{database.FACILITIES[name]}?mode=ro",))
+    return conn
+
+
+# Lookup codes differ between shards, so the network rollup carries the names
+NETWORK_TYPES = {"stat_date": "day", "department": "category", "test_type": "category"}
+
+
+def _rollup_union(count):
+    return " UNION ALL ".join(f"""
+        SELECT ?, s.stat_date, d.name, t.name, s.admissions, s.visits, s.tests
+        FROM shard{number}.DailyStats s
+        LEFT JOIN shard{number}.Departments d ON d.id = s.department
+        LEFT JOIN shard{number}.TestTypes t ON t.id = s.test_type
+        WHERE s.stat_date BETWEEN ? AND ?
+    """ for number in range(count))
+
+
+def load_rollup(start_date, end_date, names=None):
+    # stats.load_rollup() for the whole network, with a facility column
+    names = list(names or database.FACILITIES)
+    start, end = day(start_date), day(end_date)
+    if len(names) > MAX_ATTACHED:
+        parts = fan_out(lambda: stats.load_rollup(start_date, end_date), names)
+        rollup = pd.concat([part.assign(facility=name) for name, part in parts.items()], ignore_index=True)
+        return rollup[["facility"] + stats.ROLLUP_COLUMNS].astype({"department": "category", "test_type": "category"})
+    sql = _rollup_union(len(names))
+    params = [value for name in names for value in (name, start, end)]
+    started = time.perf_counter()
+    with closing(attached(names)) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    metrics.record_query(sql, started, len(rows))
+    return frame(rows, ["facility"] + stats.ROLLUP_COLUMNS, NETWORK_TYPES)
+
+
+def by_facility(rollup):
+    return rollup.groupby("facility")[["admissions", "visits", "tests"]].sum()
+
+
+def search(text, scopes=None, page=0, per_page=fulltext.RESULTS_PER_PAGE, names=None):
+    # Each shard returns its best hits up to the end of this page; merged by rank.
+    # Returns ((facility, hit) pairs, whether another page follows).
+    depth = (page + 1) * per_page + 1
+    results = fan_out(lambda: fulltext.search(text, scopes, 0, depth)[0], names)
+    merged = sorted(
+        ((name, hit) for name, hits in results.items() for hit in hits),
+        key=lambda pair: pair[1].rank,
+    )
+    return merged[page * per_page:(page + 1) * per_page], len(merged) > (page + 1) * per_page
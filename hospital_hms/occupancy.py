@@ -0,0 +1,103 @@
+# Bed occupancy over time from BedIntervals, the stays derived from the BedEvents
+# log. A point in time reads each bed's latest stay through the (bed_id, started)
+# key; timelines load the stays overlapping a window once and count them on a
+# time grid with numpy. Times are naive local timestamps throughout.
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import database
+from cache import query
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def _stamp(value):
+    return pd.Timestamp(value).isoformat(sep=" ", timespec="seconds")
+
+
+def capacity():
+    # ward -> beds it has now
+    return Counter(ward for (ward,) in query("SELECT ward FROM Beds"))
+
+
+def occupancy_at(when):
+    at = _stamp(when)
+    occupied = Counter(ward for (ward,) in query("""
+        SELECT i.ward
+        FROM Beds b
+        JOIN BedIntervals i ON i.bed_id = b.bed_id AND i.started = (
+            SELECT MAX(started) FROM BedIntervals WHERE bed_id = b.bed_id AND started <= ?
+        )
+        WHERE i.ended IS NULL OR i.ended > ?
+    """, (at, at)))
+    beds = capacity()
+    wards = sorted(set(beds) | set(occupied), key=lambda ward: ward or "")
+    df = pd.DataFrame({
+        "Ward": wards,
+        "Beds": [beds[ward] for ward in wards],
+        "Occupied": [occupied[ward] for ward in wards],
+    })
+    df["Utilization"] = (df["Occupied"] / df["Beds"].where(df["Beds"] > 0)).round(3)
+    return df
+
+
+def timeline(start, end, freq="h"):
+    # Occupied beds per ward (columns) at each point of the grid over [start, end).
+    # A stay counts at t when started <= t < ended, as in occupancy_at().
+    grid = pd.date_range(start, end, freq=freq, inclusive="left")
+    rows = database.query("""
+        SELECT ward, unixepoch(started), COALESCE(unixepoch(ended), unixepoch(?))
+        FROM BedIntervals
+        WHERE (ended IS NULL OR ended > ?) AND started < ?
+    """, (_stamp(end), _stamp(start), _stamp(end)))
+    stays = pd.DataFrame(rows, columns=["ward", "started", "ended"]).dropna(subset=["started"])
+    codes, wards = pd.factorize(stays["ward"].fillna(""), sort=True)
+    points = grid.as_unit("s").asi8
+    width = len(points) + 1
+    first = np.searchsorted(points, stays["started"].to_numpy(dtype=np.int64), side="left")
+    last = np.searchsorted(points, stays["ended"].to_numpy(dtype=np.int64), side="left")
+    size = len(wards) * width
+    delta = np.bincount(codes * width + first, minlength=size) - np.bincount(codes * width + last, minlength=size)
+    counts = delta.reshape(len(wards), width)[:, :-1].cumsum(axis=1)
+    return pd.DataFrame(counts.T, index=grid, columns=list(wards))
+
+
+def utilization(counts):
+    # A timeline() as a fraction of each ward's current beds
+    beds = pd.Series(capacity(), dtype=float)
+    return counts / beds.reindex(counts.columns).where(lambda total: total > 0)
+
+
+def heatmap(start, end, wards=None):
+    # Mean utilization by weekday (rows) and hour of day (columns) over the selected wards
+    counts = timeline(start, end, "h")
+    beds = capacity()
+    wards = [ward for ward in (wards or counts.columns) if ward in counts.columns]
+    total = sum(beds[ward] for ward in wards)
+    share = counts[wards].sum(axis=1) / (total or np.nan)
+    grid = share.groupby([share.index.dayofweek, share.index.hour]).mean().unstack()
+    return grid.rename(index=dict(enumerate(WEEKDAYS))).reindex(WEEKDAYS)
+
+
+def length_of_stay(start, end):
+    # Stays that ended in [start, end), per ward
+    stays = pd.DataFrame(database.query("""
+        SELECT ward, julianday(ended) - julianday(started)
+        FROM BedIntervals
+        WHERE ended >= ? AND ended < ?
+    """, (_stamp(start), _stamp(end))), columns=["Ward", "Days"])
+    summary = stays.groupby("Ward")["Days"].agg(["count", "mean", "median"])
+    summary.columns = ["Stays", "Mean Days", "Median Days"]
+    return summary.round(2).reset_index()
+
+
+def bed_events(bed_id, limit=50):
+    return pd.DataFrame(query("""
+        SELECT happened_at, kind, status, ward, patient_id
+        FROM BedEvents
+        WHERE bed_id = ?
+        ORDER BY happened_at DESC LIMIT ?
+    """, (bed_id, limit)), columns=["When", "Event", "Status", "Ward", "Patient ID"])
@@ -0,0 +1,144 @@
+from collections import namedtuple
+
+from cache import query
+
+PAGE_SIZE = 50
+PAGE_SIZES = [25, 50, 100, 200]
+
+Page = namedtuple("Page", ["rows", "first_key", "last_key", "has_prev", "has_next"])
+
+# Keyset-paginated list views. "keys" are (sort expression, row position) pairs;
+# every sort must be backed by an index so a page is a bounded index range scan.
+# "filters" name the optional predicates a page may apply. The leading key of a
+# multi-key sort may be NULL: SQLite sorts NULL first, so those rows form a segment
+# of their own, read after the others walking down and before them walking up.
+LISTINGS = {
+    "visits": {
+        "select": """
+            SELECT inflow_id, name, age, gender, visit_date, department, notes
+            FROM PatientInflow
+        """,
+        "keys": [("visit_date", 4), ("inflow_id", 0)],
+        "descending": True,
+    },
+    "tests": {
+        "select": """
+            SELECT t.test_id, p.name, t.test_type, t.test_date, t.result, t.patient_id
+            FROM PatientTests t
+            JOIN Patients p ON t.patient_id = p.id
+        """,
+        "keys": [("t.test_id", 0)],
+    },
+    "admitted": {
+        "select": """
+            SELECT id, name, age, gender, admission_date, department
+            FROM Patients
+        """,
+        "keys": [("id", 0)],
+        "where": "status = 'Admitted'",
+    },
+    "beds": {
+        "select": "SELECT bed_id, ward, room, status FROM Beds",
+        "keys": [("ward COLLATE NOCASE", 1), ("bed_id", 0)],
+        "filters": {
+            "status": "status = ?",
+            "ward": "ward = ? COLLATE NOCASE",
+        },
+    },
+    "inventory": {
+        "select": "SELECT item_id, item_name, quantity, unit, reorder_level FROM Inventory",
+        "keys": [("item_id", 0)],
+        "filters": {
+            "name": "item_id IN (SELECT rowid FROM InventoryFTS WHERE InventoryFTS MATCH ?)",
+        },
+    },
+}
+
+
+def listing_sql(name, filter_names=(), cursor=False, backward=False, segment=None):
+    # segment: "null" or "value" keeps to the rows whose leading key is or is not NULL
+    listing = LISTINGS[name]
+    exprs = [expr for expr, _ in listing["keys"]]
+    # Walking backwards flips the sort; rows are reversed again after fetching
+    descending = listing.get("descending", False) != backward
+    predicates = [listing["where"]] if "where" in listing else []
+    predicates += [listing["filters"][key] for key in listing.get("filters", {}) if key in filter_names]
+    op = "<" if descending else ">"
+    if segment == "null":
+        predicates.append(f"{exprs[0]} IS NULL")
+        if cursor:
+            rest = exprs[1:]
+            predicates.append(f"({', '.join(rest)}) {op} ({', '.join('?' for _ in rest)})")
+    elif segment == "value" and not cursor:
+        predicates.append(f"{exprs[0]} IS NOT NULL")
+    elif cursor:
+        if len(exprs) > 1:
+            # The bound on the leading key lets SQLite seek instead of filtering
+            predicates.append(f"{exprs[0]} {op}= ?")
+            predicates.append(f"({', '.join(exprs)}) {op} ({', '.join('?' for _ in exprs)})")
+        else:
+            predicates.append(f"{exprs[0]} {op} ?")
+    sql = " ".join(listing["select"].split())
+    if predicates:
+        sql += " WHERE " + " AND ".join(predicates)
+    order = " DESC" if descending else ""
+    sql += " ORDER BY " + ", ".join(expr + order for expr in exprs)
+    return sql + " LIMIT ?"
+
+
+def listing_shapes(name):
+    # (cursor, backward, segment) of every query fetch_page may run for name
+    shapes = [(False, False, None)]
+    for backward in (False, True):
+        if len(LISTINGS[name]["keys"]) == 1:
+            shapes.append((True, backward, None))
+        else:
+            shapes += [(cursor, backward, segment) for cursor in (True, False) for segment in ("value", "null")]
+    return shapes
+
+
+def row_key(name, row):
+    return tuple(row[position] for _, position in LISTINGS[name]["keys"])
+
+
+def _segments(name, cursor, backward):
+    # (segment, cursor) of each query a page reads, in order
+    listing = LISTINGS[name]
+    if cursor is None or len(listing["keys"]) == 1:
+        return [(None, cursor)]
+    nulls_last = listing.get("descending", False) != backward
+    if cursor[0] is None:
+        return [("null", cursor)] if nulls_last else [("null", cursor), ("value", None)]
+    return [("value", cursor), ("null", None)] if nulls_last else [("value", cursor)]
+
+
+def fetch_page(name, cursor=None, backward=False, filters=None, page_size=PAGE_SIZE):
+    # filters: {filter name: value}; None values are ignored
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    available = LISTINGS[name].get("filters", {})
+    rows = []
+    for segment, bound in _segments(name, cursor, backward):
+        sql = listing_sql(name, filters, bound is not None, backward, segment)
+        params = [filters[key] for key in available if key in filters]
+        if bound is not None and segment == "null":
+            params += list(bound[1:])
+        elif bound is not None:
+            if len(bound) > 1:
+                params.append(bound[0])
+            params += list(bound)
+        rows += query(sql, params + [page_size + 1 - len(rows)])
+        if len(rows) > page_size:
+            break
+    more = len(rows) > page_size
+    if backward and not more:
+        # Walked back to the start: show a full first page instead of a short one
+        return fetch_page(name, None, False, filters, page_size)
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = cursor is not None, more
+    first_key = row_key(name, rows[0]) if rows else None
+    last_key = row_key(name, rows[-1]) if rows else None
+    return Page(rows, first_key, last_key, has_prev, has_next)
@@ -0,0 +1,131 @@
+# Query-plan regression check: seeds a large throwaway database, runs
+# EXPLAIN QUERY PLAN on every SQL literal the app issues and fails if a
+# filtered query falls back to a full table scan or a temp sort.
+#
+#   python query_plans.py [--rows 200000]
+
+import argparse
+import ast
+import itertools
+import os
+import sys
+import tempfile
+
+from archive import open_archive
+from database import open_connection
+from datagen import populate
+from migrations import migrate
+from fulltext import SCOPES, search_sql
+from identity import TIMELINE_SQL
+from pagination import LISTINGS, listing_shapes, listing_sql
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCES = ["app.py", "stats.py", "beds.py", "importer.py", "stock.py", "recommender.py", "summarizer.py", "dosage.py",
+           "archive.py", "occupancy.py", "live.py", "identity.py"]
+SQL_FUNCTIONS = {"query", "query_one", "query_value", "execute", "executemany", "stream", "_history", "_read"}
+
+# Plan steps inherent to the query itself rather than a missing index
+EXPECTED_SCANS = {
+    "ORDER BY rank": "relevance ranking sorts the full-text matches",
+    "GROUP BY m.item_id": "consumption groups a window of issues by item",
+    "FROM main.sqlite_master": "the archive copies table definitions from the schema catalogue",
+}
+
+
+def collect_statements(sources=SOURCES):
+    statements = []
+    for source in sources:
+        path = os.path.join(HERE, source)
+        with open(path) as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not node.args:
+                continue
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+            sql = node.args[0]
+            if name in SQL_FUNCTIONS and isinstance(sql, ast.Constant) and isinstance(sql.value, str):
+                statements.append((source, node.lineno, " ".join(sql.value.split())))
+    return sorted(statements)
+
+
+def listing_statements():
+    # Every shape of keyset page query: filter combinations x first/next/previous page
+    statements = []
+    for name, listing in LISTINGS.items():
+        filters = list(listing.get("filters", {}))
+        for count in range(len(filters) + 1):
+            for active in itertools.combinations(filters, count):
+                for cursor, backward, segment in listing_shapes(name):
+                    label = "+".join(active) or "all"
+                    step = ("prev" if backward else "next") if cursor or segment else "first"
+                    if segment:
+                        step += f"/{segment}" if cursor else f"/{segment}-start"
+                    statements.append(
+                        (f"pagination.{name}", f"{label}/{step}", listing_sql(name, active, cursor, backward, segment))
+                    )
+    return statements
+
+
+def search_statements():
+    return [("fulltext", scope, search_sql([scope])) for scope in SCOPES] + [("fulltext", "all", search_sql())]
+
+
+def identity_statements():
+    return [("identity", "timeline", " ".join(TIMELINE_SQL.split()))]
+
+
+def explain(conn, sql):
+    params = ("a",) * sql.count("?")
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def violations(sql, details):
+    problems = []
+    filtered = " WHERE " in sql.upper()
+    for detail in details:
+        if detail.startswith("SCAN") and filtered and "USING" not in detail and "VIRTUAL TABLE" not in detail:
+            problems.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+    if problems and any(snippet in sql for snippet in EXPECTED_SCANS):
+        return []
+    return problems
+
+
+def check(rows=200000, sources=SOURCES):
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.db")
+        conn = open_connection(path)
+        migrate(conn)
+        populate(conn, rows, beds=2000)
+        conn.close()
+        # With the archive attached, so the history views resolve too
+        conn = open_archive(path)
+        for source, lineno, sql in collect_statements(sources) + listing_statements() + search_statements() + identity_statements():
+            location = f"{source}:{lineno}"
+            if not sql.upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                continue
+            details = explain(conn, sql)
+            problems = violations(sql, details)
+            print(f"{'FAIL' if problems else 'ok  '} {location}: {sql[:90]}")
+            for detail in details:
+                print(f"       {detail}")
+            if problems:
+                failures.append((location, sql, problems))
+        conn.close()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if any app query falls back to a table scan.")
+    parser.add_argument("--rows", type=int, default=200000, help="visits/tests to seed")
+    args = parser.parse_args(argv)
+    failures = check(args.rows)
+    print(f"\n{len(failures)} query plan regression(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# Symptom-to-medicine recommendations. Rules and synonyms live in SymptomRules
+# and SymptomSynonyms and are compiled into a token trie, so multi-word
+# symptoms are found in one left-to-right pass over a note.
+
+import re
+import time
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+import pandas as pd
+
+from cache import query, query_one
+from codes import day
+from database import stream, write
+from fulltext import build_match
+
+# Distinct note texts remembered per compiled matcher; visit notes repeat a lot
+MEMO_SIZE = 4096
+BATCH_SIZE = 10000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+BatchResult = namedtuple("BatchResult", ["visits", "matched", "symptoms", "medicines", "seconds"])
+
+
+def normalize(phrase):
+    return " ".join(_TOKEN.findall(phrase.lower()))
+
+
+class Matcher:
+    # phrases: phrase -> canonical symptom; rules: symptom -> medicines
+
+    def __init__(self, phrases, rules):
+        self.rules = rules
+        self.trie = {}
+        for phrase, symptom in phrases.items():
+            node = self.trie
+            for token in phrase.split():
+                node = node.setdefault(token, {})
+            # None never collides with a token, so it marks where a phrase ends
+            node[None] = symptom
+        self.symptoms = lru_cache(maxsize=MEMO_SIZE)(self._symptoms)
+
+    def _symptoms(self, text):
+        # Leftmost-longest: at each token the longest phrase wins and the scan
+        # resumes after it, so "sore throat" is not also read as "throat"
+        words = _TOKEN.findall(text.lower())
+        found = []
+        i = 0
+        while i < len(words):
+            node, match = self.trie, None
+            for j in range(i, len(words)):
+                node = node.get(words[j])
+                if node is None:
+                    break
+                if None in node:
+                    match = (node[None], j + 1)
+            if match is None:
+                i += 1
+                continue
+            if match[0] not in found:
+                found.append(match[0])
+            i = match[1]
+        return tuple(found)
+
+    def medicines(self, symptoms):
+        # medicine -> the symptoms that suggested it
+        medicines = {}
+        for symptom in symptoms:
+            for medicine in self.rules.get(symptom, ()):
+                medicines.setdefault(medicine, []).append(symptom)
+        return medicines
+
+
+_compiled = None
+
+
+def matcher():
+    # Recompiled only when the rule tables change; the reads come from the query cache
+    global _compiled
+    rows = (
+        query("SELECT symptom, medicine FROM SymptomRules ORDER BY symptom, medicine"),
+        query("SELECT phrase, symptom FROM SymptomSynonyms ORDER BY phrase"),
+    )
+    compiled = _compiled
+    if compiled is None or compiled[0] != rows:
+        rules, phrases = {}, {}
+        for symptom, medicine in rows[0]:
+            rules.setdefault(normalize(symptom), []).append(medicine)
+        for phrase, symptom in rows[1]:
+            phrases[normalize(phrase)] = normalize(symptom)
+        phrases.update((symptom, symptom) for symptom in rules)
+        compiled = _compiled = (rows, Matcher(phrases, rules))
+    return compiled[1]
+
+
+def recommend(text):
+    compiled = matcher()
+    return compiled.medicines(compiled.symptoms(text))
+
+
+def recommend_batch(start, end, batch_size=BATCH_SIZE, progress=None):
+    # Streams the notes of every visit in [start, end] and tallies symptoms and
+    # recommended medicines per visit; only the counters are kept in memory
+    started = time.perf_counter()
+    compiled = matcher()
+    visits = matched = 0
+    symptoms, medicines = Counter(), Counter()
+    for batch in stream(
+        "SELECT notes FROM PatientInflow WHERE visit_date BETWEEN ? AND ?", (day(start), day(end)), batch_size
+    ):
+        for (notes,) in batch:
+            found = compiled.symptoms(notes or "")
+            if found:
+                matched += 1
+                symptoms.update(found)
+                medicines.update(compiled.medicines(found).keys())
+        visits += len(batch)
+        if progress:
+            progress(visits, matched)
+    return BatchResult(visits, matched, symptoms, medicines, time.perf_counter() - started)
+
+
+def stock_check(medicines):
+    # Current stock for each medicine, matching inventory items through the search index
+    rows = []
+    for medicine in medicines:
+        match = build_match(f'"{medicine}"')
+        items, quantity, low = query_one("""
+            SELECT COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity <= reorder_level), 0)
+            FROM Inventory
+            WHERE item_id IN (SELECT rowid FROM InventoryFTS WHERE InventoryFTS MATCH ?)
+        """, (match,)) if match else (0, 0, 0)
+        if not items:
+            status = "Not stocked"
+        elif not quantity:
+            status = "Out of stock"
+        elif low:
+            status = "Low"
+        else:
+            status = "Available"
+        rows.append((medicine, items, quantity, status))
+    return pd.DataFrame(rows, columns=["Medicine", "Items", "In Stock", "Status"])
+
+
+def save_rules(rules, synonyms):
+    # Replaces both tables in one transaction; blank rows (None or NaN from the
+    # editor) and duplicates are dropped
+    rules = sorted({
+        (normalize(symptom), medicine.strip()) for symptom, medicine in rules
+        if isinstance(symptom, str) and isinstance(medicine, str) and normalize(symptom) and medicine.strip()
+    })
+    synonyms = {
+        normalize(phrase): normalize(symptom) for phrase, symptom in synonyms
+        if isinstance(phrase, str) and isinstance(symptom, str) and normalize(phrase) and normalize(symptom)
+    }
+
+    def run(conn):
+        conn.execute("DELETE FROM SymptomRules")
+        conn.execute("DELETE FROM SymptomSynonyms")
+        conn.executemany("INSERT INTO SymptomRules (symptom, medicine) VALUES (?, ?)", rules)
+        conn.executemany("INSERT INTO SymptomSynonyms (phrase, symptom) VALUES (?, ?)", sorted(synonyms.items()))
+    write(run)
+    return len(rules), len(synonyms)
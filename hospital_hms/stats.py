@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+import pandas as pd
+
+from cache import query
+from codes import day, frame
+
+# Dashboard periods: label -> number of days ending at the selected date
+PERIODS = {
+    "Day": 1,
+    "Week": 7,
+    "Month": 30,
+    "Year": 365,
+}
+
+ROLLUP_COLUMNS = ["stat_date", "department", "test_type", "admissions", "visits", "tests"]
+ROLLUP_TYPES = {"stat_date": "day", "department": "Departments", "test_type": "TestTypes"}
+
+
+def period_bounds(end_date, period):
+    start_date = end_date - timedelta(days=PERIODS[period] - 1)
+    return start_date, end_date
+
+
+def load_rollup(start_date, end_date):
+    # One range scan over the DailyStats primary key; cost grows with days, not rows
+    rows = query("""
+        SELECT stat_date, department, test_type, admissions, visits, tests
+        FROM DailyStats
+        WHERE stat_date BETWEEN ? AND ?
+    """, (day(start_date), day(end_date)))
+    return frame(rows, ROLLUP_COLUMNS, ROLLUP_TYPES)
+
+
+def daily_trend(rollup, start_date, end_date):
+    days = pd.date_range(start_date, end_date, freq="D")
+    trend = rollup.groupby("stat_date")[["admissions", "visits", "tests"]].sum()
+    trend = trend.reindex(days, fill_value=0)
+    trend.index.name = "date"
+    return trend
+
+
+def totals(rollup):
+    return {column: int(rollup[column].sum()) for column in ("admissions", "visits", "tests")}
+
+
+def tests_by_type(rollup):
+    return rollup.groupby("test_type", observed=True)["tests"].sum()
+
+
+def visits_by_department(rollup):
+    return rollup.groupby("department", observed=True)["visits"].sum().sort_values(ascending=False)
@@ -0,0 +1,131 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from cache import query
+from database import write
+
+# Movement kinds and the sign their quantity is stored with
+KINDS = {
+    "receipt": 1,
+    "issue": -1,
+    "adjustment": 0,  # signed as entered
+}
+# Days of issues the consumption rate is averaged over
+RATE_WINDOWS = [7, 30, 90]
+LOW_STOCK_LIMIT = 50
+
+Movement = namedtuple("Movement", ["item_id", "kind", "quantity", "note"], defaults=[None])
+
+
+class StockError(Exception):
+    pass
+
+
+def signed(kind, quantity):
+    if kind not in KINDS:
+        raise StockError(f"Unknown movement kind {kind!r}")
+    if KINDS[kind] and quantity < 0:
+        raise StockError(f"{kind.title()} quantities must be positive")
+    return quantity * KINDS[kind] if KINDS[kind] else quantity
+
+
+def _apply(conn, movements):
+    # Ledger rows and the resulting per-item deltas commit together. Deltas are
+    # summed per item so a batch touches each Inventory row once, and applied as
+    # quantity = quantity + ? so concurrent movements never overwrite each other.
+    moved_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+    rows, deltas = [], {}
+    for movement in movements:
+        delta = signed(movement.kind, movement.quantity)
+        rows.append((movement.item_id, movement.kind, delta, moved_at, movement.note))
+        deltas[movement.item_id] = deltas.get(movement.item_id, 0) + delta
+    conn.executemany(
+        "INSERT INTO StockMovements (item_id, kind, quantity, moved_at, note) VALUES (?, ?, ?, ?, ?)", rows
+    )
+    for item_id, delta in sorted(deltas.items()):
+        updated = conn.execute(
+            "UPDATE Inventory SET quantity = quantity + ? WHERE item_id = ? AND quantity + ? >= 0",
+            (delta, item_id, delta)
+        ).rowcount
+        if not updated:
+            name = conn.execute("SELECT item_name FROM Inventory WHERE item_id = ?", (item_id,)).fetchone()
+            if name is None:
+                raise StockError(f"Item ID {item_id} does not exist.")
+            raise StockError(f"Not enough {name[0]} in stock for this movement.")
+    return len(rows)
+
+
+def record(movements):
+    # Applies a batch of Movement tuples atomically; nothing is applied if any fails
+    movements = list(movements)
+    if not movements:
+        return 0
+    return write(lambda conn: _apply(conn, movements))
+
+
+def add_item(name, quantity, unit, reorder_level=0):
+    # The starting quantity goes in as a receipt so the ledger explains every unit
+    def run(conn):
+        item_id = conn.execute(
+            "INSERT INTO Inventory (item_name, quantity, unit, reorder_level) VALUES (?, 0, ?, ?)",
+            (name, unit, reorder_level)
+        ).lastrowid
+        if quantity:
+            _apply(conn, [Movement(item_id, "receipt", quantity, "initial stock")])
+        return item_id
+    return write(run)
+
+
+def update_item(item_id, name, unit, reorder_level):
+    # Quantity only changes through movements
+    write(lambda conn: conn.execute(
+        "UPDATE Inventory SET item_name = ?, unit = ?, reorder_level = ? WHERE item_id = ?",
+        (name, unit, reorder_level, item_id)
+    ))
+
+
+def delete_item(item_id):
+    def run(conn):
+        conn.execute("DELETE FROM StockMovements WHERE item_id = ?", (item_id,))
+        conn.execute("DELETE FROM Inventory WHERE item_id = ?", (item_id,))
+    write(run)
+
+
+def low_stock(limit=LOW_STOCK_LIMIT):
+    # Served by the partial index idx_inventory_low_stock and the query cache
+    return query("""
+        SELECT item_id, item_name, quantity, reorder_level, unit
+        FROM Inventory
+        WHERE quantity <= reorder_level
+        ORDER BY item_id
+        LIMIT ?
+    """, (limit,))
+
+
+def movements_for(item_id, limit=20):
+    return query("""
+        SELECT moved_at, kind, quantity, note
+        FROM StockMovements
+        WHERE item_id = ?
+        ORDER BY moved_at DESC
+        LIMIT ?
+    """, (item_id, limit))
+
+
+def consumption(days, today=None):
+    # Units issued per item over the window, from the ledger's (kind, moved_at) index
+    today = today or date.today()
+    since = (today - timedelta(days=days - 1)).isoformat()
+    rows = query("""
+        SELECT m.item_id, i.item_name, i.quantity, i.unit, -SUM(m.quantity)
+        FROM StockMovements m
+        JOIN Inventory i ON i.item_id = m.item_id
+        WHERE m.kind = 'issue' AND m.moved_at >= ?
+        GROUP BY m.item_id
+    """, (since,))
+    df = pd.DataFrame(rows, columns=["ID", "Item", "In Stock", "Unit", "Issued"])
+    df["Per Day"] = (df["Issued"] / days).round(1)
+    df["Days Left"] = (df["In Stock"] * days / df["Issued"]).where(df["Issued"] > 0).round(1)
+    return df.sort_values("Per Day", ascending=False, ignore_index=True)
@@ -0,0 +1,159 @@
+# Doctor-note summaries: keeps the sentences that carry dosing instructions.
+# Results are stored in NoteSummaries keyed by a hash of the text, so a note is
+# summarised once and the app only ever looks summaries up.
+#
+#   python summarizer.py [--sources visits tests] [--workers 4]
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from database import DEFAULT_FACILITY, FACILITIES, init_db, query, stream, use_facility, write
+
+# Bump when the summarising logic or keywords change; old entries then miss
+VERSION = 1
+KEYWORDS = ["twice", "daily", "week", "quantity", "overdose", "tablet", "syrup"]
+# Columns summarised in bulk
+SOURCES = {
+    "visits": "SELECT notes FROM PatientInflow",
+    "tests": "SELECT result FROM PatientTests",
+}
+# Common abbreviations whose trailing period does not end a sentence
+ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "st", "no", "vs", "approx", "tab", "tabs", "cap", "inj", "e.g", "i.e", "etc"}
+BATCH_SIZE = 20000
+CHUNK_SIZE = 1000
+# Backfills with fewer new texts than this are summarised in-process
+PARALLEL_THRESHOLD = 5000
+# Hashes per lookup statement
+LOOKUP_CHUNK = 500
+
+# Keywords match at the start of a word, so "tablets" and "weekly" count
+_KEYWORD = re.compile(r"\b(?:" + "|".join(map(re.escape, KEYWORDS)) + ")", re.IGNORECASE)
+# A run of terminators followed by whitespace, or a line break; "2.5 mg" is left alone
+_BOUNDARY = re.compile(r"[.!?]+(?=\s)|\n+")
+_LAST_WORD = re.compile(r"([\w.]+)$")
+
+
+def content_hash(text):
+    return hashlib.blake2b(f"{VERSION}\0{text}".encode(), digest_size=16).hexdigest()
+
+
+def sentences(text):
+    found, start = [], 0
+    for boundary in _BOUNDARY.finditer(text):
+        if boundary.group().startswith("."):
+            word = _LAST_WORD.search(text, start, boundary.start())
+            if word and word.group(1).lower() in ABBREVIATIONS:
+                continue
+        sentence = text[start:boundary.end()].strip()
+        if sentence:
+            found.append(sentence)
+        start = boundary.end()
+    tail = text[start:].strip()
+    if tail:
+        found.append(tail)
+    return found
+
+
+def summarize(text):
+    return " ".join(sentence for sentence in sentences(text) if _KEYWORD.search(sentence))
+
+
+def summarize_many(texts):
+    # Process-pool entry point
+    return [summarize(text) for text in texts]
+
+
+def _lookup(hashes):
+    found = {}
+    for i in range(0, len(hashes), LOOKUP_CHUNK):
+        chunk = hashes[i:i + LOOKUP_CHUNK]
+        found.update(query(
+            f"SELECT content_hash, summary FROM NoteSummaries WHERE content_hash IN ({', '.join('?' * len(chunk))})",
+            chunk
+        ))
+    return found
+
+
+def _store(rows):
+    if rows:
+        write(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO NoteSummaries (content_hash, summary) VALUES (?, ?)", rows
+        ))
+
+
+def summaries(texts):
+    # text -> summary for each distinct text, summarising and storing only the misses
+    texts = list({text for text in texts if text})
+    hashes = [content_hash(text) for text in texts]
+    stored = _lookup(hashes)
+    result, missing = {}, []
+    for text, key in zip(texts, hashes):
+        if key in stored:
+            result[text] = stored[key]
+        else:
+            result[text] = summarize(text)
+            missing.append((key, result[text]))
+    _store(missing)
+    return result
+
+
+def summary_for(text):
+    return summaries([text]).get(text, "")
+
+
+def backfill(sources=None, workers=None, batch_size=BATCH_SIZE, progress=None):
+    # Summarises every stored note not yet in NoteSummaries. Rows are streamed in
+    # batches; new distinct texts in a large batch are spread over a process pool.
+    # Returns (rows read, summaries added).
+    workers = workers or os.cpu_count() or 1
+    read = added = 0
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        for source in sources or SOURCES:
+            for batch in stream(SOURCES[source], (), batch_size):
+                read += len(batch)
+                pending = {content_hash(text): text for (text,) in batch if text}
+                for key in _lookup(list(pending)):
+                    del pending[key]
+                keys, texts = list(pending), list(pending.values())
+                if pool is not None and len(texts) >= PARALLEL_THRESHOLD:
+                    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+                    results = [summary for chunk in pool.map(summarize_many, chunks) for summary in chunk]
+                else:
+                    results = summarize_many(texts)
+                _store(list(zip(keys, results)))
+                added += len(keys)
+                if progress:
+                    progress(read, added)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return read, added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute note summaries into NoteSummaries.")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count; 1 disables the pool)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--facility", choices=list(FACILITIES), default=DEFAULT_FACILITY)
+    args = parser.parse_args(argv)
+
+    use_facility(args.facility)
+    init_db()
+    started = time.perf_counter()
+    read, added = backfill(
+        args.sources, args.workers, args.batch_size,
+        progress=lambda done, new: print(f"  {done} rows, {new} new summaries ...", file=sys.stderr),
+    )
+    print(f"{read} rows read, {added} summaries added in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+
+import database
+import metrics
+
+# Jobs folded into one commit at most; the queue is drained without waiting, so
+# batches only grow while the previous commit is in flight
+MAX_BATCH = 256
+
+_STOP = object()
+
+
+class WriteCoordinator:
+    # One thread owns the write connection to a shard. Sessions submit fn(conn)
+    # jobs; each drained batch runs in a single transaction with a savepoint per
+    # job, so a failing job is rolled back alone. Futures resolve after the commit.
+
+    def __init__(self, path, max_batch=MAX_BATCH):
+        self.path = path
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._conn = None
+        self.batches = self.jobs = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"db-writer {self.path}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        # Finishes queued jobs first
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def submit(self, fn):
+        future = Future()
+        self._queue.put((fn, future, metrics.current_page()))
+        return future
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = database.open_connection(self.path)
+        return self._conn
+
+    def _drain(self, first):
+        batch, stopping = [first], False
+        while len(batch) < self.max_batch:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                stopping = True
+                break
+            batch.append(job)
+        return batch, stopping
+
+    def _commit(self, batch):
+        outcomes = []
+        raw = self._connection()
+        try:
+            with database.transaction(raw) as conn:
+                for fn, future, page in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    # Statements are attributed to the page that submitted the job
+                    metrics.tag_page(page)
+                    raw.execute("SAVEPOINT job")
+                    try:
+                        result = fn(conn)
+                    except Exception as e:
+                        raw.execute("ROLLBACK TO job")
+                        outcomes.append((future, None, e))
+                    else:
+                        outcomes.append((future, result, None))
+                    raw.execute("RELEASE job")
+        except BaseException as e:
+            # The commit itself failed: nothing in the batch was applied
+            for fn, future, page in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            metrics.tag_page(None)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _run(self):
+        # Jobs see this shard as the current database (bed index, cache lookups)
+        with database.at(self.path):
+            while True:
+                job = self._queue.get()
+                if job is _STOP:
+                    return
+                batch, stopping = self._drain(job)
+                self._commit(batch)
+                self.batches += 1
+                self.jobs += len(batch)
+                if stopping:
+                    return
+
+
+class ShardWriters:
+    # One coordinator per shard, started on its first write, so facilities never
+    # share a write queue or a write lock
+
+    def __init__(self, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._coordinators = {}
+
+    def coordinator(self, path=None):
+        path = path or database.database_path()
+        coordinator = self._coordinators.get(path)
+        if coordinator is None:
+            with self._lock:
+                coordinator = self._coordinators.get(path)
+                if coordinator is None:
+                    coordinator = self._coordinators[path] = WriteCoordinator(path, self.max_batch).start()
+        return coordinator
+
+    def submit(self, fn):
+        return self.coordinator().submit(fn)
+
+    def stop(self):
+        with self._lock:
+            coordinators, self._coordinators = self._coordinators, {}
+        for coordinator in coordinators.values():
+            coordinator.stop()
+
+    @property
+    def batches(self):
+        return sum(coordinator.batches for coordinator in list(self._coordinators.values()))
+
+    @property
+    def jobs(self):
+        return sum(coordinator.jobs for coordinator in list(self._coordinators.values()))
+
+
+_lock = threading.Lock()
+writers = None
+
+
+def start():
+    # Idempotent: Streamlit re-runs app.py on every interaction
+    global writers
+    with _lock:
+        if writers is None:
+            writers = ShardWriters()
+            database.use_writer(writers)
+            atexit.register(stop)
+    return writers
+
+
+def stop():
+    global writers
+    with _lock:
+        if writers is not None:
+            database.use_writer(None)
+            writers.stop()
+            writers = None